@@ -0,0 +1,32 @@
+import atexit
+import shutil
+import tempfile
+
+from django.conf import global_settings
+
+from tests.settings import *  # noqa
+
+# Measure the password hashers used in production instead of the fast ones used by tests
+PASSWORD_HASHERS = global_settings.PASSWORD_HASHERS
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
+
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
+
+XAUTH_KEYS_DIR = tempfile.mkdtemp(prefix="xauth-benchmark-keys-")
+atexit.register(shutil.rmtree, XAUTH_KEYS_DIR, ignore_errors=True)
+
+# Operations are repeated far more often than the throttles allow
+XAUTH_THROTTLE_RATES = {
+    "verification_code_user": None,
+    "verification_code_ip": None,
+    "temporary_password_lookup": None,
+    "temporary_password_ip": None,
+    "verification_attempt": None,
+    "password_reset_attempt": None,
+}
@@ -0,0 +1,69 @@
+"""
+Compare the signing and verification throughput of the signing algorithms supported by `TokenKey`.
+
+Usage: `python benchmarks/signing_algorithms.py [--number NUMBER] [--repeat REPEAT]`
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from jwcrypto import jwt  # noqa: E402
+
+from xauth.accounts.token.key import TokenKey  # noqa: E402
+
+CLAIMS = {"nbf": 1700000000, "exp": 1700086400, "iat": 1700000000, "sub": "access", "payload": {"id": "1:signature"}}
+
+
+def sign(key, algorithm):
+    token = jwt.JWT(header={"alg": algorithm, "typ": "JWT"}, claims=CLAIMS)
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+def verify(key, token):
+    jwt.JWT(jwt=token, key=key, check_claims=False)
+
+
+def measure(statement, number, repeat):
+    """Return the best throughput (operations per second) out of `repeat` runs of `number` operations each"""
+    return number / min(timeit.repeat(statement, number=number, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200, help="operations per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement; the best run is reported")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as keys_dir, mock.patch("xauth.accounts.token.stores.KEYS_DIR", keys_dir):
+        for algorithm in TokenKey.ALLOWED_SIGNING_ALGORITHMS:
+            key = TokenKey(signing_algorithm=algorithm).get_jwt_signing_keys()[0]
+            token = sign(key, algorithm)
+            rows.append(
+                (
+                    algorithm,
+                    measure(lambda: sign(key, algorithm), args.number, args.repeat),
+                    measure(lambda: verify(key, token), args.number, args.repeat),
+                )
+            )
+
+    print("| Algorithm | Sign (ops/sec) | Verify (ops/sec) |")
+    print("|-----------|---------------:|-----------------:|")
+    for algorithm, sign_throughput, verify_throughput in rows:
+        print(f"| {algorithm} | {sign_throughput:,.0f} | {verify_throughput:,.0f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Benchmark token issuance, token verification and the authentication request path.
+
+Usage: `python benchmarks/suite.py [--filter PATTERN] [--output FILE] [--compare FILE]`
+
+Every benchmark reports its throughput (operations per second), latency percentiles (p50/p95/p99 in milliseconds) and
+the peak memory allocated by a single operation. Results can be saved (`--output`) as JSON and compared against results
+saved from another commit (`--compare`).
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.reverse import reverse  # noqa: E402
+from rest_framework.test import APIClient, APIRequestFactory  # noqa: E402
+
+from xauth.accounts.token.generator import Token  # noqa: E402
+from xauth.accounts.token.key import TokenKey  # noqa: E402
+from xauth.authentication import JWTAuthentication  # noqa: E402
+
+PASSWORD = "PVs5w()r9!"
+
+BENCHMARKS = {}
+
+
+def benchmark(name, iterations=200):
+    """
+    Register a benchmark. The decorated function is called once to set the benchmark up and must return the
+    operation to measure: a callable that takes the value returned by calling its (optional) `setup` attribute, which
+    is called before (and not measured with) every operation.
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = (func, iterations)
+        return func
+
+    return decorator
+
+
+def _with_setup(operation, setup):
+    operation.setup = setup
+    return operation
+
+
+def _expect(response, status_code):
+    """Fail the run when an endpoint does not respond as measured e.g. because it was throttled"""
+    if response.status_code != status_code:
+        raise AssertionError(f"Expected status {status_code}, got {response.status_code}: {response.content[:200]!r}")
+    return response
+
+
+def _percentile(timings, percent):
+    return statistics.quantiles(timings, n=100, method="inclusive")[percent - 1]
+
+
+def run(name, make_operation, iterations, warmup):
+    operation = make_operation()
+    setup = getattr(operation, "setup", lambda: None)
+
+    for _ in range(warmup):
+        operation(setup())
+
+    timings = []
+    for _ in range(iterations):
+        argument = setup()
+        start = time.perf_counter_ns()
+        operation(argument)
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+
+    allocations = []
+    for _ in range(min(iterations, 10)):
+        argument = setup()
+        tracemalloc.start()
+        operation(argument)
+        allocations.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        "iterations": iterations,
+        "ops_per_sec": 1000 * iterations / sum(timings),
+        "p50_ms": _percentile(timings, 50),
+        "p95_ms": _percentile(timings, 95),
+        "p99_ms": _percentile(timings, 99),
+        "alloc_peak_bytes": int(statistics.median(allocations)),
+    }
+
+
+def _make_token(signing_algorithm=None, encryption_algorithm=None):
+    token = Token({"id": get_user_model()._default_manager.first().signed_id})
+    token.signing_algorithm = signing_algorithm or token.signing_algorithm
+    token.encryption_algorithm = encryption_algorithm or token.encryption_algorithm
+    return token
+
+
+for _signing_algorithm in TokenKey.ALLOWED_SIGNING_ALGORITHMS:
+
+    @benchmark(f"token.signing_keys[{_signing_algorithm}]", iterations=2000)
+    def _signing_keys(signing_algorithm=_signing_algorithm):
+        token_key = TokenKey(signing_algorithm=signing_algorithm)
+        return lambda _: token_key.get_jwt_signing_keys()
+
+    @benchmark(f"token.refresh[{_signing_algorithm}]")
+    def _refresh(signing_algorithm=_signing_algorithm):
+        token = _make_token(signing_algorithm)
+        return lambda _: token.refresh()
+
+    @benchmark(f"token.get_claims[{_signing_algorithm}]")
+    def _get_claims(signing_algorithm=_signing_algorithm):
+        token = _make_token(signing_algorithm)
+        encrypted = token.encrypted
+        return lambda _: token.get_claims(encrypted, is_encrypted=True)
+
+
+for _encryption_algorithm in TokenKey.ALLOWED_ENCRYPTION_ALGORITHMS:
+
+    @benchmark(f"token.refresh[{_encryption_algorithm}]")
+    def _refresh_encrypted(encryption_algorithm=_encryption_algorithm):
+        token = _make_token(encryption_algorithm=encryption_algorithm)
+        return lambda _: token.refresh()
+
+    @benchmark(f"token.get_claims[{_encryption_algorithm}]")
+    def _get_decrypted_claims(encryption_algorithm=_encryption_algorithm):
+        token = _make_token(encryption_algorithm=encryption_algorithm)
+        encrypted = token.encrypted
+        return lambda _: token.get_claims(encrypted, is_encrypted=True)
+
+
+@benchmark("authentication.jwt")
+def _jwt_authentication():
+    user = get_user_model()._default_manager.first()
+    request = APIRequestFactory().get(
+        reverse("user-detail", kwargs={"pk": user.pk}),
+        HTTP_AUTHORIZATION=f"Bearer {user.token.encrypted}",
+    )
+    return lambda _: JWTAuthentication().authenticate(Request(request))
+
+
+@benchmark("endpoint.signup", iterations=50)
+def _signup():
+    client, emails = APIClient(), (f"signup{i}@example.com" for i in count())
+    return lambda _: _expect(
+        client.post(reverse("user-signup"), data={"email": next(emails), "password": PASSWORD}), 201
+    )
+
+
+@benchmark("endpoint.signin", iterations=50)
+def _signin():
+    user = get_user_model()._default_manager.first()
+    credentials = base64.b64encode(f"{user.email}:{PASSWORD}".encode()).decode()
+    client = APIClient()
+    return lambda _: _expect(client.post(reverse("user-signin"), HTTP_AUTHORIZATION=f"Basic {credentials}"), 200)
+
+
+@benchmark("endpoint.verify_account", iterations=50)
+def _verify_account():
+    user = get_user_model()._default_manager.first()
+    client = APIClient()
+
+    def setup():
+        user.is_verified = False
+        user.save(update_fields=["is_verified"])
+        return user.request_verification(), user.token.encrypted
+
+    def operation(argument):
+        code, token = argument
+        response = client.post(
+            reverse("user-verify-account", kwargs={"pk": user.pk}),
+            data={"code": code},
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        _expect(response, 200)
+
+    return _with_setup(operation, setup)
+
+
+@benchmark("endpoint.reset_password", iterations=50)
+def _reset_password():
+    user = get_user_model()._default_manager.first()
+    client = APIClient()
+
+    def setup():
+        temporary_password = user.request_password_reset()
+        token = user.token.encrypted
+        user.unflag_password_reset()
+        return temporary_password, token
+
+    def operation(argument):
+        temporary_password, token = argument
+        response = client.post(
+            reverse("user-reset-password", kwargs={"pk": user.pk}),
+            data={"old_password": temporary_password, "new_password": PASSWORD},
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        _expect(response, 200)
+
+    return _with_setup(operation, setup)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_results(results, baseline=None):
+    baseline = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    columns = ["ops/sec", "p50 ms", "p95 ms", "p99 ms", "alloc KiB"]
+    if baseline:
+        columns.append("ops/sec change")
+    print(f"{'benchmark':<36}" + "".join(f"{column:>16}" for column in columns))
+    for result in results:
+        row = [
+            f"{result['ops_per_sec']:,.1f}",
+            f"{result['p50_ms']:.3f}",
+            f"{result['p95_ms']:.3f}",
+            f"{result['p99_ms']:.3f}",
+            f"{result['alloc_peak_bytes'] / 1024:,.1f}",
+        ]
+        if baseline:
+            previous = baseline.get(result["name"])
+            change = "" if previous is None else f"{result['ops_per_sec'] / previous['ops_per_sec'] - 1:+.1%}"
+            row.append(change)
+        print(f"{result['name']:<36}" + "".join(f"{value:>16}" for value in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains FILTER")
+    parser.add_argument("--iterations", type=float, default=1, help="multiplier of each benchmark's iterations")
+    parser.add_argument("--warmup", type=int, default=5, help="operations run before measuring")
+    parser.add_argument("--output", help="save the results as JSON to OUTPUT")
+    parser.add_argument("--compare", help="compare the results with results previously saved with --output")
+    args = parser.parse_args()
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    get_user_model().objects.create_user(email="user@example.com", password=PASSWORD, is_verified=True)
+
+    results = []
+    for name, (make_operation, iterations) in BENCHMARKS.items():
+        if args.filter in name:
+            results.append(run(name, make_operation, max(int(iterations * args.iterations), 2), args.warmup))
+
+    report = {
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    _print_results(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
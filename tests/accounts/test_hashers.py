@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.test import SimpleTestCase, override_settings
+
+from xauth.accounts.hashers import HMACSecretHasher, PasswordSecretHasher, SecretHasher, acheck_secret, check_secret
+
+
+class ReversingSecretHasher(SecretHasher):
+    algorithm = "reversed"
+
+    def encode(self, secret):
+        return f"{self.algorithm}${secret[::-1]}"
+
+    def verify(self, secret, encoded):
+        return encoded == self.encode(secret)
+
+
+class TestHMACSecretHasher(SimpleTestCase):
+    def setUp(self):
+        self.hasher = HMACSecretHasher()
+
+    def test_verify(self):
+        encoded = self.hasher.encode("123456")
+
+        self.assertTrue(encoded.startswith("xauth_hmac_sha256$"))
+        self.assertNotIn("123456", encoded)
+        self.assertTrue(self.hasher.verify("123456", encoded))
+        self.assertFalse(self.hasher.verify("654321", encoded))
+        self.assertFalse(self.hasher.verify(None, encoded))
+        self.assertFalse(self.hasher.verify("123456", None))
+
+    def test_encoded_secrets_are_salted(self):
+        self.assertNotEqual(self.hasher.encode("123456"), self.hasher.encode("123456"))
+
+    def test_secrets_hashed_with_a_fallback_key_are_verified(self):
+        encoded = self.hasher.encode("123456")
+
+        with override_settings(SECRET_KEY="new-secret-key", SECRET_KEY_FALLBACKS=[]):
+            self.assertFalse(self.hasher.verify("123456", encoded))
+        with override_settings(SECRET_KEY="new-secret-key", SECRET_KEY_FALLBACKS=[settings.SECRET_KEY]):
+            self.assertTrue(self.hasher.verify("123456", encoded))
+
+
+class TestCheckSecret(SimpleTestCase):
+    def test_secrets_of_every_hasher_are_checked(self):
+        for hasher in [HMACSecretHasher(), PasswordSecretHasher()]:
+            with self.subTest(hasher=hasher.__class__.__name__):
+                encoded = hasher.encode("Pa55word")
+                self.assertTrue(check_secret("Pa55word", encoded))
+                self.assertFalse(check_secret("password", encoded))
+
+    def test_password_hashes_are_checked(self):
+        self.assertTrue(check_secret("123456", make_password("123456")))
+        self.assertFalse(check_secret("123456", None))
+
+    def test_secrets_of_the_configured_hasher_are_checked(self):
+        hasher = ReversingSecretHasher()
+        encoded = hasher.encode("123456")
+
+        with mock.patch("xauth.accounts.hashers._secret_hasher", hasher):
+            self.assertTrue(check_secret("123456", encoded))
+            self.assertFalse(check_secret("654321", encoded))
+            self.assertTrue(check_secret("123456", HMACSecretHasher().encode("123456")))
+
+    async def test_secrets_of_the_configured_hasher_are_checked_asynchronously(self):
+        hasher = ReversingSecretHasher()
+
+        with mock.patch("xauth.accounts.hashers._secret_hasher", hasher):
+            self.assertTrue(await acheck_secret("123456", hasher.encode("123456")))
+            self.assertFalse(await acheck_secret("654321", hasher.encode("123456")))
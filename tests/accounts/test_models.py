@@ -0,0 +1,265 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.signals import request_started, request_finished
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import translation
+
+from tests.factories import UserFactory, SecurityQuestionFactory
+from xauth.accounts.hashers import PasswordSecretHasher
+from xauth.cache import ModelInstanceCache
+from xauth.mail import SyncEmailDelivery
+
+
+class TestUserCache(TestCase):
+    def setUp(self):
+        self.user_cache = ModelInstanceCache("default", key_prefix="test:user")
+        patcher = mock.patch("xauth.accounts.abstract_models.user_cache", self.user_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.user_cache.cache.clear)
+        self.addCleanup(request_started.disconnect, self.user_cache._start_local_cache)
+        self.addCleanup(request_finished.disconnect, self.user_cache._clear_local_cache)
+        self.user = UserFactory()
+
+    def test_from_signed_id_reads_through_cache(self):
+        with self.assertNumQueries(1):
+            self.user.__class__.from_signed_id(self.user.signed_id)
+        with self.assertNumQueries(0):
+            user = self.user.__class__.from_signed_id(self.user.signed_id)
+
+        self.assertEqual(user, self.user)
+        self.assertEqual(self.user_cache.stats, {"local_hits": 0, "hits": 1, "misses": 1})
+
+    def test_saving_user_invalidates_cached_user(self):
+        self.user.__class__.from_signed_id(self.user.signed_id)
+        self.user.is_verified = True
+        self.user.save(update_fields=["is_verified"])
+
+        self.assertTrue(self.user.__class__.from_signed_id(self.user.signed_id).is_verified)
+        self.assertEqual(self.user_cache.misses, 2)
+
+    def test_deleting_user_invalidates_cached_user(self):
+        self.user.__class__.from_signed_id(self.user.signed_id)
+        signed_id = self.user.signed_id
+        self.user.delete()
+
+        with self.assertRaises(self.user.__class__.DoesNotExist):
+            self.user.__class__.from_signed_id(signed_id)
+
+    def test_users_are_cached_locally_for_the_duration_of_a_request(self):
+        request_started.send(sender=None)
+        first = self.user.__class__.from_signed_id(self.user.signed_id)
+        second = self.user.__class__.from_signed_id(self.user.signed_id)
+        request_finished.send(sender=None)
+        third = self.user.__class__.from_signed_id(self.user.signed_id)
+
+        self.assertIs(first, second)
+        self.assertIsNot(second, third)
+        self.assertEqual(self.user_cache.stats, {"local_hits": 1, "hits": 1, "misses": 1})
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class TestEmailOutbox(TestCase):
+    def setUp(self):
+        patcher = mock.patch("xauth.accounts.abstract_models.EMAIL_OUTBOX", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.outbox_model = apps.get_model("accounts", "EmailOutbox")
+        self.user = UserFactory(is_verified=False)
+
+    def test_emails_are_queued_until_dispatched(self):
+        code = self.user.request_verification(send_email=True)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.outbox_model.objects.filter(user=self.user).count(), 1)
+
+        call_command("dispatch_xauth_outbox", stdout=mock.MagicMock())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+        self.assertIn(code, mail.outbox[0].body)
+        self.assertFalse(self.outbox_model.objects.exists())
+
+    def test_emails_that_fail_to_send_are_retried_up_to_max_attempts(self):
+        self.user.request_password_reset(send_email=True)
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError):
+            for _ in range(3):
+                call_command("dispatch_xauth_outbox", max_attempts=2, stdout=mock.MagicMock())
+
+        outbox = self.outbox_model.objects.get(user=self.user)
+        self.assertEqual(outbox.attempts, 2)
+        self.assertIn("OSError", outbox.last_error)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "OPTIONS": {
+                    "loaders": [
+                        (
+                            "django.template.loaders.locmem.Loader",
+                            {"xauth/greeting.txt": "Hello {{ name }}", "xauth/sw/greeting.txt": "Habari {{ name }}"},
+                        )
+                    ]
+                },
+            }
+        ]
+    )
+    def test_emails_are_rendered_in_the_language_they_were_queued_in(self):
+        with translation.override("sw"):
+            self.user._send_email("greeting", {"name": "Dunia"}, "Salamu")
+
+        with translation.override("en"):
+            call_command("dispatch_xauth_outbox", stdout=mock.MagicMock())
+
+        self.assertEqual(mail.outbox[0].body, "Habari Dunia")
+
+    def test_undelivered_emails_are_pruned_once_their_secrets_expire(self):
+        self.user.request_password_reset(send_email=True)
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError):
+            call_command("dispatch_xauth_outbox", max_attempts=1, stdout=mock.MagicMock())
+        self.outbox_model.objects.update(created_at=F("created_at") - timedelta(minutes=31))
+        self.user.request_verification(send_email=True)
+
+        call_command("xauth_prune_tokens", stdout=mock.MagicMock())
+
+        self.assertEqual(list(self.outbox_model.objects.values_list("attempts", flat=True)), [0])
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class TestEmailDelivery(TestCase):
+    def setUp(self):
+        patcher = mock.patch("xauth.mail._email_delivery", SyncEmailDelivery())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = UserFactory(is_verified=False)
+
+    def test_emails_are_sent_once_the_secret_is_committed(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            code = self.user.request_verification(send_email=True)
+            self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(code, mail.outbox[0].body)
+
+    def test_emails_are_not_sent_for_secrets_that_are_rolled_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.user.request_password_reset(send_email=True)
+                raise RuntimeError
+
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class TestAsyncFlows(TestCase):
+    async def test_acreate_user(self):
+        user = await get_user_model().objects.acreate_user(email="async@example.com", password="xauth54321")
+
+        self.assertIsNotNone(user.pk)
+        self.assertTrue(await user.acheck_password("xauth54321"))
+        self.assertFalse(await user.acheck_password("wrong"))
+
+    async def test_averify(self):
+        user = await sync_to_async(UserFactory)(is_verified=False)
+        code = await user.arequest_verification()
+
+        self.assertFalse(await user.averify("wrong"))
+        self.assertTrue(await user.averify(code))
+        self.assertTrue((await get_user_model().objects.aget(pk=user.pk)).is_verified)
+
+    async def test_areset_password(self):
+        user = await sync_to_async(UserFactory)()
+        password = await user.arequest_password_reset()
+
+        self.assertFalse(await user.areset_password("wrong", "Password12!"))
+        self.assertTrue(await user.areset_password(password, "Password12!"))
+        user = await get_user_model().objects.aget(pk=user.pk)
+        self.assertTrue(await user.acheck_password("Password12!"))
+        self.assertTrue(await user.areset_password("Password12!", "Password34!", is_change=True))
+
+    async def test_afrom_signed_id(self):
+        user = await sync_to_async(UserFactory)()
+
+        self.assertEqual(await get_user_model().afrom_signed_id(user.signed_id), user)
+        self.assertIsNone(await get_user_model().afrom_signed_id("invalid"))
+
+
+class TestShortLivedSecrets(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=False)
+        self.securities = apps.get_model("accounts", "Security").objects.filter(user=self.user)
+
+    def test_secrets_are_hashed_with_hmac(self):
+        self.user.request_verification()
+        self.user.request_password_reset()
+
+        security = self.securities.get()
+        self.assertTrue(security.verification_code.startswith("xauth_hmac_sha256$"))
+        self.assertTrue(security.temporary_password.startswith("xauth_hmac_sha256$"))
+
+    def test_expired_secrets_are_rejected(self):
+        code = self.user.request_verification()
+        password = self.user.request_password_reset()
+        self.securities.update(
+            verification_code_generation_time=F("verification_code_generation_time") - timedelta(minutes=31),
+            temporary_password_generation_time=F("temporary_password_generation_time") - timedelta(minutes=31),
+        )
+        self.user.refresh_from_db()
+
+        self.assertFalse(self.user.verify(code))
+        self.assertFalse(self.user.reset_password(password, "Password12!"))
+
+    def test_secrets_hashed_as_passwords_are_checked(self):
+        with mock.patch("xauth.accounts.hashers._secret_hasher", PasswordSecretHasher()):
+            code = self.user.request_verification()
+
+        self.assertFalse(self.securities.get().verification_code.startswith("xauth_hmac_sha256$"))
+        self.assertTrue(self.user.verify(code))
+
+
+class TestSecurityUpsert(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=False)
+
+    def test_secrets_are_saved_with_a_single_statement(self):
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as context:
+                self.user.request_verification()
+
+            statements = [q["sql"] for q in context.captured_queries if "SAVEPOINT" not in q["sql"]]
+            self.assertEqual(len(statements), 1)
+            self.assertIn("ON CONFLICT", statements[0])
+
+    def test_cached_security_is_refreshed(self):
+        self.user.add_security_question(SecurityQuestionFactory(), "Blue")
+        self.assertIsNone(self.user.security.temporary_password)
+
+        password = self.user.request_password_reset()
+
+        self.assertIsNotNone(self.user.security.security_question)
+        self.assertTrue(self.user.reset_password(password, "Password12!"))
+
+    def test_request_verification_codes(self):
+        users = [self.user, UserFactory(is_verified=False), UserFactory(is_verified=True)]
+        self.user.request_verification()
+
+        with CaptureQueriesContext(connection) as context:
+            codes = get_user_model().request_verification_codes(users)
+
+        self.assertEqual(len([q for q in context.captured_queries if "SAVEPOINT" not in q["sql"]]), 1)
+        self.assertEqual(set(codes), set(users[:2]))
+        for user, code in codes.items():
+            self.assertTrue(get_user_model().objects.get(pk=user.pk).verify(code))
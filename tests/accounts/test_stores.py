@@ -0,0 +1,110 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from xauth.accounts.token.generator import Token
+from xauth.accounts.token.key import TokenKey
+from xauth.accounts.token.keyring import keyring
+from xauth.accounts.token.stores import CacheKeyStore, DatabaseKeyStore, EnvironmentKeyStore
+
+
+class KeyStoreTestMixin:
+    def use_store(self, store):
+        patcher = mock.patch("xauth.accounts.token.stores._key_store", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        keyring.clear()
+        self.addCleanup(keyring.clear)
+
+    def assertTokensAreVerifiedByOtherNodes(self):
+        encrypted = Token({"id": 1}).encrypted
+
+        keyring.clear()  # i.e. another process (or node) sharing the store
+
+        self.assertEqual(Token(None).get_claims(encrypted)["payload"], {"id": 1})
+
+
+class TestDatabaseKeyStore(KeyStoreTestMixin, TestCase):
+    def setUp(self):
+        self.store = DatabaseKeyStore()
+        self.use_store(self.store)
+
+    def test_tokens_are_verified_by_other_nodes(self):
+        self.assertTokensAreVerifiedByOtherNodes()
+
+    def test_version_is_created_once(self):
+        generate = mock.Mock(side_effect=[b"first", b"second"])
+
+        self.assertEqual(self.store.create("key", "json", "key", generate), b"first")
+        self.assertEqual(self.store.create("key", "json", "key", generate), b"first")
+        self.assertEqual(self.store.read("key", "json"), [("key", b"first", 0)])
+
+    def test_keys_are_only_read_when_the_version_changes(self):
+        TokenKey().signing_key_set  # creates the keys
+        keyring.clear()
+        TokenKey().signing_key_set  # loads the keys
+        with mock.patch.object(keyring, "reload_interval", 0), self.assertNumQueries(1):
+            TokenKey().signing_key_set
+
+    def test_keys_rotated_by_another_node_are_loaded(self):
+        token_key = TokenKey()
+        token_key.signing_key_set  # loads the keys
+
+        signing_kid, _ = TokenKey(key_store=DatabaseKeyStore()).rotate_keys()
+
+        self.assertIsNotNone(token_key.get_verification_key(signing_kid))
+
+
+class TestEnvironmentKeyStore(KeyStoreTestMixin, TestCase):
+    def test_exported_keys_verify_tokens(self):
+        self.use_store(DatabaseKeyStore())
+        encrypted = Token({"id": 1}).encrypted
+        stdout = StringIO()
+        call_command("xauth_generate_keys", export=True, stdout=stdout, stderr=StringIO())
+
+        self.use_store(EnvironmentKeyStore())
+        with mock.patch.dict(os.environ, {"XAUTH_KEYS": stdout.getvalue()}):
+            self.assertEqual(Token(None).get_claims(encrypted)["payload"], {"id": 1})
+        self.assertEqual(len(json.loads(stdout.getvalue())), 2)
+
+    def test_missing_keys_are_not_created(self):
+        self.use_store(EnvironmentKeyStore(variable="XAUTH_TEST_KEYS"))
+
+        with self.assertRaises(ImproperlyConfigured):
+            TokenKey().signing_key_set
+
+
+class TestCacheKeyStore(KeyStoreTestMixin, SimpleTestCase):
+    def setUp(self):
+        self.store = CacheKeyStore(key_prefix="xauth:test-keys")
+        self.use_store(self.store)
+        self.addCleanup(caches["default"].clear)
+
+    def test_tokens_are_verified_by_other_nodes(self):
+        self.assertTokensAreVerifiedByOtherNodes()
+
+    def test_version_changes_when_a_version_is_added(self):
+        self.store.create("key", "json", "key", lambda: b"first")
+        version = self.store.version("key", "json")
+
+        self.store.create("key", "json", "1-a", lambda: b"second", created=1)
+
+        self.assertNotEqual(self.store.version("key", "json"), version)
+        self.assertEqual(self.store.read("key", "json"), [("key", b"first", 0), ("1-a", b"second", 1)])
+
+    def test_versions_created_concurrently_are_kept(self):
+        self.store.create("key", "json", "key", lambda: b"initial")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: self.store.create("key", "json", f"1-{i}", lambda: b"%d" % i, 1), range(8)))
+
+        self.assertCountEqual(
+            self.store.read("key", "json"), [("key", b"initial", 0), *((f"1-{i}", b"%d" % i, 1) for i in range(8))]
+        )
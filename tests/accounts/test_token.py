@@ -0,0 +1,186 @@
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+from jwcrypto import jwt
+
+from xauth.accounts.token.generator import Token
+from xauth.accounts.token.key import TokenKey
+from xauth.accounts.token.keyring import KeyRing, keyring
+from xauth.accounts.token.stores import FileKeyStore
+from xauth.cache import LRUCache
+
+
+class TestKeyRing(SimpleTestCase):
+    def test_key_is_loaded_once(self):
+        ring = KeyRing()
+        loader = mock.Mock(return_value="key")
+
+        self.assertEqual(ring.get("name", loader), "key")
+        self.assertEqual(ring.get("name", loader), "key")
+        loader.assert_called_once()
+
+    def test_reload_rereads_loaded_keys(self):
+        ring = KeyRing()
+        loader = mock.Mock(side_effect=["old", "new"])
+        ring.get("name", loader)
+
+        ring.reload()
+
+        self.assertEqual(ring.get("name", loader), "new")
+
+    def test_forced_version_checks_are_rate_limited(self):
+        ring = KeyRing(reload_interval=None, forced_check_interval=60)
+        version = mock.Mock(return_value=1)
+        ring.get("name", lambda: "key", version=version)
+
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 61):
+            for _ in range(5):
+                ring.get("name", lambda: "key", version=version, force_check=True)
+
+        self.assertEqual(version.call_count, 2)
+
+    def test_tokens_with_unknown_kids_do_not_check_the_key_store_per_request(self):
+        token_key = TokenKey()
+        token_key.signing_key_set  # loads the keys
+
+        with mock.patch.object(FileKeyStore, "version") as version:
+            for i in range(5):
+                self.assertIsNone(token_key.get_verification_key(f"forged-{i}"))
+
+        self.assertLessEqual(version.call_count, 1)
+
+    def test_keys_are_not_read_from_storage_once_cached(self):
+        Token({"id": 1}).refresh()  # ensures keys exist in the ring
+
+        with mock.patch.object(FileKeyStore, "read") as read:
+            token = Token({"id": 1})
+            self.assertEqual(token.get_claims(token.refresh()["encrypted"])["payload"], {"id": 1})
+
+        read.assert_not_called()
+
+    def test_reload_keeps_keys_stored_on_disk(self):
+        token = Token({"id": 1})
+        encrypted = token.encrypted
+
+        keyring.reload()
+
+        self.assertEqual(Token(None).get_claims(encrypted)["payload"], {"id": 1})
+
+
+class TestKeyRotation(SimpleTestCase):
+    def setUp(self):
+        keys_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(keys_dir.cleanup)
+        for target in ["xauth.accounts.token.stores.KEYS_DIR", "xauth.accounts.token.key.KEY_RETIREMENT_PERIOD"]:
+            patcher = mock.patch(target, keys_dir.name if target.endswith("DIR") else timedelta(hours=1))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def get_header(token):
+        return jwt.JWT(jwt=token).token.jose_header
+
+    def test_tokens_carry_kid_of_active_keys(self):
+        token = Token({"id": 1})
+        signing_kid, encryption_kid = token.rotate_keys()
+
+        self.assertEqual(self.get_header(token.unencrypted)["kid"], signing_kid)
+        self.assertEqual(self.get_header(token.encrypted)["kid"], encryption_kid)
+
+    def test_tokens_issued_before_rotation_remain_valid(self):
+        encrypted = Token({"id": 1}).encrypted
+
+        Token(None).rotate_keys()
+
+        self.assertEqual(Token(None).get_claims(encrypted)["payload"], {"id": 1})
+
+    def test_tokens_issued_with_retired_keys_are_invalid(self):
+        encrypted = Token({"id": 1}).encrypted
+
+        Token(None).rotate_keys()
+
+        with mock.patch("time.time", return_value=time.time() + timedelta(hours=1).total_seconds()):
+            with self.assertRaises(jwt.JWException):
+                Token(None).get_claims(encrypted)
+
+    def test_keys_rotated_by_other_processes_are_noticed(self):
+        Token(None).refresh()
+        # keys rotated by another process are not in this process' key ring yet
+        with mock.patch("xauth.accounts.token.key.keyring.invalidate"):
+            signing_kid, _ = TokenKey().rotate_keys()
+
+        self.assertNotEqual(TokenKey().signing_key_set.active_kid, signing_kid)
+        with mock.patch("xauth.accounts.token.key.keyring.reload_interval", 0):
+            self.assertEqual(TokenKey().signing_key_set.active_kid, signing_kid)
+
+    def test_generated_keys_can_verify_tokens(self):
+        for algorithm in TokenKey.ALLOWED_SIGNING_ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                token = Token({"id": 1})
+                token.signing_algorithm = algorithm
+
+                self.assertEqual(token.get_claims(token.encrypted)["payload"], {"id": 1})
+
+    def test_tokens_encrypted_with_each_encryption_algorithm(self):
+        for algorithm in TokenKey.ALLOWED_ENCRYPTION_ALGORITHMS:
+            with self.subTest(algorithm=algorithm):
+                token = Token({"id": 1})
+                token.encryption_algorithm = algorithm
+                encrypted = token.encrypted
+
+                self.assertEqual(self.get_header(encrypted)["alg"], algorithm)
+                self.assertEqual(token.get_claims(encrypted)["payload"], {"id": 1})
+
+    def test_rotated_symmetric_encryption_key_decrypts_tokens_issued_before_rotation(self):
+        token = Token({"id": 1})
+        token.encryption_algorithm = "dir"
+        encrypted = token.encrypted
+
+        _, encryption_kid = token.rotate_keys()
+
+        self.assertEqual(token.get_claims(encrypted)["payload"], {"id": 1})
+        self.assertEqual(self.get_header(token.refresh()["encrypted"])["kid"], encryption_kid)
+
+
+class TestClaimsCache(SimpleTestCase):
+    def setUp(self):
+        cache = LRUCache(maxsize=2)
+        patcher = mock.patch("xauth.accounts.token.generator.claims_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = cache
+
+    def test_verified_claims_are_cached(self):
+        encrypted = Token({"id": 1}).encrypted
+        Token(None).get_claims(encrypted)
+
+        with mock.patch.object(Token, "_validate") as validate:
+            claims = Token(None).get_claims(encrypted)
+
+        validate.assert_not_called()
+        self.assertEqual(claims["payload"], {"id": 1})
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_cached_claims_expire_with_token(self):
+        token = Token({"id": 1}, expiry_period=timedelta(minutes=1))
+        token.get_claims(token.encrypted)
+
+        with mock.patch("time.time", return_value=time.time() + 60):
+            self.assertIsNone(self.cache.get(next(iter(self.cache._entries))))
+
+    def test_least_recently_used_claims_are_evicted(self):
+        for i in range(3):
+            token = Token({"id": i})
+            token.get_claims(token.encrypted)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_invalid_tokens_are_not_cached(self):
+        with self.assertRaises(jwt.JWException):
+            Token(None).get_claims(Token({"id": 1}).unencrypted, is_encrypted=True)
+
+        self.assertEqual(len(self.cache), 0)
@@ -1,13 +1,19 @@
 import base64
+from hashlib import sha256
+from unittest import mock
 
+from django.apps import apps
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import check_password
 from django.test import override_settings
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
 from tests.factories import UserFactory, SecurityQuestionFactory
+from xauth.accounts.token.generator import Token
+from xauth.internal_settings import AUTH_APP_LABEL
 
 
 class TestSecurityQuestionViewSet(APITestCase):
@@ -137,6 +143,26 @@ class TestAccountViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data["token"], dict)
 
+    def test_signin_with_requested_token_variant(self):
+        credentials = base64.b64encode(bytes(f"{self.user.email}:xauth54321", encoding="utf8")).decode("utf8")
+        with mock.patch.object(Token, "_make_encrypted_token") as make_encrypted_token:
+            response = self.client.post(
+                path=f"{reverse('user-signin')}?token=unencrypted", HTTP_AUTHORIZATION=f"Basic {credentials}"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data["token"]), ["unencrypted"])
+        make_encrypted_token.assert_not_called()
+
+    def test_signin_with_unknown_token_variant(self):
+        credentials = base64.b64encode(bytes(f"{self.user.email}:xauth54321", encoding="utf8")).decode("utf8")
+        response = self.client.post(
+            path=f"{reverse('user-signin')}?token=jwe", HTTP_AUTHORIZATION=f"Basic {credentials}"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["token"]), {"encrypted", "unencrypted"})
+
     def test_signin_to_unverified_account(self):
         user = UserFactory(is_verified=False)
         credentials = base64.b64encode(bytes(f"{user.email}:xauth54321", encoding="utf8")).decode("utf8")
@@ -446,3 +472,79 @@ class TestAccountViewSet(APITestCase):
         )
 
         self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+@mock.patch("xauth.accounts.views.REFRESH_TOKENS", True)
+class TestRefreshTokens(APITestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=True)
+
+    def signin(self):
+        credentials = base64.b64encode(bytes(f"{self.user.email}:xauth54321", encoding="utf8")).decode("utf8")
+        response = self.client.post(path=reverse("user-signin"), HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.client.logout()
+        return response.data["token"]["refresh"]
+
+    def refresh(self, refresh_token):
+        return self.client.post(reverse("user-refresh"), data={"refresh": refresh_token})
+
+    def test_refresh_token_is_exchanged_for_a_new_token_pair(self):
+        refresh_token = self.signin()
+
+        # savepoint, lookup, rotation, new refresh token and savepoint release
+        with self.assertNumQueries(5):
+            response = self.refresh(refresh_token)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], self.user.email)
+        self.assertEqual(set(response.data["token"]), {"encrypted", "unencrypted", "refresh"})
+        self.assertNotEqual(response.data["token"]["refresh"], refresh_token)
+        token = response.data["token"]["unencrypted"]
+        self.assertEqual(self.user.token.get_payload(token, is_encrypted=False), self.user.token_payload)
+
+    def test_refresh_token_is_stored_hashed(self):
+        refresh_token = self.signin()
+
+        refresh_token_model = apps.get_model(AUTH_APP_LABEL, "RefreshToken")
+        self.assertFalse(refresh_token_model.objects.filter(token_hash=refresh_token).exists())
+        self.assertEqual(refresh_token_model.objects.get().token_hash, sha256(refresh_token.encode()).hexdigest())
+
+    def test_reused_refresh_token_revokes_its_family(self):
+        refresh_token = self.signin()
+        other_refresh_token = self.signin()
+        new_refresh_token = self.refresh(refresh_token).data["token"]["refresh"]
+
+        with self.assertLogs("xauth.accounts.managers", "WARNING"):
+            response = self.refresh(refresh_token)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.refresh(new_refresh_token).status_code, status.HTTP_400_BAD_REQUEST)
+        # refresh tokens issued on other sign ins are unaffected
+        self.assertEqual(self.refresh(other_refresh_token).status_code, status.HTTP_200_OK)
+
+    def test_expired_refresh_token(self):
+        refresh_token = self.signin()
+        apps.get_model(AUTH_APP_LABEL, "RefreshToken").objects.update(expires_at=timezone.now())
+
+        self.assertEqual(self.refresh(refresh_token).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_refresh_token(self):
+        self.assertEqual(self.refresh("unknown").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_signout_revokes_refresh_token(self):
+        refresh_token = self.signin()
+        self.client.force_login(self.user)
+        self.client.post(reverse("user-signout", kwargs={"pk": self.user.pk}), data={"refresh": refresh_token})
+        self.client.logout()
+
+        self.assertEqual(self.refresh(refresh_token).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_token_is_not_issued_to_unverified_users(self):
+        self.user = UserFactory(is_verified=False)
+
+        with self.assertRaises(KeyError):
+            self.signin()
+
+    def test_refresh_when_refresh_tokens_are_disabled(self):
+        with mock.patch("xauth.accounts.views.REFRESH_TOKENS", False):
+            self.assertEqual(self.refresh("unknown").status_code, status.HTTP_404_NOT_FOUND)
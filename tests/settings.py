@@ -1,3 +1,6 @@
+import atexit
+import shutil
+import tempfile
 from pathlib import Path
 
 from xauth.settings import *  # noqa
@@ -80,3 +83,7 @@ REST_FRAMEWORK.update(
         "TEST_REQUEST_DEFAULT_FORMAT": "json",
     }
 )
+
+# Keys generated by the tests are discarded with the test run
+XAUTH_KEYS_DIR = tempfile.mkdtemp(prefix="xauth-test-keys-")
+atexit.register(shutil.rmtree, XAUTH_KEYS_DIR, ignore_errors=True)
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.test import RequestFactory
+
+from rest_framework import exceptions, status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from tests.factories import UserFactory
+from xauth.authentication import JWTAuthentication
+
+
+class TestJWTAuthentication(APITestCase):
+    def test_token_subject_url_names(self):
+        self.assertEqual(
+            JWTAuthentication.get_token_subject_url_names(),
+            {
+                "verification": {"user-verify-account", "user-request-verification-code"},
+                "password-reset": {"user-reset-password", "user-request-temporary-password"},
+                "activation": {"user-activate-account"},
+            },
+        )
+
+    def test_token_scope_is_checked_without_reversing_urls(self):
+        user = UserFactory(is_verified=False)
+
+        with mock.patch("rest_framework.viewsets.ViewSetMixin.reverse_action") as reverse_action:
+            response = self.client.get(
+                reverse("user-detail", kwargs={"pk": user.pk}),
+                HTTP_AUTHORIZATION=f"Bearer {user.token.encrypted}",
+            )
+
+        reverse_action.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["detail"], "Invalid token")
+
+
+@mock.patch("xauth.authentication.TOKEN_USER_ATTRIBUTES", ("pk", "is_active", "is_verified"))
+@mock.patch("xauth.accounts.abstract_models.TOKEN_USER_ATTRIBUTES", ("pk", "is_active", "is_verified"))
+class TestStatelessJWTAuthentication(APITestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=True)
+
+    def test_user_attributes_embedded_in_token_are_read_without_a_query(self):
+        token = self.user.token.encrypted
+
+        with self.assertNumQueries(0):
+            user = JWTAuthentication().get_user_from_jwt_token(token)
+            self.assertEqual((user.pk, user.is_active, user.is_verified), (self.user.pk, True, True))
+            self.assertTrue(user.is_authenticated)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.user.email)
+        self.assertEqual(user, self.user)
+
+    def test_authenticated_request(self):
+        response = self.client.get(
+            reverse("user-detail", kwargs={"pk": self.user.pk}),
+            HTTP_AUTHORIZATION=f"Bearer {self.user.token.encrypted}",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["email"], self.user.email)
+
+    def test_deleted_user_fails_authentication_when_loaded(self):
+        user = JWTAuthentication().get_user_from_jwt_token(self.user.token.encrypted)
+        self.user.delete()
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            user.email
+
+
+class TestAsyncJWTAuthentication(APITestCase):
+    async def test_aauthenticate(self):
+        user = await sync_to_async(UserFactory)(is_verified=True)
+        token = (await user.token.aget_tokens())["encrypted"]
+
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(await JWTAuthentication().aauthenticate(request), (user, token))
+
+    async def test_aauthenticate_rejects_invalid_token(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION="Bearer invalid")
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            await JWTAuthentication().aauthenticate(request)
+
+    async def test_aauthenticate_ignores_other_schemes(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION="Basic dXNlcjpwYXNz")
+        self.assertIsNone(await JWTAuthentication().aauthenticate(request))
@@ -0,0 +1,110 @@
+import logging
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from tests.factories import UserFactory
+from xauth import instrumentation
+from xauth.instrumentation import InMemorySink, LoggingSink, NullSink, increment, metrics_view, set_sink, timer
+
+
+class TestSinks(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(set_sink, None)
+
+    def test_null_sink_is_not_called(self):
+        sink = mock.MagicMock(spec=NullSink, enabled=False)
+        set_sink(sink)
+
+        with timer("stage"):
+            pass
+        increment("counter")
+
+        self.assertEqual(sink.mock_calls, [])
+
+    def test_in_memory_sink(self):
+        sink = InMemorySink()
+        set_sink(sink)
+
+        with mock.patch("xauth.instrumentation.time.perf_counter", side_effect=[1.0, 1.5, 2.0, 2.25]):
+            for _ in range(2):
+                with timer("token_verify"):
+                    pass
+        increment("token_failures", {"reason": "expired"})
+        increment("token_failures", {"reason": "expired"})
+
+        stats = sink.stats
+        self.assertEqual(
+            stats["observations"][("stage_seconds", (("stage", "token_verify"),))],
+            {"count": 2, "sum": 0.75, "max": 0.5},
+        )
+        self.assertEqual(stats["counters"][("token_failures", (("reason", "expired"),))], 2)
+
+        exposition = sink.render({("claims_cache_hits", ()): 3})
+        self.assertIn('xauth_stage_seconds_count{stage="token_verify"} 2\n', exposition)
+        self.assertIn('xauth_stage_seconds_sum{stage="token_verify"} 0.75\n', exposition)
+        self.assertIn('xauth_token_failures_total{reason="expired"} 2.0\n', exposition)
+        self.assertIn("# TYPE xauth_claims_cache_hits gauge\nxauth_claims_cache_hits 3\n", exposition)
+
+    def test_logging_sink(self):
+        set_sink(LoggingSink(level=logging.INFO))
+
+        with self.assertLogs("xauth.instrumentation", "INFO") as logs:
+            increment("token_failures", {"reason": "invalid"})
+
+        self.assertEqual(logs.output, ["INFO:xauth.instrumentation:token_failures {'reason': 'invalid'} +1"])
+
+    def test_sink_is_configured_by_settings(self):
+        set_sink(None)
+        with mock.patch.dict(instrumentation.METRICS_SINK, {"BACKEND": "xauth.instrumentation.InMemorySink"}):
+            self.assertIsInstance(instrumentation.get_sink(), InMemorySink)
+
+    def test_metrics_view(self):
+        set_sink(InMemorySink())
+        increment("token_failures", {"reason": "invalid"})
+
+        response = metrics_view(RequestFactory().get("/metrics"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'xauth_token_failures_total{reason="invalid"} 1.0', response.content)
+        self.assertIn(b"xauth_claims_cache_misses ", response.content)
+
+    def test_metrics_view_without_in_memory_sink(self):
+        set_sink(NullSink())
+
+        self.assertEqual(metrics_view(RequestFactory().get("/metrics")).status_code, 404)
+
+
+class TestAuthenticationInstrumentation(APITestCase):
+    def setUp(self):
+        self.sink = InMemorySink()
+        set_sink(self.sink)
+        self.addCleanup(set_sink, None)
+
+    def get_profile(self, user, token):
+        return self.client.get(reverse("user-detail", kwargs={"pk": user.pk}), HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_stages_of_an_authenticated_request_are_timed(self):
+        user = UserFactory(is_verified=True)
+
+        self.assertEqual(self.get_profile(user, user.token.encrypted).status_code, status.HTTP_200_OK)
+
+        stages = {labels[0][1] for name, labels in self.sink.stats["observations"] if name == "stage_seconds"}
+        self.assertTrue({"token_decrypt", "token_verify", "user_lookup"} <= stages, stages)
+
+    def test_token_failure_reasons(self):
+        user = UserFactory(is_verified=False)
+
+        self.get_profile(user, "invalid")
+        self.get_profile(user, user.token.encrypted)  # verification token on a wrong endpoint
+
+        self.assertEqual(
+            self.sink.stats["counters"],
+            {
+                ("token_failures", (("reason", "invalid"),)): 1,
+                ("token_failures", (("reason", "wrong_endpoint"),)): 1,
+            },
+        )
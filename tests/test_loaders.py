@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from xently.core.loading import get_class, get_classes
+
+from xauth.accounts.token.generator import Token
+from xauth.accounts.token.key import TokenKey
+from xauth.loaders import clear_class_cache
+
+
+class TestClassLoader(SimpleTestCase):
+    def setUp(self):
+        clear_class_cache()
+        self.addCleanup(clear_class_cache)
+
+    def test_classes_are_resolved_once(self):
+        with mock.patch("xauth.loaders._import_module") as import_module:
+            import_module.side_effect = lambda name, classnames: __import__(name, fromlist=classnames)
+            for _ in range(3):
+                self.assertIs(get_class("accounts.token.generator", "Token"), Token)
+
+        self.assertEqual(import_module.call_count, 1)
+
+    def test_classes_are_resolved_per_classnames(self):
+        self.assertEqual(get_classes("accounts.token.key", ["TokenKey"]), [TokenKey])
+        self.assertEqual(get_classes("accounts.token.generator", ["Token"]), [Token])
+
+    def test_cache_is_cleared_when_class_loading_settings_change(self):
+        get_class("accounts.token.generator", "Token")
+
+        with mock.patch("xauth.loaders._import_module") as import_module:
+            import_module.side_effect = lambda name, classnames: __import__(name, fromlist=classnames)
+            with override_settings(XENTLY_DYNAMIC_CLASS_LOADER_MODULE_PREFIX="xauth"):
+                get_class("accounts.token.generator", "Token")
+
+        import_module.assert_called()
@@ -0,0 +1,163 @@
+import threading
+import time
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage, get_connection
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.test import SimpleTestCase, override_settings
+from django.utils import translation
+
+from xauth.mail import PooledEmailDelivery, EmailRenderer
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class TestPooledEmailDelivery(SimpleTestCase):
+    @staticmethod
+    def make_message(i):
+        return EmailMessage(subject=f"Subject {i}", body="Body", to=[f"user{i}@example.com"])
+
+    def test_queued_emails_are_sent_over_one_connection_per_worker(self):
+        delivery = PooledEmailDelivery(workers=2, batch_size=5)
+
+        with mock.patch("xauth.mail.get_connection", wraps=get_connection) as connection_factory:
+            for i in range(20):
+                delivery.deliver(self.make_message(i))
+            delivery.shutdown()
+
+        self.assertEqual(connection_factory.call_count, 2)
+        self.assertCountEqual([m.subject for m in mail.outbox], [f"Subject {i}" for i in range(20)])
+
+    def test_shutdown_is_registered_to_run_at_exit_once(self):
+        delivery = PooledEmailDelivery(workers=1)
+
+        with mock.patch("xauth.mail.atexit.register") as register:
+            for i in range(3):
+                # workers are started again after each shutdown
+                delivery.deliver(self.make_message(i))
+                delivery.shutdown()
+
+        register.assert_called_once_with(delivery.shutdown)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_emails_are_sent_from_the_calling_thread_when_the_queue_is_full(self):
+        # without workers, nothing is taken off the queue
+        delivery = PooledEmailDelivery(workers=0, queue_size=1, put_timeout=0)
+
+        delivery.deliver(self.make_message(1))
+        self.assertEqual(len(mail.outbox), 0)
+
+        with self.assertLogs("xauth.mail", "WARNING"):
+            delivery.deliver(self.make_message(2))
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 2"])
+
+    def test_worker_keeps_sending_after_a_failed_batch(self):
+        delivery = PooledEmailDelivery(workers=1, batch_size=1)
+        connection = get_connection()
+        send_messages = connection.send_messages
+        # the first batch fails to send both on the first attempt and when retried
+        failures = [OSError(), OSError()]
+
+        def send_or_fail(messages):
+            if failures:
+                raise failures.pop()
+            return send_messages(messages)
+
+        with mock.patch("xauth.mail.get_connection", return_value=connection), mock.patch.object(
+            connection, "send_messages", side_effect=send_or_fail
+        ):
+            with self.assertLogs("xauth.mail", "ERROR"):
+                delivery.deliver(self.make_message(1))
+                delivery.deliver(self.make_message(2))
+                delivery.shutdown()
+
+        self.assertEqual([m.subject for m in mail.outbox], ["Subject 2"])
+
+    def test_shutdown_does_not_wait_for_a_hung_connection(self):
+        delivery = PooledEmailDelivery(workers=1, batch_size=1, shutdown_timeout=0.1)
+        connection = get_connection()
+        sending, hang = threading.Event(), threading.Event()
+        self.addCleanup(hang.set)
+
+        def send_messages(messages):
+            sending.set()
+            hang.wait()
+
+        with mock.patch("xauth.mail.get_connection", return_value=connection), mock.patch.object(
+            connection, "send_messages", side_effect=send_messages
+        ):
+            for i in range(3):
+                delivery.deliver(self.make_message(i))
+            sending.wait(1)
+            with self.assertLogs("xauth.mail", "ERROR") as logs:
+                started_at = time.monotonic()
+                delivery.shutdown()
+
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertIn("2 queued email(s) were not sent", logs.output[0])
+
+
+@override_settings(
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "OPTIONS": {
+                "loaders": [
+                    (
+                        "django.template.loaders.locmem.Loader",
+                        {
+                            "xauth/greeting.txt": "Hello {{ name }}",
+                            "xauth/greeting.html": "<p>Hello {{ name }}</p>",
+                            "xauth/sw/greeting.txt": "Habari {{ name }}",
+                            "xauth/fr/greeting.html": "<p>Bonjour {{ name }}</p>",
+                            "xauth/plain.txt": "Plain {{ name }}",
+                        },
+                    )
+                ]
+            },
+        }
+    ]
+)
+class TestEmailRenderer(SimpleTestCase):
+    def setUp(self):
+        self.renderer = EmailRenderer()
+
+    def test_templates_are_looked_up_once(self):
+        with mock.patch("xauth.mail.get_template", wraps=get_template) as lookup:
+            self.assertEqual(self.renderer.render("greeting", {"name": "World"}), ("Hello World", "<p>Hello World</p>"))
+            lookups = lookup.call_count
+            self.assertEqual(self.renderer.render("greeting", {"name": "There"}), ("Hello There", "<p>Hello There</p>"))
+
+        self.assertEqual(lookup.call_count, lookups)
+
+    def test_missing_html_template_is_remembered(self):
+        with mock.patch("xauth.mail.get_template", wraps=get_template) as lookup:
+            self.assertEqual(self.renderer.render("plain", {"name": "World"}), ("Plain World", None))
+            lookups = lookup.call_count
+            self.assertEqual(self.renderer.render("plain", {"name": "World"}), ("Plain World", None))
+
+        self.assertEqual(lookup.call_count, lookups)
+
+    def test_missing_text_template_raises(self):
+        with self.assertRaises(TemplateDoesNotExist):
+            self.renderer.render("missing")
+
+    def test_templates_are_selected_per_language(self):
+        with translation.override("sw"):
+            self.assertEqual(self.renderer.render("greeting", {"name": "Dunia"})[0], "Habari Dunia")
+        with translation.override("en"):
+            self.assertEqual(self.renderer.render("greeting", {"name": "World"})[0], "Hello World")
+
+    def test_text_and_html_templates_are_of_the_same_language(self):
+        with translation.override("sw"):
+            self.assertEqual(self.renderer.render("greeting", {"name": "Dunia"}), ("Habari Dunia", None))
+        with translation.override("fr"):
+            # without a translated text template, both templates fall back to the default language
+            self.assertEqual(self.renderer.render("greeting", {"name": "World"}), ("Hello World", "<p>Hello World</p>"))
+
+    def test_render_many(self):
+        self.assertEqual(
+            self.renderer.render_many("plain", [{"name": "A"}, {"name": "B"}]),
+            [("Plain A", None), ("Plain B", None)],
+        )
@@ -0,0 +1,191 @@
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.management import call_command, CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver
+
+from tests.factories import UserFactory
+from xauth.accounts.token.key import TokenKey
+from xauth.accounts.token.stores import FileKeyStore
+from xauth.mail import SyncEmailDelivery
+from xauth.management.commands.xauth_import_times import parse_import_times
+from xauth.warmup import get_asgi_application, get_wsgi_application, warmup
+
+
+class TestImportUsers(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.tempdir.name) / name
+        path.write_text(content)
+        return str(path)
+
+    def call_command(self, *args, **kwargs):
+        stdout = StringIO()
+        call_command("xauth_import_users", *args, workers=1, stdout=stdout, stderr=StringIO(), **kwargs)
+        return stdout.getvalue()
+
+    def test_import_csv(self):
+        path = self.write("users.csv", "email,password,is_verified\nA@Example.com,Pa55word!,true\nb@example.com,,0\n")
+
+        output = self.call_command(path, chunk_size=1)
+
+        self.assertIn("Imported 2 user(s)", output)
+        a, b = get_user_model().objects.order_by("email")
+        self.assertEqual(a.email, "A@example.com")
+        self.assertTrue(a.check_password("Pa55word!"))
+        self.assertTrue(a.is_verified)
+        self.assertFalse(b.has_usable_password())
+        self.assertFalse(b.is_verified)
+
+    def test_import_jsonl_skipping_existing_users(self):
+        UserFactory(email="a@example.com")
+        rows = [{"email": "a@example.com", "password": "Pa55word!"}, {"email": "b@example.com", "password": "x"}]
+        path = self.write("users.jsonl", "\n".join(json.dumps(row) for row in rows))
+
+        output = self.call_command(path, ignore_conflicts=True)
+
+        self.assertIn("Imported 1 user(s)", output)
+        self.assertIn("Skipped 1 existing user(s)", output)
+        self.assertTrue(get_user_model().objects.get(email="b@example.com").check_password("x"))
+
+    def test_reimport_hashed_passwords_skipping_existing_users(self):
+        path = self.write("users.csv", f"email,password\na@example.com,{make_password('Pa55word!')}\n")
+        self.call_command(path, hashed_passwords=True, create_security=True)
+
+        output = self.call_command(path, hashed_passwords=True, ignore_conflicts=True, create_security=True)
+
+        self.assertIn("Imported 0 user(s)", output)
+        self.assertIn("Skipped 1 existing user(s)", output)
+        self.assertEqual(apps.get_model("accounts", "Security").objects.count(), 1)
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_request_verification(self):
+        path = self.write("users.csv", "email,is_verified\na@example.com,false\nb@example.com,true\n")
+
+        with mock.patch("xauth.mail._email_delivery", SyncEmailDelivery()):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.call_command(path, request_verification=True)
+
+        securities = apps.get_model("accounts", "Security").objects.order_by("user__email")
+        self.assertEqual(securities.count(), 2)
+        self.assertIsNotNone(securities[0].verification_code)
+        self.assertIsNone(securities[1].verification_code)
+        self.assertEqual([m.to for m in mail.outbox], [["a@example.com"]])
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_verification_codes_are_not_sent_for_chunks_that_fail(self):
+        path = self.write("users.csv", "email,is_verified\na@example.com,false\n")
+
+        def create_security(command, users):
+            get_user_model().request_verification_codes(users, send_email=True)
+            raise RuntimeError
+
+        with mock.patch("xauth.mail._email_delivery", SyncEmailDelivery()), mock.patch(
+            "xauth.management.commands.xauth_import_users.Command.create_security", create_security
+        ):
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError):
+                self.call_command(path, request_verification=True)
+
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(get_user_model().objects.filter(email="a@example.com").exists())
+
+    def test_unknown_columns_are_rejected(self):
+        path = self.write("users.csv", "email,nickname\na@example.com,a\n")
+
+        with self.assertRaises(CommandError):
+            self.call_command(path)
+
+
+class TestGenerateKeys(SimpleTestCase):
+    def setUp(self):
+        keys_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(keys_dir.cleanup)
+        self.keys_dir = Path(keys_dir.name)
+        patcher = mock.patch("xauth.accounts.token.stores.KEYS_DIR", keys_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_keys_of_every_algorithm_are_created(self):
+        stdout = StringIO()
+        call_command("xauth_generate_keys", all_algorithms=True, stdout=stdout)
+
+        output = stdout.getvalue()
+        for algorithm in TokenKey.ALLOWED_SIGNING_ALGORITHMS + TokenKey.ALLOWED_ENCRYPTION_ALGORITHMS:
+            self.assertIn(f"({algorithm})", output)
+        key_files = [file for file in self.keys_dir.iterdir() if not file.name.startswith(".")]
+        self.assertEqual(
+            len(key_files), len(TokenKey.ALLOWED_SIGNING_ALGORITHMS + TokenKey.ALLOWED_ENCRYPTION_ALGORITHMS)
+        )
+
+    def test_concurrently_created_key_is_generated_once(self):
+        generated = []
+
+        def generate_data():
+            generated.append(None)
+            time.sleep(0.05)
+            return b"key"
+
+        file = self.keys_dir / "key.pem"
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: FileKeyStore().create("key", "pem", "key", generate_data), range(4)))
+
+        self.assertEqual((len(generated), results), (1, [b"key"] * 4))
+        self.assertEqual(file.read_bytes(), b"key")
+        # no temporary files are left behind
+        self.assertEqual(sorted(file.name for file in self.keys_dir.iterdir()), [".xauth.lock", "key.pem"])
+
+
+class TestImportTimes(SimpleTestCase):
+    def test_import_times_are_parsed(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\nimport time:       211 |        539 |   xauth.cache"
+        )
+
+        self.assertEqual(parse_import_times(output), [("xauth.cache", 211, 539, 1)])
+
+    def test_xauth_imports_are_reported(self):
+        stdout = StringIO()
+        call_command("xauth_import_times", limit=5, stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(all(line.split()[-1].startswith("xauth") for line in lines[1:-1]))
+
+
+class TestWarmup(SimpleTestCase):
+    def test_warmup(self):
+        with self.assertLogs("xauth.warmup", "INFO"):
+            warmup()
+
+        self.assertIn("user-signin", get_resolver().reverse_dict)
+
+    @override_settings(XAUTH_VERIFY_ENCRYPTED_TOKEN=False)
+    def test_warmup_when_unencrypted_tokens_are_verified(self):
+        with self.assertLogs("xauth.warmup", "INFO"):
+            warmup()
+
+    def test_warmup_runs_when_the_application_is_created(self):
+        with mock.patch("xauth.internal_settings.WARMUP", True), mock.patch("xauth.warmup.warmup") as warmup_mock:
+            get_wsgi_application()
+            get_asgi_application()
+
+        self.assertEqual(warmup_mock.call_count, 2)
+
+    def test_warmup_does_not_run_when_apps_are_ready(self):
+        with mock.patch("xauth.internal_settings.WARMUP", True), mock.patch("xauth.warmup.warmup") as warmup_mock:
+            apps.get_app_config("xauth").ready()
+
+        warmup_mock.assert_not_called()
@@ -0,0 +1,76 @@
+import base64
+import marshal
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from tests.factories import UserFactory
+from xauth.profiling import RequestProfiler, profile_view, profiles_view, request_profiler
+
+
+class TestRequestProfiler(APITestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=True)
+        self.addCleanup(request_profiler.clear)
+
+    def signin(self, **extra):
+        credentials = base64.b64encode(bytes(f"{self.user.email}:xauth54321", encoding="utf8")).decode("utf8")
+        return self.client.post(reverse("user-signin"), HTTP_AUTHORIZATION=f"Basic {credentials}", **extra)
+
+    def test_requests_are_not_profiled_by_default(self):
+        with mock.patch("cProfile.Profile") as profile:
+            self.assertEqual(self.signin().status_code, status.HTTP_200_OK)
+
+        profile.assert_not_called()
+        self.assertEqual(request_profiler.stats, {})
+
+    @mock.patch.object(request_profiler, "sample_rate", 1)
+    def test_sampled_requests_are_aggregated_per_action(self):
+        self.signin()
+        self.signin()
+        self.client.get(reverse("securityquestion-list"))
+
+        self.assertEqual(request_profiler.stats, {"user.signin": 2, "securityquestion.list": 1})
+        self.assertIsNotNone(request_profiler.get_stats("user.signin"))
+
+    @mock.patch.object(request_profiler, "secret", "s3cret")
+    def test_requests_with_the_debug_header_are_profiled(self):
+        self.signin(HTTP_X_XAUTH_PROFILE="wrong")
+        self.assertEqual(request_profiler.stats, {})
+
+        self.signin(HTTP_X_XAUTH_PROFILE="s3cret")
+        self.assertEqual(request_profiler.stats, {"user.signin": 1})
+
+    def test_profiles_are_dumped_to_the_output_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = RequestProfiler(sample_rate=1, output_dir=directory)
+            view = profile_view(key="hello")(lambda request: sum(range(10)))
+
+            with mock.patch("xauth.profiling.request_profiler", profiler):
+                self.assertEqual(view(RequestFactory().get("/")), 45)
+
+            (file,) = Path(directory).iterdir()
+            self.assertTrue(file.name.startswith("hello."))
+            self.assertTrue(marshal.loads(file.read_bytes()))
+
+    @mock.patch.object(request_profiler, "sample_rate", 1)
+    def test_profiles_view(self):
+        self.signin()
+        request = RequestFactory().get("/", {"key": "user.signin"})
+
+        request.user = self.user
+        with self.assertRaises(PermissionDenied):
+            profiles_view(request)
+
+        request.user = superuser = UserFactory(is_superuser=True)
+        self.assertIn(b"cumulative", profiles_view(request).content)
+
+        request = RequestFactory().get("/", {"key": "user.signin", "format": "pstats"})
+        request.user = superuser
+        self.assertTrue(marshal.loads(profiles_view(request).content))
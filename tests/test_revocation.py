@@ -0,0 +1,117 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from tests.factories import UserFactory
+from xauth.authentication import JWTAuthentication
+from xauth.internal_settings import AUTH_APP_LABEL
+from xauth.revocation import BloomFilter, TokenDenylist, token_denylist
+
+
+class TestBloomFilter(SimpleTestCase):
+    def test_added_items_are_always_found(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom_filter.add(f"item-{i}")
+
+        self.assertTrue(all(f"item-{i}" in bloom_filter for i in range(1000)))
+        self.assertEqual(len(bloom_filter), 1000)
+
+    def test_false_positive_rate(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom_filter.add(f"item-{i}")
+
+        false_positives = sum(f"other-{i}" in bloom_filter for i in range(10000))
+        self.assertLess(false_positives / 10000, 0.02)
+
+    def test_size_depends_on_the_false_positive_rate(self):
+        self.assertEqual((BloomFilter(1000, 0.01).size, BloomFilter(1000, 0.01).hash_count), (9586, 7))
+        self.assertGreater(BloomFilter(1000, 0.001).size, BloomFilter(1000, 0.01).size)
+
+
+@mock.patch("xauth.accounts.views.TOKEN_REVOCATION", True)
+@mock.patch("xauth.authentication.TOKEN_REVOCATION", True)
+class TestTokenRevocation(APITestCase):
+    def setUp(self):
+        self.user = UserFactory(is_verified=True)
+        self.token = self.user.token.encrypted
+        token_denylist.clear()
+        self.addCleanup(token_denylist.clear)
+
+    def get_profile(self, token):
+        return self.client.get(reverse("user-detail", kwargs={"pk": self.user.pk}), HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def signout(self, token):
+        return self.client.post(
+            reverse("user-signout", kwargs={"pk": self.user.pk}), HTTP_AUTHORIZATION=f"Bearer {token}"
+        )
+
+    def test_signout_revokes_the_token(self):
+        self.assertEqual(self.signout(self.token).status_code, status.HTTP_200_OK)
+
+        response = self.get_profile(self.token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["detail"], "Revoked token")
+        # other tokens of the user are not revoked
+        self.assertEqual(self.get_profile(self.user.token.encrypted).status_code, status.HTTP_200_OK)
+
+    def test_tokens_that_are_not_revoked_are_not_looked_up(self):
+        self.signout(self.user.token.encrypted)
+        token_denylist.sync()
+
+        authentication = JWTAuthentication()
+        authentication.request = RequestFactory().get("/")
+        with self.assertNumQueries(1):  # the user
+            authentication.get_user_from_jwt_token(self.user.token.encrypted)
+
+    def test_tokens_revoked_by_other_processes_are_read_incrementally(self):
+        # a process whose filter was built before the token was revoked
+        other_denylist = TokenDenylist(10, 0.01, sync_interval=0)
+        self.assertFalse(other_denylist.is_revoked("unknown"))
+
+        self.signout(self.token)
+        jti = self.user.token.get_claims(self.token)["jti"]
+
+        with self.assertNumQueries(2):  # new rows and the denylist row of the (matching) token
+            self.assertTrue(other_denylist.is_revoked(jti))
+        self.assertEqual(other_denylist.stats["size"], 1)
+
+    def test_filter_is_rebuilt_when_full(self):
+        denylist = TokenDenylist(2, 0.01, sync_interval=0)
+        expires_at = (timezone.now() + timedelta(hours=1)).timestamp()
+        for i in range(3):
+            denylist.revoke(f"jti-{i}", expires_at)
+        denylist.sync()
+        self.assertEqual(denylist.stats["capacity"], 6)
+
+        for i in range(3, 7):
+            denylist.revoke(f"jti-{i}", expires_at)
+        denylist.sync()
+
+        self.assertEqual(denylist.stats, {"size": 7, "capacity": 14, "bits": BloomFilter(14, 0.01).size})
+        self.assertTrue(all(denylist.is_revoked(f"jti-{i}") for i in range(7)))
+
+    def test_async_authentication_rejects_revoked_tokens(self):
+        self.signout(self.token)
+
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with self.assertRaisesMessage(exceptions.AuthenticationFailed, "Revoked token"):
+            async_to_sync(JWTAuthentication().aauthenticate)(request)
+
+    def test_expired_revoked_tokens_are_pruned(self):
+        revoked_token_model = apps.get_model(AUTH_APP_LABEL, "RevokedToken")
+        revoked_token_model.objects.revoke("expired", timezone.now())
+        revoked_token_model.objects.revoke("unexpired", timezone.now() + timedelta(hours=1))
+
+        call_command("xauth_prune_tokens", stdout=mock.MagicMock())
+
+        self.assertEqual(list(revoked_token_model.objects.values_list("jti", flat=True)), ["unexpired"])
@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase
+
+from tests.factories import UserFactory
+from xauth.throttling import throttle_stats, TemporaryPasswordLookupRateThrottle
+
+THROTTLE_RATES = {
+    "verification_code_user": "2/hour",
+    "verification_code_ip": "3/hour",
+    "temporary_password_lookup": "2/hour",
+    "temporary_password_ip": None,
+    "verification_attempt": "2/hour",
+    "password_reset_attempt": "2/hour",
+}
+
+
+@mock.patch("xauth.throttling.THROTTLE_RATES", THROTTLE_RATES)
+class TestThrottling(APITestCase):
+    def setUp(self):
+        cache.clear()
+        throttle_stats.clear()
+        self.addCleanup(cache.clear)
+
+    def request_verification_code(self, user):
+        return self.client.get(reverse("user-request-verification-code", kwargs={"pk": user.pk}))
+
+    def request_temporary_password(self, email):
+        return self.client.post(reverse("user-request-temporary-password"), data={"email": email})
+
+    def test_verification_codes_are_throttled_per_user(self):
+        user = UserFactory(is_verified=False)
+        for _ in range(2):
+            self.assertEqual(self.request_verification_code(user).status_code, status.HTTP_200_OK)
+
+        with mock.patch("xauth.accounts.abstract_models.make_secret") as make_secret:
+            response = self.request_verification_code(user)
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+        make_secret.assert_not_called()
+        self.assertEqual(
+            throttle_stats.stats,
+            {
+                "verification_code_user": {"allowed": 2, "throttled": 1},
+                # every throttle counts the request, even when another throttle rejects it
+                "verification_code_ip": {"allowed": 3, "throttled": 0},
+            },
+        )
+
+    def test_verification_codes_are_throttled_per_ip_address(self):
+        for _ in range(3):
+            self.assertEqual(self.request_verification_code(UserFactory(is_verified=False)).status_code, 200)
+
+        response = self.request_verification_code(UserFactory(is_verified=False))
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        response = self.client.get(
+            reverse("user-request-verification-code", kwargs={"pk": UserFactory(is_verified=False).pk}),
+            REMOTE_ADDR="10.0.0.1",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_temporary_passwords_are_throttled_per_lookup_field_values(self):
+        user = UserFactory()
+        for _ in range(2):
+            self.assertEqual(self.request_temporary_password(user.email).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.request_temporary_password(user.email).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.request_temporary_password(UserFactory().email).status_code, status.HTTP_200_OK)
+
+    def test_lookup_field_values_are_normalized(self):
+        throttle = TemporaryPasswordLookupRateThrottle()
+        idents = {
+            throttle.get_ident_for(mock.Mock(data={"email": email}), None)
+            for email in ["user@example.com", " USER@example.com"]
+        }
+
+        self.assertEqual(len(idents), 1)
+        self.assertIsNone(throttle.get_ident_for(mock.Mock(data={}), None))
+
+    def test_verification_attempts_are_throttled_per_user(self):
+        user = UserFactory(is_verified=False)
+        user.request_verification()
+        self.client.force_login(user)
+        url = reverse("user-verify-account", kwargs={"pk": user.pk})
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, data={"code": "0"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch("xauth.accounts.abstract_models.check_secret") as check_secret:
+            response = self.client.post(url, data={"code": "0"})
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        check_secret.assert_not_called()
+
+    def test_password_reset_attempts_are_throttled_per_user(self):
+        user = UserFactory()
+        user.request_password_reset()
+        self.client.force_login(user)
+        url = reverse("user-reset-password", kwargs={"pk": user.pk})
+        data = {"old_password": "wrong", "new_password": "PVs5w()r9!"}
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, data=data).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.client.post(url, data=data).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -1,5 +1,4 @@
-import threading
-
+from asgiref.sync import sync_to_async
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
@@ -7,36 +6,54 @@ from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.password_validation import validate_password
 from django.core import signing
-from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.exceptions import ObjectDoesNotExist, ValidationError, FieldDoesNotExist
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string, TemplateDoesNotExist
 from rest_framework.exceptions import ValidationError as DrfValidationError
-from django.db import models
-from django.utils import timezone
-from django.utils.functional import cached_property
-from xently.core.loading import get_class
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone, translation
+from xently.core.loading import get_class, get_classes
 
 from xauth.accounts import signing_salt
+from xauth.accounts.hashers import make_secret, check_secret, amake_secret, acheck_secret
+from xauth.cache import ModelInstanceCache
+from xauth.instrumentation import timer
+from xauth.mail import get_email_delivery, email_renderer
 from xauth.internal_settings import (
     APP_NAME,
+    EMAIL_OUTBOX,
     ENFORCE_ACCOUNT_VERIFICATION,
     AUTH_APP_LABEL,
     PASSWORD_RESET_REQUEST_SUBJECT,
     VERIFICATION_REQUEST_SUBJECT,
     REPLY_TO_ACCOUNTS_EMAIL_ADDRESSES,
     TOKEN_EXPIRY,
+    TOKEN_USER_ATTRIBUTES,
+    USER_CACHE,
+    USER_CACHE_TIMEOUT,
 )
 
 Token = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")
-UserManager = get_class(f"{AUTH_APP_LABEL}.managers", "UserManager")
+UserManager, SecurityManager, EmailOutboxManager, RefreshTokenManager, RevokedTokenManager = get_classes(
+    f"{AUTH_APP_LABEL}.managers",
+    ["UserManager", "SecurityManager", "EmailOutboxManager", "RefreshTokenManager", "RevokedTokenManager"],
+)
 
 __all__ = [
     "AbstractUser",
     "AbstractSecurity",
     "AbstractSecurityQuestion",
+    "AbstractEmailOutbox",
+    "AbstractRefreshToken",
+    "AbstractRevokedToken",
+    "AbstractStoredKey",
     "default_is_verified",
+    "user_cache",
 ]
 
+# Users looked up by `AbstractUser.from_signed_id(...)`
+user_cache = ModelInstanceCache(USER_CACHE, timeout=USER_CACHE_TIMEOUT, key_prefix="xauth:user")
+
 
 def default_is_verified():
     return not ENFORCE_ACCOUNT_VERIFICATION
@@ -96,8 +113,22 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
         except signing.BadSignature:
             pass
         else:
+            if user_cache:
+                return user_cache.get(cls, unsigned_id, lambda: cls._default_manager.get(pk=unsigned_id))
             return cls._default_manager.get(pk=unsigned_id)
 
+    @classmethod
+    async def afrom_signed_id(cls, signed_id):
+        """Async `from_signed_id(...)`"""
+        try:
+            unsigned_id = signing.Signer(salt=signing_salt).unsign(signed_id)
+        except signing.BadSignature:
+            pass
+        else:
+            if user_cache:
+                return await user_cache.aget(cls, unsigned_id, lambda: cls._default_manager.aget(pk=unsigned_id))
+            return await cls._default_manager.aget(pk=unsigned_id)
+
     @property
     def _verification_token(self):
         return Token(self.token_payload, subject="verification")
@@ -122,46 +153,104 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
 
     def request_password_reset(self, **kwargs):
         password = self.__class__.objects.make_random_password(self.__class__.TEMPORARY_PASSWORD_LENGTH)
+        self._save_temporary_password(password, make_secret(password), **kwargs)
+        return password
 
-        apps.get_model(AUTH_APP_LABEL, "Security").objects.update_or_create(
-            user=self,
-            defaults={
-                "temporary_password": make_password(password),
-                "temporary_password_generation_time": timezone.localtime if settings.USE_TZ else timezone.now,
-            },
-        )
+    request_password_reset.alters_data = True
 
-        self._flag_password_reset()
+    async def arequest_password_reset(self, **kwargs):
+        """Async `request_password_reset(...)`. The temporary password is hashed outside the event loop"""
+        password = self.__class__.objects.make_random_password(self.__class__.TEMPORARY_PASSWORD_LENGTH)
+        encoded = await amake_secret(password)
+        await sync_to_async(self._save_temporary_password)(password, encoded, **kwargs)
+        return password
 
+    arequest_password_reset.alters_data = True
+
+    def _save_temporary_password(self, password, encoded_password, **kwargs):
         new_kwargs = kwargs.copy()
-        if new_kwargs.pop("send_email", False):
-            new_kwargs.setdefault("subject", PASSWORD_RESET_REQUEST_SUBJECT)
-            self._send_email("email-request-password-reset", {"password": password}, **new_kwargs)
-        return password
+        # the email is queued (in the outbox) in the same transaction as the temporary password it contains or, sent
+        # once the transaction is committed
+        with transaction.atomic():
+            apps.get_model(AUTH_APP_LABEL, "Security").objects.upsert(
+                self,
+                temporary_password=encoded_password,
+                temporary_password_generation_time=timezone.localtime() if settings.USE_TZ else timezone.now(),
+            )
+
+            if new_kwargs.pop("send_email", False):
+                new_kwargs.setdefault("subject", PASSWORD_RESET_REQUEST_SUBJECT)
+                self._send_email("email-request-password-reset", {"password": password}, **new_kwargs)
 
-    request_password_reset.alters_data = True
+        self._flag_password_reset()
 
     def request_verification(self, **kwargs):
         if self.is_verified:
             return
 
         code = self.__class__.objects.make_random_password(self.__class__.VERIFICATION_CODE_LENGTH, "23456789")
+        self._save_verification_code(code, make_secret(code), **kwargs)
+        return code
 
-        apps.get_model(AUTH_APP_LABEL, "Security").objects.update_or_create(
-            user=self,
-            defaults={
-                "verification_code": make_password(code),
-                "verification_code_generation_time": timezone.localtime if settings.USE_TZ else timezone.now,
-            },
-        )
+    request_verification.alters_data = True
 
-        new_kwargs = kwargs.copy()
-        if new_kwargs.pop("send_email", False):
-            new_kwargs.setdefault("subject", VERIFICATION_REQUEST_SUBJECT)
-            self._send_email("email-request-verification", {"code": code}, **new_kwargs)
+    async def arequest_verification(self, **kwargs):
+        """Async `request_verification(...)`. The verification code is hashed outside the event loop"""
+        if self.is_verified:
+            return
+
+        code = self.__class__.objects.make_random_password(self.__class__.VERIFICATION_CODE_LENGTH, "23456789")
+        encoded = await amake_secret(code)
+        await sync_to_async(self._save_verification_code)(code, encoded, **kwargs)
         return code
 
-    request_verification.alters_data = True
+    arequest_verification.alters_data = True
+
+    @classmethod
+    def request_verification_codes(cls, users, **kwargs):
+        """
+        Bulk `request_verification(...)` that issues verification codes to the `users` that are not verified with a
+        single statement.
+
+        :return: `dict` of the users mapped to their verification codes.
+        """
+        codes = {
+            user: cls.objects.make_random_password(cls.VERIFICATION_CODE_LENGTH, "23456789")
+            for user in users
+            if not user.is_verified
+        }
+        security_model = apps.get_model(AUTH_APP_LABEL, "Security")
+        generation_time = timezone.localtime() if settings.USE_TZ else timezone.now()
+        securities = [
+            security_model(
+                user_id=user.pk, verification_code=make_secret(code), verification_code_generation_time=generation_time
+            )
+            for user, code in codes.items()
+        ]
+
+        new_kwargs = kwargs.copy()
+        with transaction.atomic():
+            security_model.objects.bulk_upsert(securities, ["verification_code", "verification_code_generation_time"])
+
+            if new_kwargs.pop("send_email", False):
+                new_kwargs.setdefault("subject", VERIFICATION_REQUEST_SUBJECT)
+                cls._send_emails(
+                    "email-request-verification", [(user, {"code": code}) for user, code in codes.items()], **new_kwargs
+                )
+        return codes
+
+    def _save_verification_code(self, code, encoded_code, **kwargs):
+        new_kwargs = kwargs.copy()
+        with transaction.atomic():
+            apps.get_model(AUTH_APP_LABEL, "Security").objects.upsert(
+                self,
+                verification_code=encoded_code,
+                verification_code_generation_time=timezone.localtime() if settings.USE_TZ else timezone.now(),
+            )
+
+            if new_kwargs.pop("send_email", False):
+                new_kwargs.setdefault("subject", VERIFICATION_REQUEST_SUBJECT)
+                self._send_email("email-request-verification", {"code": code}, **new_kwargs)
 
     def set_password(self, raw_password):
         try:
@@ -170,9 +259,25 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
             raise DrfValidationError({"password": error.messages})
         super().set_password(raw_password)
 
+    def _is_secret_expired(self, generation_time, subject):
+        """Whether a secret (code or temporary password) has outlived the token of `subject` issued along with it"""
+        if generation_time is None:
+            return False
+        expiry_period = {**Token.DEFAULT_TOKEN_EXPIRY_TIME_DELTAS, **TOKEN_EXPIRY}[subject]
+        return timezone.now() >= generation_time + expiry_period
+
+    def _check_temporary_password(self, password, security):
+        if self._is_secret_expired(security.temporary_password_generation_time, "password-reset"):
+            return False
+        return check_secret(password, security.temporary_password)
+
     def reset_password(self, old_password, new_password, is_change=False) -> bool:
         try:
-            matched = check_password(old_password, self.password if is_change else self.security.temporary_password)
+            with timer("password_check"):
+                if is_change:
+                    matched = check_password(old_password, self.password)
+                else:
+                    matched = self._check_temporary_password(old_password, self.security)
         except ObjectDoesNotExist:
             return False
         else:
@@ -183,9 +288,50 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
 
     reset_password.alters_data = True
 
+    async def _aget_security(self):
+        # `self.security` cannot be lazily loaded from the event loop
+        return await apps.get_model(AUTH_APP_LABEL, "Security").objects.aget(user=self)
+
+    async def areset_password(self, old_password, new_password, is_change=False) -> bool:
+        """Async `reset_password(...)`. Passwords are checked and hashed outside the event loop"""
+        if is_change:
+            matched = await sync_to_async(check_password, thread_sensitive=False)(old_password, self.password)
+        else:
+            try:
+                security = await self._aget_security()
+            except ObjectDoesNotExist:
+                return False
+            if self._is_secret_expired(security.temporary_password_generation_time, "password-reset"):
+                return False
+            matched = await acheck_secret(old_password, security.temporary_password)
+        if matched:
+            await sync_to_async(self.set_password, thread_sensitive=False)(new_password)
+            await self.asave(update_fields=["password"])
+        return matched
+
+    areset_password.alters_data = True
+
+    async def acheck_password(self, raw_password):
+        """Async `check_password(...)`. The password is checked (and re-hashed if need be) outside the event loop"""
+        upgraded = []
+        matched = await sync_to_async(check_password, thread_sensitive=False)(
+            raw_password, self.password, upgraded.append
+        )
+        if upgraded:
+            # the password was hashed with an outdated hasher (or its parameters)
+            self.password = await sync_to_async(make_password, thread_sensitive=False)(raw_password)
+            await self.asave(update_fields=["password"])
+        return matched
+
+    def _check_verification_code(self, code, security):
+        if self._is_secret_expired(security.verification_code_generation_time, "verification"):
+            return False
+        return check_secret(code, security.verification_code)
+
     def verify(self, code) -> bool:
         try:
-            matched = check_password(code, self.security.verification_code)
+            with timer("verification_code_check"):
+                matched = self._check_verification_code(code, self.security)
         except ObjectDoesNotExist:
             return False
         else:
@@ -196,46 +342,159 @@ class AbstractUser(AbstractBaseUser, PermissionsMixin):
 
     verify.alters_data = True
 
+    async def averify(self, code) -> bool:
+        """Async `verify(...)`. The code is checked outside the event loop"""
+        try:
+            security = await self._aget_security()
+        except ObjectDoesNotExist:
+            return False
+        if self._is_secret_expired(security.verification_code_generation_time, "verification"):
+            return False
+        matched = await acheck_secret(code, security.verification_code)
+        if matched:
+            self.is_verified = True
+            await self.asave(update_fields=["is_verified"])
+        return matched
+
+    averify.alters_data = True
+
     def add_security_question(self, security_question, security_question_answer):
         encrypted_answer = make_password(security_question_answer)
-        apps.get_model(AUTH_APP_LABEL, "Security").objects.update_or_create(
-            user=self,
-            defaults={
-                "security_question": security_question,
-                "security_question_answer": encrypted_answer,
-            },
+        apps.get_model(AUTH_APP_LABEL, "Security").objects.upsert(
+            self,
+            security_question=security_question,
+            security_question_answer=encrypted_answer,
         )
 
     add_security_question.alters_data = True
 
-    def _send_email(self, template_name, context=None, subject=None, **kwargs):
+    def make_email(self, template_name, context=None, subject=None, request=None):
+        """
+        Return the email rendered (by `xauth.mail.email_renderer`) from the `xauth/<template_name>.txt` (and, if it
+        exists, `.html`) template or `None` if the user has no email address.
+        """
         if not hasattr(self, "email"):
             return
-        context = context if context else {}
+        context = {**context} if context else {}
         context["user"] = self
         context.setdefault("subject", subject)
         context.setdefault("app_name", APP_NAME)
 
-        request = kwargs.get("request")
+        body, html = email_renderer.render(template_name, context, request=request)
         mail = EmailMultiAlternatives(
             subject=f"{settings.EMAIL_SUBJECT_PREFIX}{subject}",
             to=[self.email],
             reply_to=REPLY_TO_ACCOUNTS_EMAIL_ADDRESSES,
-            body=render_to_string(f"xauth/{template_name}.txt", context=context, request=request),
+            body=body,
         )
-        try:
-            html = render_to_string(f"xauth/{template_name}.html", context=context, request=request)
+        if html is not None:
             mail.attach_alternative(html, "text/html")
-        except TemplateDoesNotExist:
-            pass
+        return mail
 
-        if kwargs.get("sync", False):
-            return mail.send()
-        return threading.Thread(target=mail.send).start()
+    @classmethod
+    def _send_emails(cls, template_name, recipients, subject=None, **kwargs):
+        """
+        `_send_email(...)` to each of the `(user, context)` `recipients`, queued with a single insert if need be or,
+        sent once the transaction is committed
+        """
+        if EMAIL_OUTBOX and not kwargs.get("sync", False):
+            outbox_model = apps.get_model(AUTH_APP_LABEL, "EmailOutbox")
+            outbox_model.objects.bulk_create(
+                [
+                    outbox_model(
+                        user=user,
+                        template_name=template_name,
+                        subject=str(subject or ""),
+                        context=context,
+                        language=translation.get_language() or "",
+                    )
+                    for user, context in recipients
+                    if hasattr(user, "email")
+                ]
+            )
+            return
+
+        def send():
+            for user, context in recipients:
+                user._send_email(template_name, context, subject, **kwargs)
+
+        # sent once the users' secrets are committed, e.g. after a chunk of `xauth_import_users`
+        transaction.on_commit(send)
+
+    def _send_email(self, template_name, context=None, subject=None, **kwargs):
+        if not hasattr(self, "email"):
+            return
+
+        if EMAIL_OUTBOX and not kwargs.get("sync", False):
+            # rendered and sent by the `dispatch_xauth_outbox` command
+            apps.get_model(AUTH_APP_LABEL, "EmailOutbox").objects.create(
+                user=self,
+                template_name=template_name,
+                subject=str(subject or ""),
+                context=context or {},
+                language=translation.get_language() or "",
+            )
+            return
+
+        def send():
+            with timer("send_email"):
+                mail = self.make_email(template_name, context, subject, request=kwargs.get("request"))
+                if kwargs.get("sync", False):
+                    mail.send()
+                else:
+                    get_email_delivery().deliver(mail)
 
-    @cached_property
+        # sent once the secret in the email is committed, i.e. at once outside of a transaction. Neither is the
+        # transaction held open while the email is sent nor, is an email sent for a secret that is rolled back
+        transaction.on_commit(send)
+
+    @property
     def token_payload(self):
-        return {"id": self.signed_id}
+        payload = {"id": self.signed_id}
+        if TOKEN_USER_ATTRIBUTES:
+            payload["user"] = self.get_token_user_attributes()
+        return payload
+
+    def get_token_user_attributes(self):
+        """
+        Return the attributes (listed in `XAUTH_TOKEN_USER_ATTRIBUTES`) to be embedded in the user's tokens to allow
+        authentication of the user without a database query. Values that are not JSON-serializable are converted to
+        strings and converted back by the `to_python(...)` method of the corresponding field during authentication.
+        """
+        attributes = {}
+        for name in TOKEN_USER_ATTRIBUTES:
+            value = getattr(self, name)
+            attributes[name] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        return attributes
+
+    @classmethod
+    def from_token_user_attributes(cls, attributes):
+        """Reverse of `get_token_user_attributes()`"""
+        values = {}
+        for name in TOKEN_USER_ATTRIBUTES:
+            if name not in attributes:
+                continue
+            try:
+                field = cls._meta.pk if name == "pk" else cls._meta.get_field(name)
+            except FieldDoesNotExist:
+                values[name] = attributes[name]
+            else:
+                values[name] = field.to_python(attributes[name])
+        return values
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Remove a saved (e.g. by `verify`, `reset_password` or `activate_account`) or deleted user from `user_cache`.
+    The user is removed again once the transaction commits in case it was re-cached by a concurrent look-up.
+    """
+    if user_cache:
+        user_cache.delete(sender, instance.pk)
+        transaction.on_commit(lambda: user_cache.delete(sender, instance.pk))
+
+
+post_save.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL, dispatch_uid="xauth_user_cache")
+post_delete.connect(invalidate_cached_user, sender=settings.AUTH_USER_MODEL, dispatch_uid="xauth_user_cache")
 
 
 class AbstractSecurityQuestion(models.Model):
@@ -264,7 +523,101 @@ class AbstractSecurity(models.Model):
     verification_code_generation_time = models.DateTimeField(blank=True, null=True)
     account_deactivation_time = models.DateTimeField(blank=True, null=True)
 
+    objects = SecurityManager()
+
     class Meta:
         abstract = True
         app_label = AUTH_APP_LABEL
         unique_together = ("user", "security_question")
+
+
+class AbstractEmailOutbox(models.Model):
+    """
+    Email queued to be rendered and sent by the `dispatch_xauth_outbox` command. Rows are deleted once the email is
+    sent since the `context` can hold secrets e.g. a temporary password. Emails that were never sent are deleted by
+    the `xauth_prune_tokens` command once their secrets have expired.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    template_name = models.CharField(max_length=150)
+    subject = models.CharField(max_length=255, blank=True)
+    context = models.JSONField(default=dict, blank=True)
+    # language the email was requested in (and the subject translated to), rendered in `settings.LANGUAGE_CODE` if blank
+    language = models.CharField(max_length=15, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = EmailOutboxManager()
+
+    class Meta:
+        abstract = True
+        app_label = AUTH_APP_LABEL
+
+    def __str__(self):
+        return f"{self.template_name} to {self.user_id}"
+
+
+class AbstractRefreshToken(models.Model):
+    """
+    Opaque, long-lived token exchanged for a new (access) token by the `refresh` action. Only a hash of the token is
+    stored. Tokens rotated from one another share a `family` that is revoked as a whole when one of its tokens is reused.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    token_hash = models.CharField(max_length=64, unique=True)
+    family = models.UUIDField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    used_at = models.DateTimeField(blank=True, null=True)
+    revoked_at = models.DateTimeField(blank=True, null=True)
+
+    objects = RefreshTokenManager()
+
+    class Meta:
+        abstract = True
+        app_label = AUTH_APP_LABEL
+
+    def __str__(self):
+        return f"{self.family} of {self.user_id}"
+
+
+class AbstractRevokedToken(models.Model):
+    """
+    Token (identified by its `jti` claim) rejected by `JWTAuthentication` until it expires. Rows are read in primary key
+    order by the in-process denylist of `xauth.revocation`.
+    """
+
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RevokedTokenManager()
+
+    class Meta:
+        abstract = True
+        app_label = AUTH_APP_LABEL
+
+    def __str__(self):
+        return self.jti
+
+
+class AbstractStoredKey(models.Model):
+    """
+    Version (`kid`) of a signing or encryption key stored by `xauth.accounts.token.stores.DatabaseKeyStore`. `data` is
+    the key exported as (password protected) PEM or as JSON.
+    """
+
+    name = models.CharField(max_length=64)
+    key_format = models.CharField(max_length=8)
+    kid = models.CharField(max_length=64)
+    data = models.TextField()
+    created = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        app_label = AUTH_APP_LABEL
+        unique_together = [("name", "key_format", "kid")]
+
+    def __str__(self):
+        return f"{self.name}:{self.kid}"
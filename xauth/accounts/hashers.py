@@ -0,0 +1,124 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, check_password
+from django.utils.crypto import salted_hmac, get_random_string, constant_time_compare
+from django.utils.module_loading import import_string
+
+from xauth.internal_settings import SECRET_HASHER
+
+__all__ = [
+    "SecretHasher",
+    "PasswordSecretHasher",
+    "HMACSecretHasher",
+    "get_secret_hasher",
+    "make_secret",
+    "check_secret",
+    "amake_secret",
+    "acheck_secret",
+]
+
+
+class SecretHasher:
+    """
+    Hashes short-lived secrets i.e. verification codes and temporary passwords. Secrets hashed by any of the hashers
+    are checked by `check_secret(...)` regardless of the hasher in use.
+
+    A hasher with an `algorithm` encodes secrets as `"<algorithm>$..."` so that `check_secret(...)` can tell the secrets
+    it has to verify from (e.g. password) hashes left by other hashers.
+    """
+
+    algorithm = None
+
+    def encode(self, secret):
+        raise NotImplementedError
+
+    def verify(self, secret, encoded):
+        raise NotImplementedError
+
+    @classmethod
+    def is_encoded(cls, encoded):
+        """Return `True` if `encoded` is a secret encoded by the hasher"""
+        return cls.algorithm is not None and isinstance(encoded, str) and encoded.startswith(f"{cls.algorithm}$")
+
+
+class PasswordSecretHasher(SecretHasher):
+    """Hashes secrets like passwords i.e. with the first of `settings.PASSWORD_HASHERS`"""
+
+    def encode(self, secret):
+        return make_password(secret)
+
+    def verify(self, secret, encoded):
+        return check_password(secret, encoded)
+
+
+class HMACSecretHasher(SecretHasher):
+    """
+    Hashes secrets with (a salted) HMAC-SHA256 keyed by `settings.SECRET_KEY`. Unlike password hashers, it is not
+    deliberately slow: the secrets it is meant for expire within minutes and the HMAC cannot be computed without the
+    key. Secrets hashed with a key in `settings.SECRET_KEY_FALLBACKS` are still verified.
+    """
+
+    algorithm = "xauth_hmac_sha256"
+    key_salt = "xauth.accounts.hashers.HMACSecretHasher"
+
+    def _digest(self, salt, secret, key):
+        return salted_hmac(self.key_salt, f"{salt}${secret}", secret=key, algorithm="sha256").hexdigest()
+
+    def encode(self, secret):
+        salt = get_random_string(12)
+        return f"{self.algorithm}${salt}${self._digest(salt, secret, settings.SECRET_KEY)}"
+
+    def verify(self, secret, encoded):
+        try:
+            algorithm, salt, digest = encoded.split("$", 2)
+        except (AttributeError, ValueError):
+            return False
+        if algorithm != self.algorithm or secret is None:
+            return False
+        keys = [settings.SECRET_KEY, *getattr(settings, "SECRET_KEY_FALLBACKS", [])]
+        # every key is tried to not reveal which of them matched through timing
+        return any([constant_time_compare(self._digest(salt, secret, key), digest) for key in keys])
+
+
+_secret_hasher = None
+
+
+def get_secret_hasher():
+    """Return the hasher configured by `XAUTH_SECRET_HASHER`"""
+    global _secret_hasher
+    if _secret_hasher is None:
+        _secret_hasher = import_string(SECRET_HASHER)()
+    return _secret_hasher
+
+
+def make_secret(secret):
+    return get_secret_hasher().encode(secret)
+
+
+def check_secret(secret, encoded):
+    """
+    Check `secret` against `encoded` by the configured hasher or `HMACSecretHasher`, falling back to Django's
+    `check_password(...)` e.g. for secrets hashed by `PasswordSecretHasher`
+    """
+    if encoded is None:
+        return False
+    hasher = get_secret_hasher()
+    if hasher.is_encoded(encoded):
+        return hasher.verify(secret, encoded)
+    if HMACSecretHasher.is_encoded(encoded):  # e.g. hashed before another hasher was configured
+        return HMACSecretHasher().verify(secret, encoded)
+    return check_password(secret, encoded)
+
+
+async def amake_secret(secret):
+    """Async `make_secret(...)`. Secrets are hashed outside the event loop unless hashed with `HMACSecretHasher`"""
+    if isinstance(get_secret_hasher(), HMACSecretHasher):
+        return make_secret(secret)
+    return await sync_to_async(make_secret, thread_sensitive=False)(secret)
+
+
+async def acheck_secret(secret, encoded):
+    """Async `check_secret(...)`. Password hashes are checked outside the event loop"""
+    if encoded is None or HMACSecretHasher.is_encoded(encoded):
+        return check_secret(secret, encoded)
+    return await sync_to_async(check_secret, thread_sensitive=False)(secret, encoded)
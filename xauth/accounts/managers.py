@@ -1,6 +1,19 @@
+import logging
+import secrets
+import uuid
+from hashlib import sha256
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, connections, transaction
+from django.utils import timezone
+from xently.core.loading import get_class
+
+from xauth.internal_settings import AUTH_APP_LABEL, REFRESH_TOKEN_EXPIRY, TOKEN_EXPIRY
+
+__all__ = ["UserManager", "SecurityManager", "EmailOutboxManager", "RefreshTokenManager", "RevokedTokenManager"]
 
-__all__ = ["UserManager"]
+logger = logging.getLogger(__name__)
 
 
 class UserManager(BaseUserManager):
@@ -26,6 +39,14 @@ class UserManager(BaseUserManager):
             user.save(using=self._db)
         return user
 
+    async def acreate_user(self, **kwargs):
+        """Async `create_user(...)`. The password is hashed outside the event loop"""
+        commit = kwargs.pop("save_record", True)
+        user = await sync_to_async(self.create_user, thread_sensitive=False)(save_record=False, **kwargs)
+        if commit:
+            await user.asave(using=self._db)
+        return user
+
     def create_superuser(self, password, **kwargs):
         if not password:
             raise ValueError("superuser password is required")
@@ -37,3 +58,113 @@ class UserManager(BaseUserManager):
         if commit:
             user.save(using=self._db)
         return user
+
+
+class SecurityManager(models.Manager):
+    def upsert(self, user, **values):
+        """
+        Create `user`'s security with `values` or, if it exists, update it with `values` in a single statement
+        """
+        self.bulk_upsert([self.model(user_id=user.pk, **values)], list(values))
+        # the user's cached security (if any) is outdated
+        field = user._meta.get_field("security")
+        if field.is_cached(user):
+            field.delete_cached_value(user)
+
+    def bulk_upsert(self, securities, update_fields):
+        """
+        Insert the (unsaved) `securities` updating the `update_fields` of the securities that already exist instead,
+        with a single `INSERT ... ON CONFLICT DO UPDATE` statement on databases that support it.
+        """
+        features = connections[self.db].features
+        if features.supports_update_conflicts_with_target:
+            self.bulk_create(securities, update_conflicts=True, unique_fields=["user"], update_fields=update_fields)
+        elif features.supports_update_conflicts:
+            # e.g. MySQL's `INSERT ... ON DUPLICATE KEY UPDATE`
+            self.bulk_create(securities, update_conflicts=True, update_fields=update_fields)
+        else:
+            with transaction.atomic(using=self.db):
+                for security in securities:
+                    self.update_or_create(
+                        user_id=security.user_id,
+                        defaults={field: getattr(security, field) for field in update_fields},
+                    )
+
+
+class EmailOutboxManager(models.Manager):
+    def prune(self):
+        """
+        Delete the (unsent) emails queued before the secrets they hold i.e. verification codes and temporary passwords
+        expired, including the emails that were attempted too many times. Return the number of deleted emails
+        """
+        token_class = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")
+        expiry = {**token_class.DEFAULT_TOKEN_EXPIRY_TIME_DELTAS, **TOKEN_EXPIRY}
+        expired_at = timezone.now() - max(expiry["verification"], expiry["password-reset"])
+        return self.filter(created_at__lte=expired_at).delete()[0]
+
+
+class RefreshTokenManager(models.Manager):
+    @staticmethod
+    def hash_token(token):
+        # refresh tokens are random (256 bits) hence, unlike passwords, need neither a salt nor a slow hash
+        return sha256(token.encode()).hexdigest()
+
+    def issue(self, user, family=None):
+        """Create a refresh token for `user` and return its (opaque) value. Only a hash of the value is stored"""
+        token = secrets.token_urlsafe(32)
+        self.create(
+            user=user,
+            token_hash=self.hash_token(token),
+            family=family or uuid.uuid4(),
+            expires_at=timezone.now() + REFRESH_TOKEN_EXPIRY,
+        )
+        return token
+
+    def rotate(self, token):
+        """
+        Exchange `token` for a new refresh token of the same family, looking it up by its (indexed) hash.
+
+        A token is exchanged at most once. A token that was already exchanged (i.e. reused, most likely after being
+        stolen) revokes its whole family, logging out both the thief and the token's legitimate owner.
+
+        :return: `tuple` of the token's user and the new token or, `None` if `token` is unknown, expired or revoked.
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            queryset = self.select_for_update()
+            if connections[self.db].features.has_select_for_update_of:
+                queryset = self.select_for_update(of=("self",))
+            try:
+                refresh_token = queryset.select_related("user").get(token_hash=self.hash_token(token))
+            except self.model.DoesNotExist:
+                return None
+            if refresh_token.revoked_at is not None or refresh_token.expires_at <= now:
+                return None
+            if refresh_token.used_at is not None:
+                logger.warning("Refresh token reused. Revoking refresh tokens of family %s", refresh_token.family)
+                self.filter(family=refresh_token.family, revoked_at__isnull=True).update(revoked_at=now)
+                return None
+            if not refresh_token.user.is_active:
+                return None
+            refresh_token.used_at = now
+            refresh_token.save(update_fields=["used_at"])
+            return refresh_token.user, self.issue(refresh_token.user, family=refresh_token.family)
+
+    def revoke(self, token):
+        """Revoke the family of `token` e.g. when its user signs out. Return the number of revoked tokens"""
+        family = self.filter(token_hash=self.hash_token(token)).values("family")
+        return self.filter(family__in=family, revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+    def prune(self):
+        """Delete expired refresh tokens. Return the number of deleted tokens"""
+        return self.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+class RevokedTokenManager(models.Manager):
+    def revoke(self, jti, expires_at):
+        """Add the token identified by `jti` (claim) to the denylist until `expires_at`, the token's expiry"""
+        self.bulk_create([self.model(jti=jti, expires_at=expires_at)], ignore_conflicts=True)
+
+    def prune(self):
+        """Delete tokens that have expired (hence are rejected regardless). Return the number of deleted tokens"""
+        return self.filter(expires_at__lte=timezone.now()).delete()[0]
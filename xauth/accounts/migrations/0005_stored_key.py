@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0004_revoked_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredKey",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=64)),
+                ("key_format", models.CharField(max_length=8)),
+                ("kid", models.CharField(max_length=64)),
+                ("data", models.TextField()),
+                ("created", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "abstract": False,
+                "unique_together": {("name", "key_format", "kid")},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0005_stored_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailoutbox",
+            name="language",
+            field=models.CharField(blank=True, max_length=15),
+        ),
+    ]
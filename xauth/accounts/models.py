@@ -5,6 +5,10 @@ from xauth.accounts.abstract_models import (
     AbstractUser,
     AbstractSecurityQuestion,
     AbstractSecurity,
+    AbstractEmailOutbox,
+    AbstractRefreshToken,
+    AbstractRevokedToken,
+    AbstractStoredKey,
 )
 from xauth.internal_settings import AUTH_APP_LABEL
 
@@ -43,3 +47,31 @@ if not is_model_registered(AUTH_APP_LABEL, "Security"):
         pass
 
     __all__.append("Security")
+
+if not is_model_registered(AUTH_APP_LABEL, "EmailOutbox"):
+
+    class EmailOutbox(AbstractEmailOutbox):
+        pass
+
+    __all__.append("EmailOutbox")
+
+if not is_model_registered(AUTH_APP_LABEL, "RefreshToken"):
+
+    class RefreshToken(AbstractRefreshToken):
+        pass
+
+    __all__.append("RefreshToken")
+
+if not is_model_registered(AUTH_APP_LABEL, "RevokedToken"):
+
+    class RevokedToken(AbstractRevokedToken):
+        pass
+
+    __all__.append("RevokedToken")
+
+if not is_model_registered(AUTH_APP_LABEL, "StoredKey"):
+
+    class StoredKey(AbstractStoredKey):
+        pass
+
+    __all__.append("StoredKey")
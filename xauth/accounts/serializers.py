@@ -4,7 +4,7 @@ from django.db.transaction import atomic
 from rest_framework import serializers
 from rest_framework.fields import empty
 
-from xauth.internal_settings import AUTH_APP_LABEL
+from xauth.internal_settings import AUTH_APP_LABEL, TOKEN_VARIANTS
 
 __all__ = [
     "ProfileSerializer",
@@ -14,11 +14,14 @@ __all__ = [
     "AccountVerificationSerializer",
     "AccountActivationSerializer",
     "AddSecurityQuestionSerializer",
+    "RefreshTokenSerializer",
 ]
 
 
 class ProfileSerializer(serializers.HyperlinkedModelSerializer):
-    token = serializers.JSONField(source="token.tokens", read_only=True)
+    token = serializers.SerializerMethodField()
+    # Query parameter through which a request can pick (comma-separated) token variants e.g. `?token=encrypted`
+    token_variants_query_param = "token"
 
     def __init__(self, instance=None, data=empty, **kwargs):
         super().__init__(instance, data, **kwargs)
@@ -42,6 +45,27 @@ class ProfileSerializer(serializers.HyperlinkedModelSerializer):
             "password": dict(style={"input_type": "password"}),
         }
 
+    def get_token_variants(self):
+        """
+        Return the token variants to include in the response. Defaults to `XAUTH_TOKEN_VARIANTS`, optionally narrowed
+        down by the request's `token_variants_query_param`. Unknown variants in the query parameter are ignored.
+        """
+        request = self.context.get("request")
+        requested = request.query_params.get(self.token_variants_query_param) if request is not None else None
+        if requested:
+            variants = [variant for variant in requested.split(",") if variant in TOKEN_VARIANTS]
+            if variants:
+                return variants
+        return TOKEN_VARIANTS
+
+    def get_token(self, obj):
+        tokens = obj.token.get_tokens(self.get_token_variants())
+        # refresh token issued by the view e.g. on sign in
+        refresh_token = self.context.get("refresh_token")
+        if refresh_token:
+            tokens["refresh"] = refresh_token
+        return tokens
+
     @atomic
     def create(self, validated_data):
         password = validated_data.pop("password")
@@ -79,6 +103,10 @@ class AccountActivationSerializer(serializers.Serializer):
     security_question_answer = serializers.CharField(write_only=True)
 
 
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh = serializers.CharField(write_only=True)
+
+
 class SecurityQuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = apps.get_model(AUTH_APP_LABEL, "SecurityQuestion")
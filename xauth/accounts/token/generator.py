@@ -1,17 +1,26 @@
 import json
+import uuid
 from datetime import timedelta
+from hashlib import sha256
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.utils import timezone
 from jwcrypto import jwt
 from xently.core.loading import get_class
 
-from xauth.internal_settings import TOKEN_EXPIRY, AUTH_APP_LABEL
+from xauth.cache import LRUCache
+from xauth.instrumentation import timer
+from xauth.internal_settings import TOKEN_EXPIRY, AUTH_APP_LABEL, TOKEN_CLAIMS_CACHE_SIZE, TOKEN_CLAIMS_CACHE_TTL
 
-__all__ = ["Token"]
+__all__ = ["Token", "claims_cache"]
+
+# Claims of verified tokens keyed by a digest of the (raw) token
+claims_cache = LRUCache(maxsize=TOKEN_CLAIMS_CACHE_SIZE, ttl=TOKEN_CLAIMS_CACHE_TTL)
 
 
 class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
+    VARIANTS = ("encrypted", "unencrypted")
     DEFAULT_TOKEN_EXPIRY_TIME_DELTAS = {
         "access": timedelta(days=1),
         "activation": timedelta(minutes=30),
@@ -27,6 +36,8 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
         self.payload = payload
         self.payload_key = payload_key or "payload"
         self.activation_date = activation_date
+        # unique identifier of the token e.g. for revoking it
+        self.jti = uuid.uuid4().hex
         self.expiry_period = expiry_period or {
             **self.__class__.DEFAULT_TOKEN_EXPIRY_TIME_DELTAS,
             **TOKEN_EXPIRY,
@@ -38,13 +49,13 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
     @property
     def unencrypted(self):
         if self._unencrypted is None:
-            self.refresh()
+            self._unencrypted = self._make_signed_token()
         return self._unencrypted
 
     @property
     def encrypted(self):
         if self._encrypted is None:
-            self.refresh()
+            self._encrypted = self._make_encrypted_token(self.unencrypted)
         return self._encrypted
 
     @property
@@ -61,6 +72,7 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
             "exp": expiry_secs,
             "iat": int(issue_date.strftime("%s")),
             "sub": self.subject,
+            "jti": self.jti,
         }
 
     @property
@@ -73,9 +85,18 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
 
     @property
     def tokens(self):
-        if not self.unencrypted or not self.encrypted:
-            self.refresh()
-        return {"encrypted": self.encrypted, "unencrypted": self.unencrypted}
+        return self.get_tokens()
+
+    def get_tokens(self, variants=None):
+        """
+        Return a `dict` of the token `variants` (any of `VARIANTS`) mapped to the token. Only the variants requested
+        are created e.g. the unencrypted token is not encrypted unless the `encrypted` variant is requested.
+        """
+        return {variant: getattr(self, variant) for variant in variants or self.VARIANTS}
+
+    async def aget_tokens(self, variants=None):
+        """Async `get_tokens(...)`. Tokens are signed (and encrypted) outside the event loop"""
+        return await sync_to_async(self.get_tokens, thread_sensitive=False)(variants)
 
     def get_claims(self, token=None, is_encrypted=None):
         if is_encrypted is None:
@@ -89,11 +110,44 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
         assert token is not None, "Call .refresh() first or provide a token"
         token = token.decode() if isinstance(token, bytes) else token
 
+        if not claims_cache:
+            return json.loads(self._get_verified_claims(token, is_encrypted))
+
+        # The cache holds serialized claims so that the claims returned cannot be modified from the outside
+        cache_key = sha256(f"{int(is_encrypted)}{token}".encode()).digest()
+        serialized_claims = claims_cache.get(cache_key)
+        if serialized_claims is not None:
+            return json.loads(serialized_claims)
+
+        serialized_claims = self._get_verified_claims(token, is_encrypted)
+        claims = json.loads(serialized_claims)
+        # The claims are only cached for as long as the token itself is valid
+        claims_cache.set(cache_key, serialized_claims, expires_at=claims.get("exp"))
+        return claims
+
+    async def aget_claims(self, token=None, is_encrypted=None):
+        """Async `get_claims(...)`. Tokens are decrypted and verified outside the event loop"""
+        return await sync_to_async(self.get_claims, thread_sensitive=False)(token, is_encrypted)
+
+    def _get_verified_claims(self, token, is_encrypted):
         try:
-            token = jwt.JWT(key=self.encryption_key, jwt=token).claims if is_encrypted else token
+            if is_encrypted:
+                with timer("token_decrypt"):
+                    token = self._validate(token, self.get_decryption_key).claims
+            with timer("token_verify"):
+                return self._validate(token, self.get_verification_key).claims
         except ValueError:
             raise jwt.JWException
-        return json.loads(jwt.JWT(key=self.get_jwt_signing_keys()[1], jwt=token).claims)
+
+    @staticmethod
+    def _validate(token, get_key):
+        """Verify (or decrypt) `token` with the version of the key identified by the `kid` in the token's header"""
+        token = jwt.JWT(jwt=token)
+        key = get_key(token.token.jose_header.get("kid"))
+        if key is None:
+            raise jwt.JWTMissingKey
+        token.validate(key)
+        return token
 
     def get_payload(self, token=None, is_encrypted=None):
         try:
@@ -101,15 +155,24 @@ class Token(get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")):
         except AssertionError:
             return self.payload
 
+    def _make_signed_token(self):
+        signing_key_set = self.signing_key_set
+        header = {"alg": self.signing_algorithm, "typ": "JWT", "kid": signing_key_set.active_kid}
+        token = jwt.JWT(header, self.claims, check_claims=self.checked_claims, algs=self.ALLOWED_SIGNING_ALGORITHMS)
+        token.make_signed_token(key=signing_key_set.active_key)
+        return token.serialize()
+
+    def _make_encrypted_token(self, unencrypted):
+        encryption_key_set = self.encryption_key_set
+        header = {"alg": self.encryption_algorithm, "enc": "A256GCM", "kid": encryption_key_set.active_kid}
+        token = jwt.JWT(header=header, claims=unencrypted)
+        token.make_encrypted_token(key=encryption_key_set.active_key)
+        return token.serialize()
+
     def refresh(self):
-        header = {"alg": self.signing_algorithm, "typ": "JWT"}
+        self.jti = uuid.uuid4().hex
         # unencrypted token
-        token = jwt.JWT(header, self.claims, check_claims=self.checked_claims, algs=self.ALLOWED_SIGNING_ALGORITHMS)
-        token.make_signed_token(key=self.get_jwt_signing_keys()[0])
-        self._unencrypted = token.serialize()
-        header = {"alg": "ECDH-ES", "enc": "A256GCM"}
+        self._unencrypted = self._make_signed_token()
         # encrypted token
-        e_token = jwt.JWT(header=header, claims=self.unencrypted)
-        e_token.make_encrypted_token(key=self.encryption_key)
-        self._encrypted = e_token.serialize()
+        self._encrypted = self._make_encrypted_token(self._unencrypted)
         return self.tokens
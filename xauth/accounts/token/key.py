@@ -1,92 +1,185 @@
-import os
+import secrets
+import time
 from hashlib import md5
-from pathlib import Path
 
 from django.conf import settings
 from jwcrypto import jwk
 from jwcrypto.common import json_decode
 
-from xauth.internal_settings import MAKE_KEY_DIRS, KEYS_DIR, JWT_SIG_ALG
+from xauth.accounts.token.keyring import KeySet, keyring
+from xauth.accounts.token.stores import get_key_store
+from xauth.instrumentation import timer
+from xauth.internal_settings import JWT_SIG_ALG, JWE_ALG, KEY_RETIREMENT_PERIOD
 
 __all__ = ["TokenKey"]
 
 
+def _hashed_file_name(file_name):
+    return md5(file_name.encode(encoding="utf8", errors="replace")).hexdigest()
+
+
 class TokenKey:
-    ALLOWED_SIGNING_ALGORITHMS = ["RS256", "HS256"]
+    """
+    Provides the keys used to sign and encrypt tokens.
+
+    Each key is versioned and stored in the `key_store` (`XAUTH_KEY_STORE` by default) as PEM (or, for symmetric keys,
+    JSON): the initial version is identified by an md5-derived name and every version created by `rotate_keys()` by a
+    `kid` prefixed with the (unix) time the version was created. Keys are read from the store once per process and
+    again only once the store's version of the key changes.
+    """
 
-    def __init__(self, password=None, signing_algorithm=None):
+    ALLOWED_SIGNING_ALGORITHMS = ["RS256", "HS256", "ES256", "EdDSA"]
+    # Key management algorithms for token encryption. Content is always encrypted with `A256GCM`
+    ALLOWED_ENCRYPTION_ALGORITHMS = ["ECDH-ES", "dir", "A256KW"]
+
+    def __init__(self, password=None, signing_algorithm=None, encryption_algorithm=None, key_store=None):
         self.password = (password or settings.SECRET_KEY).encode()
+        self.key_store = key_store or get_key_store()
         self.signing_algorithm = signing_algorithm or JWT_SIG_ALG
         assert (
             self.signing_algorithm in self.__class__.ALLOWED_SIGNING_ALGORITHMS
         ), f"{self.signing_algorithm} must be one of {self.__class__.ALLOWED_SIGNING_ALGORITHMS}"
-        if MAKE_KEY_DIRS:
-            Path(KEYS_DIR).mkdir(parents=True, exist_ok=True)
-
-    def get_or_create_rs_256_key(self, file, key, is_private):
-        password = self.password if is_private else None
-        try:
-            # get key from .pem file contents
-            with open(file, "rb") as pem:
-                key = jwk.JWK.from_pem(pem.read(), password=password)
-        except FileNotFoundError:
-            with open(file, "wb") as pem:
-                # Write the key's to .pem file
-                pem.write(key.export_to_pem(private_key=is_private, password=password))
-        return key
-
-    def get_or_create_hs_256_key(self, file, key):
-        try:
-            with open(file, "rb") as key_file:
-                key = jwk.JWK(**json_decode(key_file.readline()))
-        except FileNotFoundError:
-            with open(file, "wb") as key_file:
-                key_file.write(key.export().encode())
-        return key
-
-    def _get_jwt_signing_or_encryption_key(self, is_private=True, is_encryption=False):
+        self.encryption_algorithm = encryption_algorithm or JWE_ALG
+        assert (
+            self.encryption_algorithm in self.__class__.ALLOWED_ENCRYPTION_ALGORITHMS
+        ), f"{self.encryption_algorithm} must be one of {self.__class__.ALLOWED_ENCRYPTION_ALGORITHMS}"
+
+    def _export(self, key, is_pem):
+        if is_pem:
+            return key.export_to_pem(private_key=True, password=self.password)
+        return key.export().encode()
+
+    def _import(self, data, is_pem):
+        if is_pem:
+            return jwk.JWK.from_pem(data, password=self.password)
+        return jwk.JWK(**json_decode(data.splitlines()[0]))
+
+    def _get_key_spec(self, is_encryption=False):
+        """
+        Return the (hashed) name, key generator and whether the key is stored as PEM (rather than JSON) for the
+        encryption key or, the signing key of the signing algorithm in use.
+        """
         if is_encryption:
-            file_name, key = "encryption_key", jwk.JWK.generate(kty="EC", alg="ECDH-ES", crv="P-256")
-        else:
-            file_name = "signing_key"
-            key_op = "verify"  # `Public Key` will be used for `verifying` the `token`
-            file_name += "_pub"  # `public` signing key `file name`
-            if is_private:
-                key_op = "sign"  # `Private Key` will be used for `signing` the `token`
-                file_name += "_pri"  # `private` signing key `file name`
-            key = jwk.JWK.generate(kty="RSA", key_ops=key_op, alg="RSA-OAEP", size=2048)
-
-        file_name = md5(file_name.encode(encoding="utf8", errors="replace")).hexdigest()
-        return self.get_or_create_rs_256_key(os.path.join(KEYS_DIR, f"{file_name}.pem"), key, is_private)
+            if self.encryption_algorithm != "ECDH-ES":
+                # 256-bit pre-shared key used either as the content encryption key (`dir`) or to wrap it (`A256KW`)
+                return (
+                    _hashed_file_name(f"encryption_key_{self.encryption_algorithm.lower()}"),
+                    lambda: jwk.JWK(generate="oct", size=256),
+                    False,
+                )
+            return (
+                _hashed_file_name("encryption_key"),
+                lambda: jwk.JWK.generate(kty="EC", alg="ECDH-ES", crv="P-256"),
+                True,
+            )
+        if self.signing_algorithm == "HS256":
+            return _hashed_file_name("signing_key"), lambda: jwk.JWK(generate="oct", size=256), False
+        if self.signing_algorithm == "ES256":
+            return (
+                _hashed_file_name("signing_key_es256"),
+                lambda: jwk.JWK.generate(kty="EC", crv="P-256", alg="ES256", key_ops=["sign", "verify"]),
+                True,
+            )
+        if self.signing_algorithm == "EdDSA":
+            # Ed25519 keys
+            return (
+                _hashed_file_name("signing_key_ed25519"),
+                lambda: jwk.JWK.generate(kty="OKP", crv="Ed25519", alg="EdDSA", key_ops=["sign", "verify"]),
+                True,
+            )
+        # `Private Key` will be used for `signing` the `token`
+        return (
+            _hashed_file_name("signing_key_pub_pri"),
+            lambda: jwk.JWK.generate(kty="RSA", key_ops="sign", alg="RSA-OAEP", size=2048),
+            True,
+        )
+
+    def _load_key_set(self, name, generate, is_pem):
+        key_format = "pem" if is_pem else "json"
+        versions = self.key_store.get_or_create(name, key_format, lambda: self._export(generate(), is_pem))
+        # A generated key is also read from its export to behave exactly like the key read by other processes
+        return KeySet(
+            [(kid, self._import(data, is_pem), created) for kid, data, created in versions],
+            retirement_period=KEY_RETIREMENT_PERIOD,
+        )
+
+    def _get_key_set_name(self, name, is_pem):
+        return self.key_store.location(name, "pem" if is_pem else "json"), self.password if is_pem else None
+
+    def _get_key_set(self, is_encryption=False, force_check=False):
+        name, generate, is_pem = self._get_key_spec(is_encryption=is_encryption)
+
+        def load():
+            with timer("key_load"):
+                return self._load_key_set(name, generate, is_pem)
+
+        return keyring.get(
+            self._get_key_set_name(name, is_pem),
+            load,
+            version=lambda: self.key_store.version(name, "pem" if is_pem else "json"),
+            force_check=force_check,
+        )
 
     @property
-    def encryption_key(self):
-        return self._get_jwt_signing_or_encryption_key(is_encryption=True)
+    def signing_key_set(self):
+        return self._get_key_set()
 
-    def get_jwt_signing_keys(self):
-        """
-        Return a `JWK` key for `JWT` token encryption or a `tuple` of JWK keys for `JWT` token signing
-        (`private` key, `public` key) depending on the signing algorithm used
-        :return: `JWK` key or `tuple` of `JWKs` keys
+    @property
+    def encryption_key_set(self):
+        return self._get_key_set(is_encryption=True)
+
+    def _get_key_version(self, kid, is_encryption=False):
+        key_set = self._get_key_set(is_encryption=is_encryption)
+        if kid is None:
+            # token issued before keys were versioned. Such tokens could only have been issued with the initial version
+            kid = self._get_key_spec(is_encryption=is_encryption)[0]
+            if kid not in key_set:
+                kid = key_set.active_kid
+        elif kid not in key_set:
+            # the key could have been rotated by another process (or node) that shares the key store. The key ring
+            # limits how often (unverified, possibly forged) `kid`s make it check the store. Unknown `kid`s are not
+            # cached: forged ones are unbounded and, a legitimate one would be rejected until the next reload
+            key_set = self._get_key_set(is_encryption=is_encryption, force_check=True)
+        return key_set.get(kid)
+
+    def get_verification_key(self, kid=None):
+        """Return the signing key version identified by `kid` or `None` if there is no such (unretired) version"""
+        return self._get_key_version(kid)
+
+    def get_decryption_key(self, kid=None):
+        """Return the encryption key version identified by `kid` or `None` if there is no such (unretired) version"""
+        return self._get_key_version(kid, is_encryption=True)
+
+    def rotate_keys(self):
         """
+        Create new versions of the signing (for the signing algorithm in use) and encryption keys. The new versions
+        are used to issue tokens from then on while the previous versions remain valid for verification until they
+        retire.
 
-        if self.signing_algorithm == "HS256":
-            # Default signing algorithm used when all else fails.
-            # `JWT` signing key
-            jwt_sig_key = self.get_or_create_hs_256_key(
-                Path(KEYS_DIR) / md5("signing_key".encode(encoding="utf8", errors="replace")).hexdigest(),
-                jwk.JWK(generate="oct", size=256),
+        :return: `tuple` of the `kid`s of the new (signing key, encryption key) versions.
+        """
+        kids = []
+        for is_encryption in (False, True):
+            name, generate, is_pem = self._get_key_spec(is_encryption=is_encryption)
+            self._get_key_set(is_encryption=is_encryption)  # makes sure the initial version exists
+            created = int(time.time())
+            kid = f"{created}-{secrets.token_hex(4)}"
+            self.key_store.create(
+                name, "pem" if is_pem else "json", kid, lambda: self._export(generate(), is_pem), created=created
             )
+            keyring.invalidate(self._get_key_set_name(name, is_pem))
+            kids.append(kid)
+        return tuple(kids)
+
+    @property
+    def encryption_key(self):
+        return self.encryption_key_set.active_key
 
-            # Public `JWT` signing key for `JWT` verification
-            jwt_pub_sig_key = jwt_sig_key
-            # Private `JWT` signing key for `JWT` signing
-            jwt_pri_sig_key = jwt_sig_key
-        else:
-            # Private `JWT` signing key for `JWT` signing
-            jwt_pri_sig_key = self._get_jwt_signing_or_encryption_key()
-            # Public `JWT` signing key for `JWT` verification
-            jwt_pub_sig_key = self._get_jwt_signing_or_encryption_key(False)
-
-        # Use the same key(private) for **signing** and **verifying** keys...
-        return jwt_pri_sig_key, jwt_pri_sig_key or jwt_pub_sig_key
+    def get_jwt_signing_keys(self):
+        """
+        Return a `tuple` of JWK keys for `JWT` token signing (`private` key, `public` key) of the active version of the
+        signing key. The same key is used for both signing and verification.
+        :return: `tuple` of `JWKs` keys
+        """
+        key = self.signing_key_set.active_key
+        return key, key
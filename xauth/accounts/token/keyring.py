@@ -0,0 +1,135 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from xauth.internal_settings import KEYS_FORCED_CHECK_INTERVAL, KEYS_RELOAD_INTERVAL
+
+__all__ = ["KeyRing", "KeySet", "keyring"]
+
+
+class KeySet:
+    """
+    Versions of a (signing or encryption) key indexed by their `kid`.
+
+    The most recently created version is the `active` one used to issue new tokens. Older versions remain usable for
+    verifying (or decrypting) tokens until `retirement_period` has elapsed since their successor was created, so that
+    rotating a key does not invalidate tokens that are still in circulation.
+    """
+
+    def __init__(self, versions, retirement_period=None):
+        """
+        :param versions: iterable of `(kid, key, created)` tuples where `created` is a unix timestamp.
+        :param retirement_period: `timedelta` for which a superseded key version stays valid for verification.
+            Superseded versions never retire if it is `None`.
+        """
+        versions = sorted(versions, key=lambda version: version[2])
+        assert versions, "A key set requires at least one key"
+        self.active_kid, self.active_key = versions[-1][:2]
+        self._keys = {}
+        self._retirement_times = {}
+        for (kid, key, _), successor in zip(versions, versions[1:] + [None]):
+            self._keys[kid] = key
+            if successor is not None and retirement_period is not None:
+                self._retirement_times[kid] = successor[2] + retirement_period.total_seconds()
+
+    def __contains__(self, kid):
+        return kid in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, kid):
+        """Return the key version identified by `kid` or `None` if there is no such version or it has retired."""
+        key = self._keys.get(kid)
+        if key is not None and time.time() >= self._retirement_times.get(kid, float("inf")):
+            return None
+        return key
+
+    def retires_at(self, kid):
+        timestamp = self._retirement_times.get(kid)
+        return None if timestamp is None else datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+class _Entry:
+    __slots__ = ("value", "loader", "get_version", "version", "version_checked_at", "forced_check_at")
+
+    def __init__(self, loader, get_version=None):
+        self.loader, self.get_version = loader, get_version
+        self.version = get_version() if get_version is not None else None
+        self.version_checked_at = self.forced_check_at = time.monotonic()
+        self.value = loader()
+
+
+class KeyRing:
+    """
+    Process-wide, thread-safe cache of the `JWK` keys (or `KeySet`s) used to sign, verify and encrypt tokens.
+
+    Keys are loaded (or generated, when missing from storage) once per process on first use and kept in memory
+    afterwards, so that steady-state token issuance and verification do no file I/O or key generation. Entries loaded
+    with a `version` callable are re-loaded lazily once the (cheap to compute) version they were loaded at changes;
+    the version is checked at most once every `reload_interval` seconds.
+
+    Forced checks (e.g. for a token signed with a `kid` missing from the cached key set) are made at most once every
+    `forced_check_interval` seconds per key, since the `kid` is read from tokens before they are verified: forged
+    `kid`s cannot make every request query the key's storage.
+    """
+
+    def __init__(self, reload_interval=None, forced_check_interval=None):
+        self.reload_interval = reload_interval
+        self.forced_check_interval = forced_check_interval
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def _is_stale(self, entry, force_check):
+        if entry.get_version is None:
+            return False
+        now = time.monotonic()
+        if force_check and self.forced_check_interval and now - entry.forced_check_at < self.forced_check_interval:
+            force_check = False
+        if not force_check and (self.reload_interval is None or now - entry.version_checked_at < self.reload_interval):
+            return False
+        if force_check:
+            entry.forced_check_at = now
+        entry.version_checked_at = now
+        return entry.get_version() != entry.version
+
+    def get(self, name, loader, version=None, force_check=False):
+        """
+        Return the key cached under `name`, calling `loader()` to load it the first time it is requested.
+
+        :param name: hashable identifier of the key e.g. a tuple of the key's storage location and password.
+        :param loader: callable that reads the key from storage or generates and persists it when missing.
+        :param version: optional callable returning a cheap-to-compute value (e.g. modification time of the key's
+            storage) that changes whenever the stored key does.
+        :param force_check: check `version` regardless of when it was last checked, unless it was force checked less
+            than `forced_check_interval` seconds ago.
+        """
+        entry = self._entries.get(name)
+        if entry is not None and not self._is_stale(entry, force_check):
+            return entry.value
+
+        with self._lock:
+            # another thread might have loaded the key while we were waiting for the lock
+            current = self._entries.get(name)
+            if current is None or current is entry:
+                current = self._entries[name] = _Entry(loader, version)
+            return current.value
+
+    def reload(self):
+        """Re-read every previously loaded key from storage, e.g. after the keys have been replaced on disk."""
+        with self._lock:
+            self._entries = {name: _Entry(entry.loader, entry.get_version) for name, entry in self._entries.items()}
+
+    def invalidate(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+keyring = KeyRing(reload_interval=KEYS_RELOAD_INTERVAL, forced_check_interval=KEYS_FORCED_CHECK_INTERVAL)
@@ -0,0 +1,298 @@
+import contextlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.utils.module_loading import import_string
+
+from xauth.internal_settings import AUTH_APP_LABEL, KEY_STORE, KEYS_DIR, MAKE_KEY_DIRS
+
+try:
+    import fcntl
+except ImportError:  # e.g. on Windows
+    fcntl = None
+
+__all__ = [
+    "KeyStore",
+    "FileKeyStore",
+    "DatabaseKeyStore",
+    "EnvironmentKeyStore",
+    "CacheKeyStore",
+    "get_key_store",
+]
+
+
+class KeyStore:
+    """
+    Stores the versions of the keys used to sign and encrypt tokens. A key is identified by a `name` and stored in a
+    `key_format` (`"pem"` or `"json"`) as a `tuple` of `(kid, data, created)` versions where `data` is the exported key
+    (`bytes`) and `created` the (unix) time the version was created at. The initial version of a key is identified by
+    the key's name and was created at `0`.
+
+    Keys are read once per process into the (in-memory) key ring and read again only once the store's `version(...)`
+    of the key changes.
+    """
+
+    def read(self, name, key_format):
+        """Return a `list` of the stored versions of the key"""
+        raise NotImplementedError
+
+    def create(self, name, key_format, kid, generate, created=0):
+        """
+        Store the data returned by `generate()` as the version `kid` of the key unless the version exists. Concurrent
+        callers (e.g. processes) must agree on the stored data.
+
+        :return: the data of the (stored) version.
+        """
+        raise NotImplementedError
+
+    def version(self, name, key_format):
+        """Return a value, cheaper to get than the key, that changes when a version of the key is added"""
+        return None
+
+    def location(self, name, key_format):
+        """Return a description of where the key is stored, unique to the key"""
+        return f"{self.__class__.__name__}:{name}"
+
+    def get_or_create(self, name, key_format, generate):
+        """Return the stored versions of the key, creating its initial version with `generate()` if there is none"""
+        versions = self.read(name, key_format)
+        if not versions:
+            versions = [(name, self.create(name, key_format, name, generate), 0)]
+        return versions
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    """Hold an exclusive lock, shared by the processes of the host, on creating keys in `directory`"""
+    if fcntl is None:
+        yield
+        return
+    with open(Path(directory) / ".xauth.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_atomically(file, data):
+    """Write `data` to `file` such that other processes either find no file or, all of `data` in it"""
+    file = Path(file)
+    fd, temp_file = tempfile.mkstemp(dir=file.parent, prefix=f".{file.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, file)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temp_file)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # makes the rename itself durable
+        dir_fd = os.open(file.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class FileKeyStore(KeyStore):
+    """
+    Stores keys in `directory` (`XAUTH_KEYS_DIR` by default). The initial version of a key is stored in a file named
+    after the key (with a `.pem` extension for PEM keys) and every other version in a `<name>.d` directory next to it
+    as `<kid>.pem` (or `<kid>.json`).
+
+    Versions are created under a (host-wide) file lock and written atomically so that concurrent processes create a
+    version once and never read a partially written one.
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+
+    @property
+    def directory(self):
+        return Path(self._directory or KEYS_DIR)
+
+    def _versions_dir(self, name):
+        return self.directory / f"{name}.d"
+
+    def _file(self, name, key_format, kid):
+        if kid == name:
+            return self.directory / (f"{name}.pem" if key_format == "pem" else name)
+        return self._versions_dir(name) / f"{kid}.{key_format}"
+
+    def read(self, name, key_format):
+        versions = []
+        for file in sorted(self._versions_dir(name).glob(f"*.{key_format}")):
+            created = file.stem.split("-", 1)[0]
+            if created.isdigit():  # otherwise, not a file created by `rotate_keys()`
+                versions.append((file.stem, file.read_bytes(), int(created)))
+        with contextlib.suppress(FileNotFoundError):
+            # The initial version is older than any of the rotated ones
+            versions.append((name, self._file(name, key_format, name).read_bytes(), 0))
+        return versions
+
+    def create(self, name, key_format, kid, generate, created=0):
+        file = self._file(name, key_format, kid)
+        if MAKE_KEY_DIRS or kid != name:
+            file.parent.mkdir(parents=True, exist_ok=True)
+        with _locked(file.parent):
+            try:
+                # created by another process while waiting for the lock
+                return file.read_bytes()
+            except FileNotFoundError:
+                data = generate()
+                _write_atomically(file, data)
+                return data
+
+    def version(self, name, key_format):
+        # Adding (or removing) files changes the modification time of the directory they are in
+        versions = []
+        for path in (self.directory, self._versions_dir(name)):
+            try:
+                versions.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                versions.append(None)
+        return tuple(versions)
+
+    def location(self, name, key_format):
+        return str(self.directory / name)
+
+
+class DatabaseKeyStore(KeyStore):
+    """
+    Stores keys in the `StoredKey` table, shared by every node using the database. A version is created by the first
+    node to insert it; the others read it back. The version of a key is the number (and latest primary key) of its
+    stored versions.
+    """
+
+    def __init__(self, using=None):
+        self.using = using
+
+    @property
+    def manager(self):
+        manager = apps.get_model(AUTH_APP_LABEL, "StoredKey")._default_manager
+        return manager.using(self.using) if self.using else manager
+
+    def read(self, name, key_format):
+        return [
+            (kid, data.encode(), created)
+            for kid, data, created in self.manager.filter(name=name, key_format=key_format).values_list(
+                "kid", "data", "created"
+            )
+        ]
+
+    def create(self, name, key_format, kid, generate, created=0):
+        queryset = self.manager.filter(name=name, key_format=key_format, kid=kid).values_list("data", flat=True)
+        data = queryset.first()
+        if data is None:
+            model = self.manager.model
+            new = model(name=name, key_format=key_format, kid=kid, data=generate().decode(), created=created)
+            self.manager.bulk_create([new], ignore_conflicts=True)
+            data = queryset.get()
+        return data.encode()
+
+    def version(self, name, key_format):
+        aggregate = self.manager.filter(name=name, key_format=key_format).aggregate(
+            count=models.Count("pk"), latest=models.Max("pk")
+        )
+        return aggregate["count"], aggregate["latest"]
+
+
+class EnvironmentKeyStore(KeyStore):
+    """
+    Read-only store of the keys in the `variable` environment variable, as printed by the `xauth_generate_keys --export`
+    command i.e. a JSON object of key names mapped to lists of `{"kid": ..., "created": ..., "data": ...}` versions.
+    """
+
+    def __init__(self, variable="XAUTH_KEYS"):
+        self.variable = variable
+
+    def _keys(self):
+        try:
+            return json.loads(os.environ.get(self.variable) or "{}")
+        except ValueError as e:
+            raise ImproperlyConfigured(f"The {self.variable} environment variable is not valid JSON") from e
+
+    def read(self, name, key_format):
+        return [
+            (version["kid"], version["data"].encode(), int(version["created"])) for version in self._keys().get(name, [])
+        ]
+
+    def create(self, name, key_format, kid, generate, created=0):
+        raise ImproperlyConfigured(
+            f"Key '{name}' is missing from the {self.variable} environment variable. Export the keys of another store "
+            "with `manage.py xauth_generate_keys --export`"
+        )
+
+
+class CacheKeyStore(KeyStore):
+    """
+    Stores keys (without expiry) in the Django cache `alias`. Each version is stored in a slot of its own: the initial
+    version in slot `0` and the others in the slots numbered by an (atomically) incremented counter, so that versions
+    created concurrently by several nodes are all kept. A second counter, the key's version, is incremented once a
+    version is stored. The cache must be shared by the nodes, support atomic increments and must not evict keys e.g.
+    Redis without an eviction policy.
+    """
+
+    def __init__(self, alias="default", key_prefix="xauth:keys"):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _key(self, name, key_format):
+        return f"{self.key_prefix}:{key_format}:{name}"
+
+    def _increment(self, key):
+        self.cache.add(key, 0, timeout=None)
+        return self.cache.incr(key)
+
+    def read(self, name, key_format):
+        key = self._key(name, key_format)
+        slots = [f"{key}:{slot}" for slot in range((self.cache.get(f"{key}:slots") or 0) + 1)]
+        versions = self.cache.get_many(slots)
+        # a slot can be reserved by a node that has not stored its version yet
+        return [tuple(versions[slot]) for slot in slots if slot in versions]
+
+    def create(self, name, key_format, kid, generate, created=0):
+        key = self._key(name, key_format)
+        for version in self.read(name, key_format):
+            if version[0] == kid:
+                return version[1]
+        data = generate()
+        if kid == name:
+            # only the first node to add the initial version succeeds
+            if not self.cache.add(f"{key}:0", (kid, data, created), timeout=None):
+                return self.cache.get(f"{key}:0")[1]
+        else:
+            self.cache.set(f"{key}:{self._increment(f'{key}:slots')}", (kid, data, created), timeout=None)
+        self._increment(f"{key}:version")
+        return data
+
+    def version(self, name, key_format):
+        return self.cache.get(f"{self._key(name, key_format)}:version")
+
+    def location(self, name, key_format):
+        return f"cache:{self.alias}:{self._key(name, key_format)}"
+
+
+_key_store = None
+
+
+def get_key_store():
+    """Return the (process-wide) store configured by `XAUTH_KEY_STORE`"""
+    global _key_store
+    if _key_store is None:
+        _key_store = import_string(KEY_STORE["BACKEND"])(**KEY_STORE.get("OPTIONS", {}))
+    return _key_store
@@ -8,8 +8,17 @@ from rest_framework.response import Response
 from xently.core.loading import get_classes
 
 from xauth.accounts.permissions import IsSuperuser, IsOwner
-from xauth.authentication import PasswordResetRequestAuthentication
-from xauth.internal_settings import AUTH_APP_LABEL
+from xauth.authentication import PasswordResetRequestAuthentication, JWTAuthentication
+from xauth.internal_settings import AUTH_APP_LABEL, REFRESH_TOKENS, TOKEN_REVOCATION
+from xauth.profiling import ProfiledViewMixin
+from xauth.throttling import (
+    VerificationCodeUserRateThrottle,
+    VerificationCodeIPRateThrottle,
+    TemporaryPasswordLookupRateThrottle,
+    TemporaryPasswordIPRateThrottle,
+    VerificationAttemptRateThrottle,
+    PasswordResetAttemptRateThrottle,
+)
 
 (
     SecurityQuestionSerializer,
@@ -19,6 +28,7 @@ from xauth.internal_settings import AUTH_APP_LABEL
     PasswordResetRequestSerializer,
     AddSecurityQuestionSerializer,
     AccountActivationSerializer,
+    RefreshTokenSerializer,
 ) = get_classes(
     f"{AUTH_APP_LABEL}.serializers",
     [
@@ -29,22 +39,25 @@ from xauth.internal_settings import AUTH_APP_LABEL
         "PasswordResetRequestSerializer",
         "AddSecurityQuestionSerializer",
         "AccountActivationSerializer",
+        "RefreshTokenSerializer",
     ],
 )
 
 __all__ = ["AccountViewSet", "SecurityQuestionViewSet"]
 
 
-class SecurityQuestionViewSet(viewsets.ModelViewSet):
+class SecurityQuestionViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     serializer_class = SecurityQuestionSerializer
     queryset = apps.get_model(AUTH_APP_LABEL, "SecurityQuestion").objects.all()
     permission_classes = [IsSuperuser]
 
 
-class AccountViewSet(viewsets.ModelViewSet):
+class AccountViewSet(ProfiledViewMixin, viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
     permission_classes = [IsOwner]
     queryset = get_user_model().objects.all()
+    # set by actions that issue a refresh token to include it in the response
+    refresh_token = None
 
     def __init__(self, *args, **kwargs):
         # This can ease calling `view.reverse_action(...)`; where view is an instance of `ViewSet` created
@@ -89,6 +102,8 @@ class AccountViewSet(viewsets.ModelViewSet):
         elif self.action == "signout":
             remove_fields = "__all__"
         context["remove_fields"] = remove_fields
+        if self.refresh_token:
+            context["refresh_token"] = self.refresh_token
         return context
 
     def retrieve(self, request, *args, **kwargs):
@@ -108,13 +123,39 @@ class AccountViewSet(viewsets.ModelViewSet):
     @action(methods=["POST"], detail=False)
     def signin(self, request, *args, **kwargs):
         login(request, request.user)
+        if REFRESH_TOKENS and request.user.is_verified:
+            self.refresh_token = apps.get_model(AUTH_APP_LABEL, "RefreshToken").objects.issue(request.user)
         return self.retrieve(request, *args, **kwargs)
 
     @action(methods=["POST"], detail=True)
     def signout(self, request, *args, **kwargs):
+        refresh_token = request.data.get("refresh")
+        if REFRESH_TOKENS and isinstance(refresh_token, str):
+            apps.get_model(AUTH_APP_LABEL, "RefreshToken").objects.revoke(refresh_token)
+        if TOKEN_REVOCATION and isinstance(request.successful_authenticator, JWTAuthentication):
+            request.successful_authenticator.revoke(request.auth)
         logout(request)
         return Response()
 
+    @action(
+        detail=False,
+        methods=["POST"],
+        authentication_classes=[],
+        permission_classes=[AllowAny],
+        serializer_class=RefreshTokenSerializer,
+    )
+    def refresh(self, request, *args, **kwargs):
+        """Exchange a refresh token (issued on sign in) for a new token and refresh token"""
+        if not REFRESH_TOKENS:
+            raise exceptions.NotFound()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rotated = apps.get_model(AUTH_APP_LABEL, "RefreshToken").objects.rotate(serializer.validated_data["refresh"])
+        if rotated is None:
+            raise exceptions.ValidationError({"refresh": [_("Invalid refresh token.")]})
+        request.user, self.refresh_token = rotated
+        return self.retrieve(request, *args, **kwargs)
+
     def do_request_verification_code(self, user):
         """This can be overridden to by projects to for example send SMS and/or email"""
         user.request_verification(send_email=True, request=self.request)
@@ -123,6 +164,11 @@ class AccountViewSet(viewsets.ModelViewSet):
         detail=True,
         authentication_classes=[],
         permission_classes=[AllowAny],
+        throttle_classes=[
+            *viewsets.ModelViewSet.throttle_classes,
+            VerificationCodeUserRateThrottle,
+            VerificationCodeIPRateThrottle,
+        ],
         url_path="request-verification-code",
     )
     def request_verification_code(self, request, *args, **kwargs):
@@ -132,7 +178,13 @@ class AccountViewSet(viewsets.ModelViewSet):
         self.do_request_verification_code(user)
         return self.retrieve(request, *args, **kwargs)
 
-    @action(methods=["POST"], detail=True, url_path="verify-account", serializer_class=AccountVerificationSerializer)
+    @action(
+        methods=["POST"],
+        detail=True,
+        url_path="verify-account",
+        serializer_class=AccountVerificationSerializer,
+        throttle_classes=[*viewsets.ModelViewSet.throttle_classes, VerificationAttemptRateThrottle],
+    )
     def verify_account(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True) and self.request.user.verify(**serializer.validated_data):
@@ -149,6 +201,11 @@ class AccountViewSet(viewsets.ModelViewSet):
         url_path="request-temporary-password",
         serializer_class=PasswordResetRequestSerializer,
         authentication_classes=[PasswordResetRequestAuthentication],
+        throttle_classes=[
+            *viewsets.ModelViewSet.throttle_classes,
+            TemporaryPasswordLookupRateThrottle,
+            TemporaryPasswordIPRateThrottle,
+        ],
     )
     def request_temporary_password(self, request, *args, **kwargs):
         self.do_request_temporary_password(request.user)
@@ -156,7 +213,13 @@ class AccountViewSet(viewsets.ModelViewSet):
         request.user.unflag_password_reset()
         return response
 
-    @action(methods=["POST"], detail=True, url_path="reset-password", serializer_class=PasswordResetSerializer)
+    @action(
+        methods=["POST"],
+        detail=True,
+        url_path="reset-password",
+        serializer_class=PasswordResetSerializer,
+        throttle_classes=[*viewsets.ModelViewSet.throttle_classes, PasswordResetAttemptRateThrottle],
+    )
     def reset_password(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=self.request.data)
         if serializer.is_valid(raise_exception=True) and self.request.user.reset_password(**serializer.validated_data):
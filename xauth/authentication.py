@@ -1,16 +1,56 @@
 import re
 
 from django.contrib.auth import get_user_model
-from django.urls.exceptions import Resolver404, NoReverseMatch
-from django.utils.functional import cached_property
+from django.utils.functional import SimpleLazyObject, empty
 from django.utils.translation import gettext as _
 from jwcrypto import jwt, jwe
 from rest_framework import authentication, exceptions
 from xently.core.loading import get_class
 
-from xauth.internal_settings import AUTH_APP_LABEL
+from xauth.instrumentation import timer, increment
+from xauth.internal_settings import AUTH_APP_LABEL, TOKEN_USER_ATTRIBUTES, TOKEN_REVOCATION
+from xauth.revocation import token_denylist
 
-__all__ = ["JWTAuthentication", "PasswordResetRequestAuthentication"]
+__all__ = ["JWTAuthentication", "PasswordResetRequestAuthentication", "TokenUser"]
+
+
+class _TokenSubjectNotAllowed(jwe.JWException):
+    """The token's subject (e.g. "verification") is not allowed on the requested endpoint"""
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    Stand-in for the user a token was issued to. Attributes of the user that were embedded in the token are answered
+    without touching the database; the user is loaded from the database the first time any other attribute is accessed.
+    """
+
+    def __init__(self, func, attributes=None):
+        self.__dict__["_attributes"] = {"is_authenticated": True, "is_anonymous": False, **(attributes or {})}
+        super().__init__(func)
+
+    def __getattr__(self, name):
+        if self._wrapped is empty:
+            try:
+                return self.__dict__["_attributes"][name]
+            except KeyError:
+                pass
+        return super().__getattr__(name)
+
+    @classmethod
+    def from_claims(cls, claims):
+        user_model = get_user_model()
+        signed_id = claims["id"]
+
+        def get_user():
+            try:
+                user = user_model.from_signed_id(signed_id=signed_id)
+            except user_model.DoesNotExist:
+                user = None
+            if user is None:
+                raise exceptions.AuthenticationFailed
+            return user
+
+        return cls(get_user, user_model.from_token_user_attributes(claims["user"]))
 
 
 class PasswordResetRequestAuthentication(authentication.BaseAuthentication):
@@ -34,27 +74,43 @@ class PasswordResetRequestAuthentication(authentication.BaseAuthentication):
 class JWTAuthentication(authentication.BaseAuthentication):
     request = None
     auth_scheme = "Bearer"
-
-    @cached_property
-    def _auth_view(self):
-        return get_class(f"{AUTH_APP_LABEL}.views", "AccountViewSet")(request=self.request)
-
-    def _is_request_from_any_of(self, url_names):
-        endpoints = []
-        for url_name in url_names:
-            try:
-                action = self._auth_view.reverse_action(url_name, kwargs=self._auth_view.request.resolver_match.kwargs)
-            except (Resolver404, NoReverseMatch):
-                pass
-            else:
-                endpoints.append(action)
-        return self.request.build_absolute_uri() in endpoints
+    # Names of the `AccountViewSet` actions on which tokens of a (non-access) subject are exclusively allowed
+    TOKEN_SUBJECT_ACTIONS = {
+        "verification": ["verify_account", "request_verification_code"],
+        "password-reset": ["reset_password", "request_temporary_password"],
+        "activation": ["activate_account"],
+    }
+
+    @classmethod
+    def get_token_subject_url_names(cls):
+        """
+        Return a `dict` of token subjects mapped to the URL names of the actions the subject's tokens are allowed on.
+        The URL names are resolved once (per class) and matched against `request.resolver_match.url_name` thereafter.
+        """
+        url_names = cls.__dict__.get("_token_subject_url_names")
+        if url_names is None:
+            # `rest_framework.routers` cannot be imported with this module since it is loaded with DRF's settings
+            from rest_framework import routers
+
+            view = get_class(f"{AUTH_APP_LABEL}.views", "AccountViewSet")
+            basename = routers.SimpleRouter().get_default_basename(view)
+            url_names = {
+                subject: frozenset(f"{basename}-{getattr(view, action).url_name}" for action in actions)
+                for subject, actions in cls.TOKEN_SUBJECT_ACTIONS.items()
+            }
+            cls._token_subject_url_names = url_names
+        return url_names
+
+    def _is_request_allowed_for(self, subject):
+        with timer("token_scope_check"):
+            resolver_match = self.request.resolver_match
+            return resolver_match is not None and resolver_match.url_name in self.get_token_subject_url_names()[subject]
 
     @property
     def _is_activation_endpoint(self):
-        return self._is_request_from_any_of([self._auth_view.activate_account.url_name])
+        return self._is_request_allowed_for("activation")
 
-    def authenticate(self, request):
+    def _get_bearer_token(self, request):
         self.request = request
 
         header = authentication.get_authorization_header(self.request)
@@ -66,54 +122,108 @@ class JWTAuthentication(authentication.BaseAuthentication):
         # separate auth-scheme/auth-type(e.g. Bearer, Token, Basic) from auth-data/auth-payload(e.g. base64url
         # encoding of username & password combination for Basic auth or Bearer|Token value/data)
         authorization_data = auth_header_data.split()
-        if len(authorization_data) > 1:
-            if re.match(r"^bearer$", authorization_data[0], flags=re.I):
-                user = self.get_user_from_jwt_token(authorization_data[1])
-                if user is None:
-                    raise exceptions.AuthenticationFailed(_("Invalid bearer token"), code="invalid_token")
-
-                if user.is_active or self._is_activation_endpoint:
-                    return user, authorization_data[1]
-                raise exceptions.AuthenticationFailed(_("Account was deactivated"), code="account_deactivated")
+        if len(authorization_data) > 1 and re.match(r"^bearer$", authorization_data[0], flags=re.I):
+            return authorization_data[1]
         return  # unknown/unsupported authentication scheme
 
+    def _check_user(self, user, jwt_token):
+        if user is None:
+            raise exceptions.AuthenticationFailed(_("Invalid bearer token"), code="invalid_token")
+
+        if user.is_active or self._is_activation_endpoint:
+            return user, jwt_token
+        raise exceptions.AuthenticationFailed(_("Account was deactivated"), code="account_deactivated")
+
+    def authenticate(self, request):
+        jwt_token = self._get_bearer_token(request)
+        if jwt_token is not None:
+            return self._check_user(self.get_user_from_jwt_token(jwt_token), jwt_token)
+
+    async def aauthenticate(self, request):
+        """
+        Async `authenticate(...)` for async views (or consumers) of ASGI deployments. `request` can also be a Django
+        `HttpRequest`. Tokens are decrypted and verified outside the event loop and users are looked up with the
+        async ORM.
+        """
+        jwt_token = self._get_bearer_token(request)
+        if jwt_token is not None:
+            return self._check_user(await self.aget_user_from_jwt_token(jwt_token), jwt_token)
+
+    def revoke(self, jwt_token):
+        """Reject `jwt_token` (e.g. authenticated by this class) until it expires"""
+        token = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")(None)
+        claims = token.get_claims(token=jwt_token)
+        if "jti" in claims:
+            token_denylist.revoke(claims["jti"], claims["exp"])
+
     def authenticate_header(self, request):
         return 'Bearer realm="api"'
 
+    @staticmethod
+    def _check_revocation(is_revoked):
+        if is_revoked:
+            increment("token_failures", {"reason": "revoked"})
+            raise exceptions.AuthenticationFailed(_("Revoked token"), code="revoked_token")
+
+    def _get_token_payload(self, token, claims):
+        if claims["sub"] in self.TOKEN_SUBJECT_ACTIONS and not self._is_request_allowed_for(claims["sub"]):
+            raise _TokenSubjectNotAllowed
+        return claims[token.payload_key]
+
+    @staticmethod
+    def _token_failed(error):
+        if isinstance(error, jwt.JWTExpired):
+            increment("token_failures", {"reason": "expired"})
+            return exceptions.AuthenticationFailed(_("Expired token"), code="expired_token")
+        increment(
+            "token_failures", {"reason": "wrong_endpoint" if isinstance(error, _TokenSubjectNotAllowed) else "invalid"}
+        )
+        return exceptions.AuthenticationFailed(_("Invalid token"), code="invalid_token")
+
     def get_user_from_jwt_token(self, jwt_token):
         try:
             token = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")(None)
             claims = token.get_claims(token=jwt_token)
-            if claims["sub"] == "verification" and (
-                not self._is_request_from_any_of(
-                    [
-                        self._auth_view.verify_account.url_name,
-                        self._auth_view.request_verification_code.url_name,
-                    ]
-                )
-            ):
-                raise jwe.JWException
-            elif claims["sub"] == "password-reset" and (
-                not self._is_request_from_any_of(
-                    [
-                        self._auth_view.reset_password.url_name,
-                        self._auth_view.request_temporary_password.url_name,
-                    ]
-                )
-            ):
-                raise jwe.JWException
-            elif claims["sub"] == "activation" and (not self._is_activation_endpoint):
-                raise jwe.JWException
+            if TOKEN_REVOCATION and "jti" in claims:
+                self._check_revocation(token_denylist.is_revoked(claims["jti"]))
+            payload = self._get_token_payload(token, claims)
+            if TOKEN_USER_ATTRIBUTES and "user" in payload:
+                return TokenUser.from_claims(payload)
+            else:
+                try:
+                    with timer("user_lookup"):
+                        user = get_user_model().from_signed_id(signed_id=payload["id"])
+                except get_user_model().DoesNotExist:
+                    raise exceptions.AuthenticationFailed
+                else:
+                    if user:
+                        return user
+                    raise jwt.JWTInvalidClaimValue
+        except jwe.JWException as error:
+            raise self._token_failed(error)
+
+    async def aget_user_from_jwt_token(self, jwt_token):
+        """
+        Async `get_user_from_jwt_token(...)`. A `TokenUser` returned when `XAUTH_TOKEN_USER_ATTRIBUTES` is set loads the
+        user synchronously if an attribute missing from the token is accessed.
+        """
+        try:
+            token = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")(None)
+            claims = await token.aget_claims(token=jwt_token)
+            if TOKEN_REVOCATION and "jti" in claims:
+                self._check_revocation(await token_denylist.ais_revoked(claims["jti"]))
+            payload = self._get_token_payload(token, claims)
+            if TOKEN_USER_ATTRIBUTES and "user" in payload:
+                return TokenUser.from_claims(payload)
             else:
                 try:
-                    user = get_user_model().from_signed_id(signed_id=claims[token.payload_key]["id"])
+                    with timer("user_lookup"):
+                        user = await get_user_model().afrom_signed_id(signed_id=payload["id"])
                 except get_user_model().DoesNotExist:
                     raise exceptions.AuthenticationFailed
                 else:
                     if user:
                         return user
                     raise jwt.JWTInvalidClaimValue
-        except jwt.JWTExpired:
-            raise exceptions.AuthenticationFailed(_("Expired token"), code="expired_token")
-        except jwe.JWException:
-            raise exceptions.AuthenticationFailed(_("Invalid token"), code="invalid_token")
+        except jwe.JWException as error:
+            raise self._token_failed(error)
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.local import Local
+from django.core.cache import caches
+from django.core.signals import request_started, request_finished
+
+__all__ = ["LRUCache", "ModelInstanceCache"]
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded, least-recently-used cache whose entries can also expire at a given (unix) time.
+
+    Keeps `hits`, `misses` and `evictions` counters. Evictions count entries dropped to keep the cache within
+    `maxsize`; expired entries are counted as misses when looked up.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        """
+        :param maxsize: maximum number of entries. The cache is disabled if it is `0`.
+        :param ttl: optional maximum number of seconds an entry stays in the cache.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return self.maxsize > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        """
+        :param expires_at: optional unix time after which the entry is no longer returned. The entry expires earlier
+            if the cache's `ttl` elapses first.
+        """
+        if not self:
+            return
+        if self.ttl is not None:
+            expires_at = min(time.time() + self.ttl, expires_at or float("inf"))
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class ModelInstanceCache:
+    """
+    Read-through cache of model instances keyed by their primary key.
+
+    Instances are cached in a (shared) Django cache and, while a request is being processed, in a first-level
+    in-process cache that is discarded when the request finishes, sparing repeated look-ups from unpickling the same
+    instance. Keeps `local_hits`, `hits` (shared cache) and `misses` counters.
+    """
+
+    def __init__(self, alias, timeout=None, key_prefix="xauth"):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.local_hits = self.hits = self.misses = 0
+        self._local = Local()
+        if alias is not None:
+            request_started.connect(self._start_local_cache, weak=False)
+            request_finished.connect(self._clear_local_cache, weak=False)
+
+    def __bool__(self):
+        return self.alias is not None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _start_local_cache(self, **kwargs):
+        self._local.instances = {}
+
+    def _clear_local_cache(self, **kwargs):
+        self._local.instances = None
+
+    def make_key(self, model, pk):
+        return f"{self.key_prefix}:{model._meta.label_lower}:{pk}"
+
+    def get(self, model, pk, load):
+        """
+        Return the instance of `model` with the primary key `pk`, calling `load()` to fetch it on a cache miss.
+        """
+        key = self.make_key(model, pk)
+        local_instances = getattr(self._local, "instances", None)
+        if local_instances is not None and key in local_instances:
+            self.local_hits += 1
+            return local_instances[key]
+
+        instance = self.cache.get(key)
+        if instance is None:
+            self.misses += 1
+            instance = load()
+            self.cache.set(key, instance, timeout=self.timeout)
+        else:
+            self.hits += 1
+
+        if local_instances is not None:
+            local_instances[key] = instance
+        return instance
+
+    async def aget(self, model, pk, load):
+        """Async `get(...)` where `load()` returns an awaitable"""
+        key = self.make_key(model, pk)
+        local_instances = getattr(self._local, "instances", None)
+        if local_instances is not None and key in local_instances:
+            self.local_hits += 1
+            return local_instances[key]
+
+        instance = await self.cache.aget(key)
+        if instance is None:
+            self.misses += 1
+            instance = await load()
+            await self.cache.aset(key, instance, timeout=self.timeout)
+        else:
+            self.hits += 1
+
+        if local_instances is not None:
+            local_instances[key] = instance
+        return instance
+
+    def delete(self, model, pk):
+        key = self.make_key(model, pk)
+        local_instances = getattr(self._local, "instances", None)
+        if local_instances is not None:
+            local_instances.pop(key, None)
+        self.cache.delete(key)
+
+    @property
+    def stats(self):
+        return {"local_hits": self.local_hits, "hits": self.hits, "misses": self.misses}
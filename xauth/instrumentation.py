@@ -0,0 +1,233 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from xauth.internal_settings import METRICS_SINK
+
+__all__ = [
+    "MetricsSink",
+    "NullSink",
+    "InMemorySink",
+    "LoggingSink",
+    "get_sink",
+    "set_sink",
+    "timer",
+    "increment",
+    "metrics_view",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSink:
+    """
+    Receives the measurements of xauth's authentication and token pipeline:
+
+    - `stage_seconds` timings labelled by `stage` e.g. `token_decrypt`, `token_verify`, `key_load`, `user_lookup`.
+    - `token_failures` counts labelled by `reason` i.e. `expired`, `invalid`, `wrong_endpoint` or `revoked`.
+    """
+
+    # measurements are skipped altogether (rather than passed to the sink) when `False`
+    enabled = True
+
+    def observe(self, name, value, labels=None):
+        """Record a `value` (e.g. a duration in seconds) of the `name`d measurement"""
+        raise NotImplementedError
+
+    def increment(self, name, value=1, labels=None):
+        """Add `value` to the `name`d counter"""
+        raise NotImplementedError
+
+
+class NullSink(MetricsSink):
+    """Discards measurements. Instrumented code only pays for checking `enabled`"""
+
+    enabled = False
+
+    def observe(self, name, value, labels=None):
+        pass
+
+    def increment(self, name, value=1, labels=None):
+        pass
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(label_key):
+    if not label_key:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in label_key
+    )
+    return f"{{{labels}}}"
+
+
+class InMemorySink(MetricsSink):
+    """
+    Aggregates measurements in (process) memory: the count, sum and maximum of observations and the total of counters.
+    `render()` returns them in the Prometheus text exposition format, served by `metrics_view`.
+    """
+
+    def __init__(self, namespace="xauth"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._observations = defaultdict(lambda: [0, 0.0, 0.0])
+        self._counters = defaultdict(float)
+
+    def observe(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            observation = self._observations[key]
+            observation[0] += 1
+            observation[1] += value
+            observation[2] = max(observation[2], value)
+
+    def increment(self, name, value=1, labels=None):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def clear(self):
+        with self._lock:
+            self._observations.clear()
+            self._counters.clear()
+
+    @property
+    def stats(self):
+        """`dict` of the observations (`count`, `sum` and `max`) and counters keyed by `(name, labels)`"""
+        with self._lock:
+            observations = {
+                key: {"count": count, "sum": total, "max": maximum}
+                for key, (count, total, maximum) in self._observations.items()
+            }
+            return {"observations": observations, "counters": dict(self._counters)}
+
+    def render(self, gauges=None):
+        """
+        Return the measurements in the Prometheus text exposition format.
+
+        :param gauges: optional `dict` of `(name, labels)` (`labels` being a `tuple` of `(label, value)` pairs) mapped
+            to values to expose as gauges e.g. the sizes of caches.
+        """
+        stats = self.stats
+        lines = []
+
+        def group(items):
+            groups = defaultdict(list)
+            for (name, label_key), value in sorted(items, key=lambda item: item[0]):
+                groups[f"{self.namespace}_{name}"].append((label_key, value))
+            return groups.items()
+
+        for metric, samples in group(stats["observations"].items()):
+            lines.append(f"# TYPE {metric} summary")
+            for label_key, observation in samples:
+                labels = _format_labels(label_key)
+                lines.append(f"{metric}_count{labels} {observation['count']}")
+                lines.append(f"{metric}_sum{labels} {observation['sum']!r}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            lines.extend(f"{metric}_max{_format_labels(label_key)} {o['max']!r}" for label_key, o in samples)
+        for metric, samples in group(stats["counters"].items()):
+            lines.append(f"# TYPE {metric}_total counter")
+            lines.extend(f"{metric}_total{_format_labels(label_key)} {value!r}" for label_key, value in samples)
+        for metric, samples in group((gauges or {}).items()):
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(f"{metric}{_format_labels(label_key)} {value!r}" for label_key, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+class LoggingSink(MetricsSink):
+    """Logs every measurement to the `xauth.instrumentation` logger at `level`"""
+
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def observe(self, name, value, labels=None):
+        logger.log(self.level, "%s %s %.6f", name, labels or {}, value)
+
+    def increment(self, name, value=1, labels=None):
+        logger.log(self.level, "%s %s +%s", name, labels or {}, value)
+
+
+_sink = None
+
+
+def get_sink():
+    """Return the (process-wide) sink configured by `XAUTH_METRICS_SINK`"""
+    global _sink
+    if _sink is None:
+        _sink = import_string(METRICS_SINK["BACKEND"])(**METRICS_SINK.get("OPTIONS", {}))
+    return _sink
+
+
+def set_sink(sink):
+    """Replace the process-wide sink e.g. with one that forwards measurements to a metrics client. `None` resets it"""
+    global _sink
+    _sink = sink
+
+
+class _Timer:
+    __slots__ = ("sink", "stage", "started_at")
+
+    def __init__(self, sink, stage):
+        self.sink = sink
+        self.stage = stage
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sink.observe("stage_seconds", time.perf_counter() - self.started_at, {"stage": self.stage})
+
+
+_null_timer = contextlib.nullcontext()
+
+
+def timer(stage):
+    """Context manager that records how long its block took as the `stage_seconds` of `stage`"""
+    sink = _sink or get_sink()
+    if not sink.enabled:
+        return _null_timer
+    return _Timer(sink, stage)
+
+
+def increment(name, labels=None, value=1):
+    sink = _sink or get_sink()
+    if sink.enabled:
+        sink.increment(name, value, labels)
+
+
+def _cache_gauges():
+    from xauth.accounts.abstract_models import user_cache
+    from xauth.accounts.token.generator import claims_cache
+    from xauth.revocation import token_denylist
+    from xauth.throttling import throttle_stats
+
+    gauges = {}
+    for name, stats in (("claims_cache", claims_cache.stats), ("user_cache", user_cache.stats)):
+        for stat, value in stats.items():
+            gauges[(f"{name}_{stat}", ())] = value
+    for stat, value in token_denylist.stats.items():
+        gauges[(f"token_denylist_{stat}", ())] = value
+    for scope, counts in throttle_stats.stats.items():
+        for outcome, value in counts.items():
+            gauges[("throttle_requests", (("scope", scope), ("outcome", outcome)))] = value
+    return gauges
+
+
+def metrics_view(request):
+    """
+    Serve the measurements of an `InMemorySink`, and the statistics of xauth's caches, to Prometheus. The view is not
+    routed by `xauth.urls`; route it behind the project's own access control.
+    """
+    sink = get_sink()
+    if not isinstance(sink, InMemorySink):
+        return HttpResponse("XAUTH_METRICS_SINK is not an InMemorySink\n", status=404, content_type="text/plain")
+    return HttpResponse(sink.render(_cache_gauges()), content_type="text/plain; version=0.0.4; charset=utf-8")
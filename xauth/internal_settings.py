@@ -1,3 +1,4 @@
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
@@ -15,8 +16,33 @@ __all__ = [
     "VERIFICATION_REQUEST_SUBJECT",
     "AUTH_APP_LABEL",
     "KEYS_DIR",
+    "KEY_STORE",
     "JWT_SIG_ALG",
+    "JWE_ALG",
     "MAKE_KEY_DIRS",
+    "KEYS_RELOAD_INTERVAL",
+    "KEYS_FORCED_CHECK_INTERVAL",
+    "KEY_RETIREMENT_PERIOD",
+    "TOKEN_CLAIMS_CACHE_SIZE",
+    "TOKEN_CLAIMS_CACHE_TTL",
+    "TOKEN_USER_ATTRIBUTES",
+    "USER_CACHE",
+    "USER_CACHE_TIMEOUT",
+    "TOKEN_VARIANTS",
+    "EMAIL_DELIVERY",
+    "EMAIL_OUTBOX",
+    "SECRET_HASHER",
+    "THROTTLE_RATES",
+    "THROTTLE_CACHE",
+    "REFRESH_TOKENS",
+    "REFRESH_TOKEN_EXPIRY",
+    "TOKEN_REVOCATION",
+    "TOKEN_DENYLIST_CAPACITY",
+    "TOKEN_DENYLIST_FALSE_POSITIVE_RATE",
+    "TOKEN_DENYLIST_SYNC_INTERVAL",
+    "METRICS_SINK",
+    "PROFILING",
+    "WARMUP",
 ]
 
 AUTH_APP_LABEL = getattr(settings, "XAUTH_AUTH_APP_LABEL", DEFAULT_AUTH_APP_LABEL)
@@ -31,4 +57,94 @@ VERIFY_ENCRYPTED_TOKEN = getattr(settings, "XAUTH_VERIFY_ENCRYPTED_TOKEN", True)
 # This directory should not be committed to version control
 KEYS_DIR = str(getattr(settings, "XAUTH_KEYS_DIR", Path(settings.BASE_DIR) / ".secrets"))
 JWT_SIG_ALG = getattr(settings, "XAUTH_JWT_SIG_ALG", "RS256")
+# Key management algorithm for encrypted tokens
+JWE_ALG = getattr(settings, "XAUTH_JWE_ALG", "ECDH-ES")
 MAKE_KEY_DIRS = getattr(settings, "XAUTH_MAKE_KEY_DIRS", True)
+# Where signing and encryption keys are stored: `BACKEND` is the dotted path of a
+# `xauth.accounts.token.stores.KeyStore` (file, database, environment or cache) constructed with `OPTIONS`
+KEY_STORE = {
+    "BACKEND": "xauth.accounts.token.stores.FileKeyStore",
+    "OPTIONS": {},
+    **(getattr(settings, "XAUTH_KEY_STORE", None) or {}),
+}
+# Minimum number of seconds between checks for new or rotated keys in the `KEY_STORE`. `None` disables the checks
+KEYS_RELOAD_INTERVAL = getattr(settings, "XAUTH_KEYS_RELOAD_INTERVAL", 60)
+# Minimum number of seconds between the checks for new keys made when a token names a key (`kid`) that is not loaded
+# e.g. one rotated by another node. `kid`s are read from tokens before they are verified
+KEYS_FORCED_CHECK_INTERVAL = getattr(settings, "XAUTH_KEYS_FORCED_CHECK_INTERVAL", 1)
+# How long a rotated (superseded) key remains valid for verifying tokens that were issued before the rotation
+KEY_RETIREMENT_PERIOD = getattr(settings, "XAUTH_KEY_RETIREMENT_PERIOD", timedelta(days=1))
+# Maximum number of verified token claims to keep in (process) memory. `0` disables the cache
+TOKEN_CLAIMS_CACHE_SIZE = getattr(settings, "XAUTH_TOKEN_CLAIMS_CACHE_SIZE", 0)
+# Maximum number of seconds claims stay in the cache. The claims never outlive the token's expiry regardless
+TOKEN_CLAIMS_CACHE_TTL = getattr(settings, "XAUTH_TOKEN_CLAIMS_CACHE_TTL", None)
+# User attributes (e.g. "pk", "is_active", "is_verified") embedded in tokens to authenticate requests without a
+# database query for as long as only these attributes of the (authenticated) user are accessed
+TOKEN_USER_ATTRIBUTES = tuple(getattr(settings, "XAUTH_TOKEN_USER_ATTRIBUTES", None) or ())
+# Alias (in `settings.CACHES`) of the cache used to look up authenticated users. `None` disables the cache
+USER_CACHE = getattr(settings, "XAUTH_USER_CACHE", None)
+USER_CACHE_TIMEOUT = getattr(settings, "XAUTH_USER_CACHE_TIMEOUT", 300)
+# Token variants ("encrypted" and/or "unencrypted") included in responses that return the user's token
+TOKEN_VARIANTS = tuple(getattr(settings, "XAUTH_TOKEN_VARIANTS", None) or ("encrypted", "unencrypted"))
+# Delivery of emails sent without `sync=True`. `BACKEND` is the dotted path of a `xauth.mail.EmailDelivery` subclass
+# instantiated with the keyword arguments in `OPTIONS`
+EMAIL_DELIVERY = {
+    "BACKEND": "xauth.mail.PooledEmailDelivery",
+    "OPTIONS": {},
+    **(getattr(settings, "XAUTH_EMAIL_DELIVERY", None) or {}),
+}
+# Queue emails (e.g. verification codes) in the database, in the same transaction as the `Security` update, to be sent
+# by the `dispatch_xauth_outbox` command instead of sending them from the web process
+EMAIL_OUTBOX = getattr(settings, "XAUTH_EMAIL_OUTBOX", False)
+# Dotted path of the `xauth.accounts.hashers.SecretHasher` subclass used to hash verification codes and temporary
+# passwords
+SECRET_HASHER = getattr(settings, "XAUTH_SECRET_HASHER", "xauth.accounts.hashers.HMACSecretHasher")
+# Rates (e.g. "5/hour") of the throttles of the request-verification-code and request-temporary-password actions by
+# scope. `None` disables the scope's throttle
+THROTTLE_RATES = {
+    "verification_code_user": "5/hour",
+    "verification_code_ip": "30/hour",
+    "temporary_password_lookup": "5/hour",
+    "temporary_password_ip": "30/hour",
+    # attempts to guess verification codes and temporary passwords, which are cheap to check
+    "verification_attempt": "10/hour",
+    "password_reset_attempt": "10/hour",
+    **(getattr(settings, "XAUTH_THROTTLE_RATES", None) or {}),
+}
+# Alias (in `settings.CACHES`) of the cache that holds the throttles' request counters
+THROTTLE_CACHE = getattr(settings, "XAUTH_THROTTLE_CACHE", "default")
+# Issue refresh tokens (exchanged for new tokens by the `refresh` action) next to access tokens. Access tokens then
+# expire after 15 minutes unless `XAUTH_TOKEN_EXPIRY["access"]` says otherwise
+REFRESH_TOKENS = getattr(settings, "XAUTH_REFRESH_TOKENS", False)
+REFRESH_TOKEN_EXPIRY = getattr(settings, "XAUTH_REFRESH_TOKEN_EXPIRY", timedelta(days=30))
+if REFRESH_TOKENS:
+    TOKEN_EXPIRY = {"access": timedelta(minutes=15), **TOKEN_EXPIRY}
+# Revoke the (bearer) token of users that sign out. Revoked tokens are rejected until they expire
+TOKEN_REVOCATION = getattr(settings, "XAUTH_TOKEN_REVOCATION", False)
+# Number of revoked (unexpired) tokens the in-process Bloom filter is sized for. It grows when exceeded
+TOKEN_DENYLIST_CAPACITY = getattr(settings, "XAUTH_TOKEN_DENYLIST_CAPACITY", 10000)
+# Probability of a token that was not revoked being looked up in the database (rather than the Bloom filter alone)
+TOKEN_DENYLIST_FALSE_POSITIVE_RATE = getattr(settings, "XAUTH_TOKEN_DENYLIST_FALSE_POSITIVE_RATE", 0.001)
+# Minimum number of seconds between reads of tokens revoked (by other processes) since the last read
+TOKEN_DENYLIST_SYNC_INTERVAL = getattr(settings, "XAUTH_TOKEN_DENYLIST_SYNC_INTERVAL", 5)
+# Sink of the timings and counters of the authentication and token pipeline. `BACKEND` is the dotted path of a
+# `xauth.instrumentation.MetricsSink` subclass instantiated with the keyword arguments in `OPTIONS`
+METRICS_SINK = {
+    "BACKEND": "xauth.instrumentation.NullSink",
+    "OPTIONS": {},
+    **(getattr(settings, "XAUTH_METRICS_SINK", None) or {}),
+}
+# Profiling of a sample of the requests to xauth's views. `SAMPLE_RATE` is the share (0 to 1) of requests profiled.
+# Requests whose `HEADER` (a `request.META` key) holds the `SECRET` are profiled too. Profiles are aggregated per
+# action and written to `OUTPUT_DIR` (if set)
+PROFILING = {
+    "SAMPLE_RATE": 0,
+    "HEADER": "HTTP_X_XAUTH_PROFILE",
+    "SECRET": None,
+    "OUTPUT_DIR": None,
+    **(getattr(settings, "XAUTH_PROFILING", None) or {}),
+}
+# Load keys, resolve dynamically loaded classes and populate URL resolvers when the WSGI/ASGI application returned by
+# `xauth.warmup.get_wsgi_application()` (or `get_asgi_application()`) is created, i.e. before a worker accepts requests,
+# instead of on the first request
+WARMUP = getattr(settings, "XAUTH_WARMUP", False)
@@ -1,14 +1,35 @@
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from xently.core.loading import _find_registered_app_name, _import_module, _pluck_classes
 
 from xauth.accounts import DEFAULT_AUTH_APP_LABEL
 from xauth.internal_settings import AUTH_APP_LABEL
 
-__all__ = ["class_loader"]
+__all__ = ["class_loader", "clear_class_cache"]
+
+# Classes resolved by `class_loader(...)` keyed by its arguments
+_resolved_classes = {}
+
+
+def clear_class_cache():
+    """Forget the classes resolved by `class_loader(...)` e.g. after (test) settings changed the installed apps"""
+    _resolved_classes.clear()
+
+
+@receiver(setting_changed)
+def _clear_class_cache_on_setting_changed(*, setting, **kwargs):
+    if setting == "INSTALLED_APPS" or setting.startswith("XENTLY_"):
+        clear_class_cache()
+
+
+def _is_initializing(module):
+    return module is not None and getattr(getattr(module, "__spec__", None), "_initializing", False)
 
 
 def class_loader(module_label, classnames, module_prefix):
     """
-    Dynamically import a list of classes from the given module.
+    Dynamically import a list of classes from the given module. The classes are resolved once (per arguments) and
+    returned from memory thereafter, e.g. when loaded per request.
 
     This works by looking up a matching app from the app registry,
     against the passed module label. If the requested class can't be found in
@@ -33,6 +54,11 @@ def class_loader(module_label, classnames, module_prefix):
             ``ImportError``, it is re-raised
     """
 
+    key = (module_label, tuple(classnames), module_prefix)
+    classes = _resolved_classes.get(key)
+    if classes is not None:
+        return list(classes)
+
     if "." not in module_label:
         # Importing from top-level modules is not supported, e.g.
         raise ValueError("Importing from top-level modules is not supported")
@@ -59,4 +85,8 @@ def class_loader(module_label, classnames, module_prefix):
         )
 
     # return imported classes, giving preference to ones from the local package
-    return _pluck_classes([local_module, xauth_module], classnames)
+    classes = _pluck_classes([local_module, xauth_module], classnames)
+    if not (_is_initializing(local_module) or _is_initializing(xauth_module)):
+        # a module that is still being imported (i.e. a circular import) might not define its classes yet
+        _resolved_classes[key] = tuple(classes)
+    return classes
@@ -0,0 +1,315 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils import translation
+from django.utils.autoreload import file_changed
+from django.utils.module_loading import import_string
+
+from xauth.internal_settings import AUTH_APP_LABEL, EMAIL_DELIVERY
+
+__all__ = [
+    "EmailDelivery",
+    "SyncEmailDelivery",
+    "PooledEmailDelivery",
+    "get_email_delivery",
+    "EmailRenderer",
+    "email_renderer",
+    "dispatch_outbox",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class EmailDelivery:
+    """Delivers the emails sent by xauth e.g. verification codes and temporary passwords"""
+
+    def deliver(self, message):
+        raise NotImplementedError
+
+    def shutdown(self, timeout=None):
+        """Deliver pending emails and release resources held by the delivery"""
+
+
+class SyncEmailDelivery(EmailDelivery):
+    """Sends emails from the calling thread"""
+
+    def deliver(self, message):
+        return message.send()
+
+
+class PooledEmailDelivery(EmailDelivery):
+    """
+    Sends emails from a fixed pool of worker threads fed by a bounded queue.
+
+    Each worker reuses one email backend connection (from `django.core.mail.get_connection()`) and sends the emails
+    queued at the time in batches of up to `batch_size` through `send_messages(...)`. When the queue is full, `deliver`
+    waits up to `put_timeout` seconds for room in the queue and then sends the email from the calling thread, slowing
+    down callers instead of dropping emails. Workers are started with the first email and pending emails are delivered
+    before the process exits, for up to `shutdown_timeout` seconds so that a hung connection cannot block the exit.
+    """
+
+    _STOP = object()
+
+    def __init__(self, workers=2, queue_size=1000, batch_size=20, put_timeout=1, idle_timeout=30, shutdown_timeout=5):
+        """
+        :param workers: number of worker threads (and, at most, open connections).
+        :param queue_size: maximum number of emails waiting to be sent.
+        :param batch_size: maximum number of emails sent by a worker at once.
+        :param put_timeout: seconds to wait for room in a full queue before sending from the calling thread.
+        :param idle_timeout: seconds after which a worker without emails to send closes its connection.
+        :param shutdown_timeout: seconds to wait, on shutdown, for the queued emails to be sent.
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.idle_timeout = idle_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._threads = []
+        self._exit_handler_registered = False
+
+    def _start(self):
+        with self._lock:
+            # Threads do not survive a fork e.g. of a pre-loaded Gunicorn master process
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._threads = [
+                threading.Thread(target=self._work, name=f"xauth-email-{i}", daemon=True) for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            if not self._exit_handler_registered:
+                # once, even though workers are started again after a shutdown (or a fork)
+                atexit.register(self.shutdown)
+                self._exit_handler_registered = True
+            self._pid = os.getpid()
+
+    def deliver(self, message):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put(message, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning("Email delivery queue is full. Sending email from the calling thread.")
+            return message.send()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.idle_timeout)]
+        except queue.Empty:
+            return None
+        while len(batch) < self.batch_size and batch[-1] is not self._STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, connection, messages):
+        try:
+            connection.send_messages(messages)
+        except Exception:
+            # The connection could have been closed by the server e.g. after being idle for long
+            connection.close()
+            try:
+                connection.send_messages(messages)
+            except Exception:
+                logger.exception("Failed to send %d email(s)", len(messages))
+                connection.close()
+
+    def _work(self):
+        connection = get_connection()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                connection.close()
+                continue
+            stop = batch[-1] is self._STOP
+            messages = batch[:-1] if stop else batch
+            if messages:
+                self._send(connection, messages)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                connection.close()
+                return
+
+    def shutdown(self, timeout=None):
+        """
+        Deliver the emails in the queue and stop the workers.
+
+        :param timeout: seconds to wait for the emails to be sent, `shutdown_timeout` if `None`. Emails that are still
+            queued then are logged and dropped (with the daemon worker threads) when the process exits.
+        """
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            try:
+                for _ in self._threads:
+                    self._queue.put(self._STOP, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                pass
+            for thread in self._threads:
+                thread.join(max(deadline - time.monotonic(), 0))
+            alive = sum(thread.is_alive() for thread in self._threads)
+            if alive:
+                pending = sum(message is not self._STOP for message in list(self._queue.queue))
+                logger.error(
+                    "%d email delivery worker(s) still busy after %ss. %d queued email(s) were not sent.",
+                    alive,
+                    timeout,
+                    pending,
+                )
+            self._pid = None
+
+
+_email_delivery = None
+
+
+def get_email_delivery():
+    """Return the (process-wide) email delivery configured by `XAUTH_EMAIL_DELIVERY`"""
+    global _email_delivery
+    if _email_delivery is None:
+        _email_delivery = import_string(EMAIL_DELIVERY["BACKEND"])(**EMAIL_DELIVERY.get("OPTIONS", {}))
+    return _email_delivery
+
+
+class EmailRenderer:
+    """
+    Renders the text and (optional) HTML bodies of xauth emails from the `xauth/<name>.txt` and `xauth/<name>.html`
+    templates, preferring the `xauth/<language>/<name>.<ext>` templates of the active language if it has a text template.
+
+    Compiled templates are cached per template name and language, as is the absence of an HTML template, so that
+    rendering an email does not look up (or fail to find) its templates again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    @staticmethod
+    def _get_template(directory, name, extension):
+        try:
+            return get_template(f"{directory}/{name}.{extension}")
+        except TemplateDoesNotExist:
+            return None
+
+    def get_templates(self, name):
+        """
+        Return a `tuple` of the compiled (text, HTML) templates of `name`. The HTML template is `None` if missing.
+
+        Both templates are of the same language: the text template decides the language and the HTML template is only
+        looked up next to it, so that a translated text body is never paired with a default HTML body (or vice versa).
+        """
+        key = (name, translation.get_language())
+        templates = self._templates.get(key)
+        if templates is None:
+            directories = ["xauth"] if not key[1] else [f"xauth/{key[1]}", "xauth"]
+            for directory in directories:
+                text = self._get_template(directory, name, "txt")
+                if text is not None:
+                    break
+            else:
+                raise TemplateDoesNotExist(", ".join(f"{directory}/{name}.txt" for directory in directories))
+            templates = (text, self._get_template(directory, name, "html"))
+            with self._lock:
+                templates = self._templates.setdefault(key, templates)
+        return templates
+
+    def render(self, name, context=None, request=None):
+        """Return a `tuple` of the (text, HTML) bodies of `name` rendered with `context`. HTML is `None` if missing"""
+        return self.render_many(name, [context], request=request)[0]
+
+    def render_many(self, name, contexts, request=None):
+        """`render(...)` `name` once for each of the `contexts`"""
+        text, html = self.get_templates(name)
+        return [
+            (text.render(context, request), None if html is None else html.render(context, request))
+            for context in contexts
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+email_renderer = EmailRenderer()
+
+
+def _clear_email_templates(sender, file_path=None, setting=None, **kwargs):
+    # templates edited while the development server is running or, template settings overridden by tests
+    if (file_path is not None and file_path.suffix in (".txt", ".html")) or setting == "TEMPLATES":
+        email_renderer.clear()
+
+
+file_changed.connect(_clear_email_templates, dispatch_uid="xauth_email_templates")
+setting_changed.connect(_clear_email_templates, dispatch_uid="xauth_email_templates")
+
+
+def _claim_outbox_batch(outbox_model, using, after_pk, batch_size, max_attempts):
+    queryset = outbox_model._default_manager.using(using).filter(pk__gt=after_pk, attempts__lt=max_attempts)
+    features = connections[using].features
+    if features.has_select_for_update_skip_locked:
+        # rows claimed by concurrent dispatchers are skipped instead of waited for
+        kwargs = {"of": ("self",)} if features.has_select_for_update_of else {}
+        queryset = queryset.select_for_update(skip_locked=True, **kwargs)
+    return list(queryset.select_related("user").order_by("pk")[:batch_size])
+
+
+def dispatch_outbox(batch_size=100, max_attempts=5):
+    """
+    Render and send the emails queued in the `EmailOutbox` over a single email backend connection, claiming (and
+    locking, where the database supports `SELECT ... FOR UPDATE SKIP LOCKED`) up to `batch_size` rows at a time.
+
+    Emails are rendered in the language they were queued in. Sent emails are deleted from the outbox. Emails that fail
+    to send are left in the outbox and retried by the next dispatch until they have been attempted `max_attempts` times
+    (and then deleted by the `xauth_prune_tokens` command).
+
+    :return: `tuple` of the number of (sent, failed) emails.
+    """
+    outbox_model = apps.get_model(AUTH_APP_LABEL, "EmailOutbox")
+    using = router.db_for_write(outbox_model)
+    sent = failed = 0
+    after_pk = 0  # every email is attempted at most once per dispatch
+    with get_connection() as connection:
+        while True:
+            with transaction.atomic(using=using):
+                batch = _claim_outbox_batch(outbox_model, using, after_pk, batch_size, max_attempts)
+                if not batch:
+                    break
+                after_pk = batch[-1].pk
+                done, failures = [], []
+                for outbox in batch:
+                    try:
+                        with translation.override(outbox.language or settings.LANGUAGE_CODE):
+                            message = outbox.user.make_email(outbox.template_name, outbox.context, outbox.subject)
+                        if message is not None:
+                            connection.send_messages([message])
+                    except Exception as error:
+                        logger.exception("Failed to send email %s", outbox.pk)
+                        outbox.attempts += 1
+                        outbox.last_error = repr(error)
+                        failures.append(outbox)
+                    else:
+                        done.append(outbox.pk)
+                outbox_model._default_manager.using(using).filter(pk__in=done).delete()
+                outbox_model._default_manager.using(using).bulk_update(failures, ["attempts", "last_error"])
+                sent, failed = sent + len(done), failed + len(failures)
+    return sent, failed
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from xauth.mail import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = "Render and send the emails (e.g. verification codes) queued in the outbox when `XAUTH_EMAIL_OUTBOX` is set"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Number of emails claimed at a time")
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Number of times an email is attempted before it is left in the outbox for inspection",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Keep dispatching queued emails every `interval` seconds instead of exiting after one dispatch",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = dispatch_outbox(batch_size=options["batch_size"], max_attempts=options["max_attempts"])
+            if sent or failed or options["interval"] is None:
+                self.stdout.write(f"Sent {sent} email(s). {failed} email(s) failed to send.")
+            if options["interval"] is None:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from xently.core.loading import get_class
+
+from xauth.internal_settings import AUTH_APP_LABEL, KEY_RETIREMENT_PERIOD, KEYS_RELOAD_INTERVAL
+
+
+class Command(BaseCommand):
+    help = (
+        "Create new versions of the keys used to sign and encrypt tokens. Tokens issued with the previous versions "
+        "remain valid until the previous versions retire"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--password", help="Password used to encrypt the keys. Defaults to `settings.SECRET_KEY`")
+
+    def handle(self, *args, **options):
+        token_key = get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")(password=options["password"])
+        signing_kid, encryption_kid = token_key.rotate_keys()
+        self.stdout.write(
+            self.style.SUCCESS(f"Created signing key '{signing_kid}' and encryption key '{encryption_kid}'")
+        )
+        if KEYS_RELOAD_INTERVAL is None:
+            self.stdout.write("Running processes start using the new keys after they are restarted.")
+        else:
+            self.stdout.write(f"Running processes start using the new keys within {KEYS_RELOAD_INTERVAL} seconds.")
+        self.stdout.write(f"Previous keys retire after {KEY_RETIREMENT_PERIOD}.")
@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand
+from xently.core.loading import get_class
+
+from xauth.internal_settings import AUTH_APP_LABEL
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the keys used to sign and encrypt tokens, if they do not exist yet, so that (web) workers do not "
+        "create them while serving requests. Run it once per deployment before starting the workers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--password", help="Password used to encrypt the keys. Defaults to `settings.SECRET_KEY`")
+        parser.add_argument(
+            "--all-algorithms",
+            action="store_true",
+            help="Create keys for every supported signing and encryption algorithm instead of the configured ones",
+        )
+        parser.add_argument(
+            "--export",
+            action="store_true",
+            help="Print the keys as the JSON value of the environment variable read by `EnvironmentKeyStore`",
+        )
+
+    def handle(self, *args, **options):
+        token_key_class = get_class(f"{AUTH_APP_LABEL}.token.key", "TokenKey")
+        token_key = token_key_class(password=options["password"])
+        signing_algorithms = [token_key.signing_algorithm]
+        encryption_algorithms = [token_key.encryption_algorithm]
+        if options["all_algorithms"]:
+            signing_algorithms = token_key_class.ALLOWED_SIGNING_ALGORITHMS
+            encryption_algorithms = token_key_class.ALLOWED_ENCRYPTION_ALGORITHMS
+
+        # status is written to stderr when stdout is the exported JSON
+        out = self.stderr if options["export"] else self.stdout
+        keys = {}
+        for algorithm in signing_algorithms:
+            token_key = token_key_class(password=options["password"], signing_algorithm=algorithm)
+            kid = token_key.signing_key_set.active_kid
+            name, _, is_pem = token_key._get_key_spec()
+            keys[(name, is_pem)] = token_key
+            out.write(f"Signing key ({algorithm}): {kid}")
+        for algorithm in encryption_algorithms:
+            token_key = token_key_class(password=options["password"], encryption_algorithm=algorithm)
+            kid = token_key.encryption_key_set.active_kid
+            name, _, is_pem = token_key._get_key_spec(is_encryption=True)
+            keys[(name, is_pem)] = token_key
+            out.write(f"Encryption key ({algorithm}): {kid}")
+        out.write(self.style.SUCCESS(f"Keys are stored by {token_key.key_store.__class__.__name__}"))
+
+        if options["export"]:
+            exported = {}
+            for (name, is_pem), token_key in keys.items():
+                versions = token_key.key_store.read(name, "pem" if is_pem else "json")
+                exported[name] = [
+                    {"kid": kid, "created": created, "data": data.decode()} for kid, data, created in versions
+                ]
+            self.stdout.write(json.dumps(exported))
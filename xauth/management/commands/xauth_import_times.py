@@ -0,0 +1,74 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# imports what a worker imports before it serves its first request
+SCRIPT = """
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+"""
+
+# e.g. "import time:       211 |        539 |   xauth.accounts.token.key"
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+def parse_import_times(output):
+    """
+    Return a `list` of `(module, self, cumulative, depth)` tuples, times in microseconds, from the output of
+    `python -X importtime`.
+    """
+    times = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            times.append((module, int(own), int(cumulative), (len(indent) - 1) // 2))
+    return times
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how long importing xauth's modules takes when a (fresh) process sets Django up and loads the URL "
+        "patterns, as measured by `python -X importtime`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20, help="Number of modules to report")
+        parser.add_argument("--all", action="store_true", help="Report every module instead of xauth's modules")
+        parser.add_argument(
+            "--sort", choices=["self", "cumulative"], default="cumulative", help="Time to order the modules by"
+        )
+
+    def handle(self, *args, **options):
+        # the process imports the project's modules the way this one does
+        environment = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE,
+            "PYTHONPATH": os.pathsep.join(path for path in sys.path if path),
+        }
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", SCRIPT],
+            capture_output=True,
+            text=True,
+            env=environment,
+        )
+        if process.returncode != 0:
+            raise CommandError(f"Failed to import the project:\n{process.stderr}")
+
+        times = parse_import_times(process.stderr)
+        xauth_times = [time for time in times if time[0] == "xauth" or time[0].startswith("xauth.")]
+        total, xauth_total = sum(time[1] for time in times), sum(time[1] for time in xauth_times)
+        if not options["all"]:
+            times = xauth_times
+
+        index = 1 if options["sort"] == "self" else 2
+        self.stdout.write(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+        for module, own, cumulative, _ in sorted(times, key=lambda time: time[index], reverse=True)[: options["limit"]]:
+            self.stdout.write(f"{own / 1000:>10.1f} {cumulative / 1000:>16.1f}  {module}")
+        self.stdout.write(f"xauth's modules: {xauth_total / 1000:.1f}ms of {total / 1000:.1f}ms spent importing")
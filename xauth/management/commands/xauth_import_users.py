@@ -0,0 +1,165 @@
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from xauth.internal_settings import AUTH_APP_LABEL
+
+
+def _hash_passwords(passwords):
+    # runs in the worker processes. `None` passwords are made unusable
+    return [make_password(password) for password in passwords]
+
+
+def _read_rows(file, file_format):
+    if file_format == "csv":
+        yield from csv.DictReader(file)
+    else:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from a CSV (with a header row) or JSON lines file whose columns (or keys) are user fields. "
+        "Passwords are hashed in parallel worker processes and users are inserted in chunks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Path of the file to import users from. Use `-` to read from stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file's extension")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Number of users inserted at a time")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of processes hashing passwords")
+        parser.add_argument(
+            "--hashed-passwords",
+            action="store_true",
+            help="Passwords in the file are already hashed (e.g. by `make_password`) and are stored as is",
+        )
+        parser.add_argument(
+            "--ignore-conflicts", action="store_true", help="Skip users that already exist instead of failing"
+        )
+        parser.add_argument("--create-security", action="store_true", help="Create the users' `Security` rows")
+        parser.add_argument(
+            "--request-verification",
+            action="store_true",
+            help="Issue (and email) verification codes to the imported users that are not verified. "
+            "Implies --create-security",
+        )
+
+    def handle(self, *args, **options):
+        self.user_model = get_user_model()
+        self.options = options
+        file_format = options["format"] or os.path.splitext(options["file"])[1].lstrip(".").lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Specify the --format of the file")
+
+        self.imported = self.skipped = 0
+        self.started_at = time.monotonic()
+        file = (
+            sys.stdin if options["file"] == "-" else open(options["file"], newline="" if file_format == "csv" else None)
+        )
+        try:
+            with ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup) as executor:
+                # chunks are hashed ahead of being inserted, with at most one chunk pending per worker, so that memory
+                # use does not depend on the size of the file
+                pending = deque()
+                for chunk in _chunks(_read_rows(file, file_format), options["chunk_size"]):
+                    pending.append(self.prepare_chunk(chunk, executor))
+                    if len(pending) > options["workers"]:
+                        self.import_chunk(*pending.popleft())
+                while pending:
+                    self.import_chunk(*pending.popleft())
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        elapsed = max(time.monotonic() - self.started_at, 1e-3)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.imported} user(s) in {elapsed:.1f}s ({self.imported / elapsed:.0f} users/s). "
+                f"Skipped {self.skipped} existing user(s)."
+            )
+        )
+
+    def make_user(self, row):
+        values = {}
+        for name, value in row.items():
+            try:
+                field = self.user_model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise CommandError(f"'{name}' is not a field of {self.user_model._meta.label}")
+            if value == "" and (field.null or name == "password"):
+                value = None
+            elif isinstance(field, models.BooleanField) and isinstance(value, str):
+                value = value.strip().lower() in ("1", "t", "true", "y", "yes")
+            values[field.attname] = value if name == "password" else field.to_python(value)
+
+        username_field = self.user_model.USERNAME_FIELD
+        if not values.get(username_field):
+            raise CommandError(f"{username_field} is required")
+        if username_field == self.user_model.get_email_field_name():
+            values[username_field] = self.user_model.objects.normalize_email(values[username_field])
+        else:
+            values[username_field] = self.user_model.normalize_username(values[username_field])
+        return self.user_model(**values)
+
+    def prepare_chunk(self, rows, executor):
+        users = [self.make_user(row) for row in rows]
+        passwords = [user.password or None for user in users]
+        if self.options["hashed_passwords"]:
+            for user, password in zip(users, passwords):
+                user.password = password or make_password(None)
+            return users, None
+        return users, executor.submit(_hash_passwords, passwords)
+
+    def import_chunk(self, users, hashed_passwords):
+        if hashed_passwords is not None:
+            for user, password in zip(users, hashed_passwords.result()):
+                user.password = password
+
+        lookup = {f"{self.user_model.USERNAME_FIELD}__in": [user.get_username() for user in users]}
+        with transaction.atomic():
+            # primary keys are not set by all databases nor, for users that already existed. The users found before
+            # the insert tell the users that were created from the ones that were skipped. Passwords cannot: hashes
+            # re-imported with `--hashed-passwords` match the stored ones
+            existing = set(
+                self.user_model.objects.filter(**lookup).values_list(self.user_model.USERNAME_FIELD, flat=True)
+            )
+            self.user_model.objects.bulk_create(users, ignore_conflicts=self.options["ignore_conflicts"])
+            created = [user for user in self.user_model.objects.filter(**lookup) if user.get_username() not in existing]
+            if self.options["create_security"] or self.options["request_verification"]:
+                self.create_security(created)
+
+        self.imported += len(created)
+        self.skipped += len(users) - len(created)
+        elapsed = max(time.monotonic() - self.started_at, 1e-3)
+        self.stderr.write(f"Imported {self.imported} user(s) ({self.imported / elapsed:.0f} users/s)")
+
+    def create_security(self, users):
+        codes = {}
+        if self.options["request_verification"]:
+            codes = self.user_model.request_verification_codes(users, send_email=True)
+        security_model = apps.get_model(AUTH_APP_LABEL, "Security")
+        # users created by a concurrent import could have a security already
+        security_model.objects.bulk_create(
+            [security_model(user_id=user.pk) for user in users if user not in codes], ignore_conflicts=True
+        )
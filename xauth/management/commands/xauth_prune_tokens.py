@@ -0,0 +1,16 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from xauth.internal_settings import AUTH_APP_LABEL
+
+
+class Command(BaseCommand):
+    help = "Delete the expired revoked tokens, refresh tokens and the outbox's emails holding expired secrets"
+
+    def handle(self, *args, **options):
+        revoked = apps.get_model(AUTH_APP_LABEL, "RevokedToken").objects.prune()
+        refresh = apps.get_model(AUTH_APP_LABEL, "RefreshToken").objects.prune()
+        emails = apps.get_model(AUTH_APP_LABEL, "EmailOutbox").objects.prune()
+        self.stdout.write(
+            f"Deleted {revoked} revoked token(s), {refresh} refresh token(s) and {emails} undelivered email(s)."
+        )
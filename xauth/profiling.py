@@ -0,0 +1,172 @@
+import functools
+import io
+import marshal
+import os
+import random
+import threading
+from collections import Counter
+from pathlib import Path
+
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, Http404
+from django.utils.crypto import constant_time_compare
+
+from xauth.internal_settings import PROFILING
+
+__all__ = ["RequestProfiler", "request_profiler", "ProfiledViewMixin", "profile_view", "profiles_view"]
+
+
+class RequestProfiler:
+    """
+    Profiles (with `cProfile`) a sample of requests and aggregates the profiles per key e.g. per view action.
+
+    A request is profiled with a probability of `sample_rate` or, when `secret` is set, if its `header` (a
+    `request.META` key) holds the `secret`. Requests that are not profiled only pay for these checks.
+
+    Aggregated profiles are written (in the `pstats` format) to `output_dir` as `<key>.<pid>.prof` after every
+    profiled request, and are served by `profiles_view`.
+    """
+
+    def __init__(self, sample_rate=0.0, header="HTTP_X_XAUTH_PROFILE", secret=None, output_dir=None):
+        self.sample_rate = sample_rate
+        self.header = header
+        self.secret = secret
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._counts = Counter()
+
+    @property
+    def enabled(self):
+        return bool(self.sample_rate or self.secret)
+
+    def should_profile(self, request):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.secret:
+            value = request.META.get(self.header)
+            return value is not None and constant_time_compare(value, self.secret)
+        return False
+
+    def profile(self, key, func, *args, **kwargs):
+        """Return `func(*args, **kwargs)`, adding its profile to the profiles of `key`"""
+        # the profiler's modules are only imported (at a cost to start up) once a request is profiled
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in this thread
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.add(key, profile)
+
+    def add(self, key, profile):
+        import pstats
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._counts[key] += 1
+        if self.output_dir:
+            self.dump(key, self.output_dir)
+
+    def dumps(self, key):
+        """Return the aggregated profile of `key` in the `pstats` (file) format or `None` if there is none"""
+        with self._lock:
+            stats = self._stats.get(key)
+            return None if stats is None else marshal.dumps(stats.stats)
+
+    def dump(self, key, directory):
+        """Write the aggregated profile of `key` to `directory`. Return the path of the file"""
+        path = Path(directory) / f"{key}.{os.getpid()}.prof"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(self.dumps(key))
+        return path
+
+    def get_stats(self, key):
+        """Return the aggregated `pstats.Stats` of `key` or `None` if none of its requests was profiled"""
+        return self._stats.get(key)
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+            self._counts.clear()
+
+    @property
+    def stats(self):
+        """`dict` of keys mapped to the number of requests profiled"""
+        with self._lock:
+            return dict(self._counts)
+
+
+request_profiler = RequestProfiler(
+    sample_rate=PROFILING["SAMPLE_RATE"],
+    header=PROFILING["HEADER"],
+    secret=PROFILING["SECRET"],
+    output_dir=PROFILING["OUTPUT_DIR"],
+)
+
+
+class ProfiledViewMixin:
+    """Profiles the requests (of a viewset) sampled by `request_profiler`, keyed by `<basename>.<action>`"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not (request_profiler.enabled and request_profiler.should_profile(request)):
+            return super().dispatch(request, *args, **kwargs)
+        # `self.action` is only set once the request is being dispatched
+        action_map = getattr(self, "action_map", None) or {}
+        action = action_map.get(request.method.lower(), request.method.lower())
+        key = f"{getattr(self, 'basename', None) or self.__class__.__name__}.{action}"
+        return request_profiler.profile(key, super().dispatch, request, *args, **kwargs)
+
+
+def profile_view(view_func=None, key=None):
+    """Decorator that profiles the requests of a (function) view sampled by `request_profiler`"""
+    if view_func is None:
+        return functools.partial(profile_view, key=key)
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request_profiler.enabled and request_profiler.should_profile(request):
+            return request_profiler.profile(key or view_func.__name__, view_func, request, *args, **kwargs)
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+def profiles_view(request):
+    """
+    Superuser-only view of the aggregated profiles. Lists the profiled keys or, with a `key` query parameter, returns
+    the key's profile as text (sorted by cumulative time) or, with `format=pstats`, as a `pstats` file loadable by
+    `pstats.Stats(...)` or tools like snakeviz. The view is not routed by `xauth.urls`.
+    """
+    if not (request.user.is_authenticated and request.user.is_superuser):
+        raise PermissionDenied
+    key = request.GET.get("key")
+    if key is None:
+        lines = [f"{key} {count}" for key, count in sorted(request_profiler.stats.items())]
+        return HttpResponse("".join(f"{line}\n" for line in lines), content_type="text/plain")
+
+    import pstats
+
+    data = request_profiler.dumps(key)
+    if data is None:
+        raise Http404
+    if request.GET.get("format") == "pstats":
+        response = HttpResponse(data, content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="{key}.prof"'
+        return response
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    stats.stats = marshal.loads(data)
+    stats.get_top_level_stats()
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+    return HttpResponse(stream.getvalue(), content_type="text/plain")
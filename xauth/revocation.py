@@ -0,0 +1,146 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+from xauth.internal_settings import (
+    AUTH_APP_LABEL,
+    TOKEN_DENYLIST_CAPACITY,
+    TOKEN_DENYLIST_FALSE_POSITIVE_RATE,
+    TOKEN_DENYLIST_SYNC_INTERVAL,
+)
+
+__all__ = ["BloomFilter", "TokenDenylist", "token_denylist"]
+
+
+class BloomFilter:
+    """
+    Set of strings that answers membership with false positives (at most at `false_positive_rate` while it holds up
+    to `capacity` items) but no false negatives, in `-capacity * ln(false_positive_rate) / ln(2)²` bits e.g. about
+    1.8KB per thousand items at a 0.1% rate. Items cannot be removed.
+    """
+
+    def __init__(self, capacity, false_positive_rate):
+        self.capacity = max(capacity, 1)
+        self.false_positive_rate = false_positive_rate
+        self.size = math.ceil(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, item):
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    def _indexes(self, item):
+        # the `hash_count` bit indexes are derived from (the two halves of) a single digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for index in self._indexes(item):
+            self._bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+
+class TokenDenylist:
+    """
+    Tokens revoked (e.g. on sign out) until they expire. Revoked tokens are stored in the `RevokedToken` table and
+    mirrored by an in-process `BloomFilter` so that tokens that were not revoked are, but for the filter's false
+    positives, told apart without a database query.
+
+    At most every `sync_interval` seconds, the filter reads the rows added (by any process) since its last read. Tokens
+    revoked by other processes are therefore accepted for up to `sync_interval` seconds. `None` only reads the table
+    once. The filter is rebuilt from the unexpired tokens, with room for twice as many, once it holds more tokens than
+    it was sized for.
+    """
+
+    def __init__(self, capacity, false_positive_rate, sync_interval=None):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._filter = None
+        self._last_pk = 0
+        self._synced_at = None
+
+    @property
+    def model(self):
+        return apps.get_model(AUTH_APP_LABEL, "RevokedToken")
+
+    def _needs_sync(self):
+        if self._filter is None:
+            return True
+        return self.sync_interval is not None and time.monotonic() - self._synced_at >= self.sync_interval
+
+    def sync(self):
+        """Add the tokens revoked since the last `sync()` to the filter, rebuilding the filter if it is full"""
+        with self._lock:
+            manager = self.model._default_manager
+            if self._filter is None or len(self._filter) > self._filter.capacity:
+                rows = list(manager.filter(expires_at__gt=timezone.now()).order_by("pk").values_list("pk", "jti"))
+                bloom_filter = BloomFilter(max(self.capacity, 2 * len(rows)), self.false_positive_rate)
+            else:
+                rows = list(manager.filter(pk__gt=self._last_pk).order_by("pk").values_list("pk", "jti"))
+                bloom_filter = self._filter
+            for pk, jti in rows:
+                bloom_filter.add(jti)
+            if rows:
+                self._last_pk = max(self._last_pk, rows[-1][0])
+            self._filter = bloom_filter
+            self._synced_at = time.monotonic()
+
+    def is_revoked(self, jti):
+        if self._needs_sync():
+            self.sync()
+        if jti not in self._filter:
+            return False
+        return self.model._default_manager.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti):
+        """Async `is_revoked(...)`. The database is only queried (outside the event loop) when the filter is unsure"""
+        if self._needs_sync() or jti in self._filter:
+            return await sync_to_async(self.is_revoked)(jti)
+        return False
+
+    def revoke(self, jti, expires_at):
+        """
+        :param jti: the token's `jti` claim.
+        :param expires_at: the token's `exp` claim (unix time) after which the token is no longer denylisted.
+        """
+        expires_at = datetime.fromtimestamp(expires_at, tz=dt_timezone.utc)
+        if not settings.USE_TZ:
+            expires_at = timezone.make_naive(expires_at)
+        self.model._default_manager.revoke(jti, expires_at)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def clear(self):
+        """Discard the filter. It is rebuilt from the table on the next look-up"""
+        with self._lock:
+            self._filter = None
+            self._last_pk = 0
+
+    @property
+    def stats(self):
+        bloom_filter = self._filter
+        return {
+            "size": 0 if bloom_filter is None else len(bloom_filter),
+            "capacity": 0 if bloom_filter is None else bloom_filter.capacity,
+            "bits": 0 if bloom_filter is None else bloom_filter.size,
+        }
+
+
+token_denylist = TokenDenylist(
+    TOKEN_DENYLIST_CAPACITY, TOKEN_DENYLIST_FALSE_POSITIVE_RATE, sync_interval=TOKEN_DENYLIST_SYNC_INTERVAL
+)
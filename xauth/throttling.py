@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from hashlib import sha256
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework import throttling
+
+from xauth.internal_settings import THROTTLE_RATES, THROTTLE_CACHE
+
+__all__ = [
+    "CounterRateThrottle",
+    "VerificationCodeUserRateThrottle",
+    "VerificationCodeIPRateThrottle",
+    "TemporaryPasswordLookupRateThrottle",
+    "TemporaryPasswordIPRateThrottle",
+    "VerificationAttemptRateThrottle",
+    "PasswordResetAttemptRateThrottle",
+    "throttle_stats",
+]
+
+logger = logging.getLogger(__name__)
+
+
+class ThrottleStats:
+    """Number of requests allowed and throttled per throttle scope (in this process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: {"allowed": 0, "throttled": 0})
+
+    def record(self, scope, allowed):
+        with self._lock:
+            self._counts[scope]["allowed" if allowed else "throttled"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {scope: dict(counts) for scope, counts in self._counts.items()}
+
+
+throttle_stats = ThrottleStats()
+
+
+class CounterRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Fixed-window throttle that counts requests with atomic cache increments (`cache.add` then `cache.incr`) instead of
+    DRF's read-modify-write request history, so that concurrent requests cannot slip past the limit. Use a cache with
+    atomic increments e.g. local memory, Memcached or Redis.
+
+    The rate of the throttle's `scope` is read from `XAUTH_THROTTLE_RATES`. A `None` rate disables the throttle.
+    """
+
+    cache_format = "xauth:throttle:%(scope)s:%(ident)s"
+
+    @property
+    def cache(self):
+        return caches[THROTTLE_CACHE]
+
+    def get_rate(self):
+        return THROTTLE_RATES.get(self.scope)
+
+    def get_ident_for(self, request, view):
+        """Return what requests are counted by e.g. the client's IP address or `None` to not throttle the request"""
+        raise NotImplementedError
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_for(request, view)
+        if ident is None:
+            return None
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        now = time.time()
+        window = int(now // self.duration)
+        key = f"{key}:{window}"
+        self.wait_seconds = (window + 1) * self.duration - now
+        self.cache.add(key, 0, timeout=self.duration)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # the key expired between `add` and `incr`
+            self.cache.add(key, 1, timeout=self.duration)
+            count = 1
+
+        allowed = count <= self.num_requests
+        throttle_stats.record(self.scope, allowed)
+        if not allowed:
+            logger.info("Request throttled by '%s'", self.scope)
+        return allowed
+
+    def wait(self):
+        return getattr(self, "wait_seconds", None)
+
+
+class VerificationCodeUserRateThrottle(CounterRateThrottle):
+    """Limits the verification codes requested for a user (looked up from the URL)"""
+
+    scope = "verification_code_user"
+
+    def get_ident_for(self, request, view):
+        return view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+
+
+class VerificationCodeIPRateThrottle(CounterRateThrottle):
+    """Limits the verification codes requested from an IP address"""
+
+    scope = "verification_code_ip"
+
+    def get_ident_for(self, request, view):
+        return self.get_ident(request)
+
+
+class TemporaryPasswordLookupRateThrottle(CounterRateThrottle):
+    """Limits the temporary passwords requested with the same (case-insensitive) password reset lookup field values"""
+
+    scope = "temporary_password_lookup"
+
+    def get_ident_for(self, request, view):
+        values = [str(request.data.get(field, "")).strip().lower() for field in self.get_lookup_fields()]
+        if not any(values):
+            return None
+        # cache keys are limited in length and characters
+        return sha256(":".join(values).encode()).hexdigest()
+
+    def get_lookup_fields(self):
+        return sorted(get_user_model().get_password_reset_lookup_fields())
+
+
+class TemporaryPasswordIPRateThrottle(CounterRateThrottle):
+    """Limits the temporary passwords requested from an IP address"""
+
+    scope = "temporary_password_ip"
+
+    def get_ident_for(self, request, view):
+        return self.get_ident(request)
+
+
+class VerificationAttemptRateThrottle(CounterRateThrottle):
+    """Limits the attempts to verify a user (looked up from the URL) i.e. to guess the user's verification code"""
+
+    scope = "verification_attempt"
+
+    def get_ident_for(self, request, view):
+        return view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+
+
+class PasswordResetAttemptRateThrottle(CounterRateThrottle):
+    """Limits the attempts to reset the password of a user (looked up from the URL) e.g. with a temporary password"""
+
+    scope = "password_reset_attempt"
+
+    def get_ident_for(self, request, view):
+        return view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
@@ -0,0 +1,64 @@
+import logging
+import time
+
+from django.apps import apps
+from django.urls import get_resolver
+from xently.core.loading import get_class
+
+from xauth.internal_settings import AUTH_APP_LABEL
+
+__all__ = ["warmup", "get_wsgi_application", "get_asgi_application"]
+
+logger = logging.getLogger(__name__)
+
+
+def warmup():
+    """
+    Do the one-off work of the first authenticated request ahead of it: load (or create) the signing and encryption
+    keys, issue and verify a token, resolve the classes loaded with `get_class(...)` and populate the URL resolvers.
+
+    Called by `get_wsgi_application()` and `get_asgi_application()` when `XAUTH_WARMUP` is set, or e.g. from a
+    worker's post-fork hook. It is not called when apps are ready since management commands (e.g. `migrate`, which
+    might have to create the tables of the key store first) and test runners load apps too. Keys are best created
+    beforehand with the `xauth_generate_keys` command.
+    """
+    started_at = time.perf_counter()
+    token = get_class(f"{AUTH_APP_LABEL}.token.generator", "Token")({"warmup": True})
+    token.get_claims()  # the (encrypted or not) token verified as set by `XAUTH_VERIFY_ENCRYPTED_TOKEN`
+
+    if apps.is_installed("django.contrib.admin"):
+        # URL patterns of the admin site are only complete once every `admin` module was imported
+        from django.contrib import admin
+
+        admin.autodiscover()
+    get_resolver().reverse_dict  # populates the resolver
+
+    from xauth.authentication import JWTAuthentication
+
+    JWTAuthentication.get_token_subject_url_names()
+    logger.info("xauth warmed up in %.3fs", time.perf_counter() - started_at)
+
+
+def _warmup_if_enabled():
+    from xauth.internal_settings import WARMUP
+
+    if WARMUP:
+        warmup()
+
+
+def get_wsgi_application():
+    """`django.core.wsgi.get_wsgi_application()` that is warmed up (if `XAUTH_WARMUP` is set). Use it in `wsgi.py`"""
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    _warmup_if_enabled()
+    return application
+
+
+def get_asgi_application():
+    """`django.core.asgi.get_asgi_application()` that is warmed up (if `XAUTH_WARMUP` is set). Use it in `asgi.py`"""
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    _warmup_if_enabled()
+    return application